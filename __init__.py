@@ -1,46 +1,132 @@
 from __future__ import annotations
 import os
 import sys
-import subprocess
 import time
+from typing import TYPE_CHECKING
 
 sys.path.append(os.path.dirname(os.path.realpath(__file__)))
 
-from decompileAll import decompileAll
-from mrbParser import RiteFile
-from mrbToRb.mrbToRb import mrbToRb
+from budget import Budget
+from compiler import compileFile, compileSource
+from diagnostics import DiagnosticsCollector
 
-def decompileFile(file: str, outFile: str|None = None):
+# the decompiler (parser, mrbToRb, profiling) is only imported once a file is decompiled, compiling only needs compiler.py
+# (see benchmarks/benchImportTime.py)
+if TYPE_CHECKING:
+    from profiling import Profiler
+
+LAZY_EXPORTS = {
+    "decompileAll": "decompileAll",
+    "decompileBytes": "decompiler",
+    "decompileDefinition": "decompiler",
+    "decompileToSink": "decompiler",
+    "decompileMany": "decompiler",
+    "decompileToCodeGen": "decompiler",
+}
+
+def __getattr__(name: str):
+    if name in LAZY_EXPORTS:
+        module = __import__(LAZY_EXPORTS[name])
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def decompileFile(file: str, outFile: str|None = None, profiler: Profiler|None = None, diagnostics: DiagnosticsCollector|None = None,
+                  budget: Budget|None = None):
+    """With a budget, a file that runs out of it is written as a disassembly listing (see decompileWithBudget())"""
+    if diagnostics is not None:
+        with diagnostics.file(file):
+            _profileFile(file, outFile, profiler, budget)
+    else:
+        _profileFile(file, outFile, profiler, budget)
+
+def _profileFile(file: str, outFile: str|None, profiler: Profiler|None, budget: Budget|None):
+    if profiler is not None:
+        with profiler.profileFile(file):
+            _decompileFile(file, outFile, budget)
+    else:
+        _decompileFile(file, outFile, budget)
+
+def _decompileFile(file: str, outFile: str|None, budget: Budget|None):
+    from decompiler import decompileToCodeGen, decompileWithBudget
+    from profiling import profileStage
+    from utils import ENCODING
+    with profileStage("read"):
+        with open(file, "rb") as f:
+            data = f.read()
+    if budget is not None:
+        code = decompileWithBudget(data, budget)
+    else:
+        codesRes = decompileToCodeGen(data)
+        with profileStage("render"):
+            code = codesRes.toStr()
+    with profileStage("write"):
+        with open(outFile or f"{file}.rb", "wb") as f:
+            f.write(code.encode(ENCODING, "ignore"))
+
+def printDefinition(file: str, qualifiedName: str):
+    from decompiler import decompileDefinition
     with open(file, "rb") as f:
-        riteFile = RiteFile(f)
-        codesRes = mrbToRb(riteFile)
-        # print(codesRes.toStr())
-    with open(outFile or f"{file}.rb", "wb") as f:
-        f.write(codesRes.toStr().encode("utf-8", "ignore"))
-
-def compileFile(file: str, outFile: str|None = None):
-    WIN_BIN = "bins\\windows\\mrbc.exe"
-    LINUX_BIN = "bins/linux/mrbc.exe"
-    curDir = os.path.dirname(os.path.realpath(__file__))
-    binAbs = os.path.join(curDir, WIN_BIN if os.name == "nt" else LINUX_BIN)
-    outFile = outFile or file + ".mrb"
-    cmd = f"\"{binAbs}\" -o \"{outFile}\" \"{file}\""
-    subprocess.call(cmd)
+        data = f.read()
+    print(decompileDefinition(data, qualifiedName))
+
+def getOption(name: str) -> str|None:
+    """Value of a `--name=value` command line option"""
+    for arg in sys.argv[1:]:
+        if arg.startswith(f"{name}="):
+            return arg[len(name) + 1:]
+    return None
 
 if __name__ == "__main__":
     mrbFiles = [f for f in sys.argv[1:] if os.path.exists(f)]
     t1 = time.time()
 
+    profiler: Profiler|None = None
+    printProfile = "--profile" in sys.argv
+    printOpStats = "--opStats" in sys.argv or getOption("--opStatsOut") is not None
+    if printProfile or printOpStats:
+        from profiling import Profiler
+        profiler = Profiler(
+            traceAllocations="--profileAllocations" in sys.argv,
+            cProfileTopN=int(getOption("--profileSlowest") or 0),
+            countOps=printOpStats,
+        )
+
+    # --quiet only prints the summary, --diagnosticsOut=file.jsonl writes every diagnostic as a JSON line
+    diagnostics = DiagnosticsCollector(echo="--quiet" not in sys.argv)
+    # per file limits of folder and single file runs, files that exceed them get a disassembly listing instead
+    timeBudget = getOption("--timeBudget")
+    memoryBudget = getOption("--memoryBudget")
+    budget: Budget|None = None
+    if timeBudget is not None or memoryBudget is not None:
+        budget = Budget(float(timeBudget) if timeBudget else None, int(float(memoryBudget) * 1024 * 1024) if memoryBudget else None)
+    # folder runs in parallel, --threads uses a thread pool instead of worker processes
+    workers = int(getOption("--workers") or 0)
+    threads = "--threads" in sys.argv
+    # --pipeline reads and writes the files of folder runs on their own threads, while files are decompiled
+    pipelined = "--pipeline" in sys.argv
+    readers = int(getOption("--readers") or 4)
+
+    definition = getOption("--definition")
     if "--decompileAll" in sys.argv:
-        decompileAll(mrbFiles[0])
+        from decompileAll import decompileAll
+        decompileAll(mrbFiles[0], profiler=profiler, diagnostics=diagnostics, budget=budget, workers=workers, threads=threads,
+                     pipelined=pipelined, readers=readers)
+    elif definition is not None:
+        if budget is not None:
+            print("--timeBudget and --memoryBudget don't apply to --definition, it only decompiles one definition")
+        for file in mrbFiles:
+            print(f"# {file}: {definition}")
+            printDefinition(file, definition)
     else:
         for file in mrbFiles:
             if os.path.isdir(file):
                 print(f"Decompiling all files in {file}")
-                decompileAll(file)
+                from decompileAll import decompileAll
+                decompileAll(file, profiler=profiler, diagnostics=diagnostics, budget=budget, workers=workers, threads=threads,
+                             pipelined=pipelined, readers=readers)
             elif file.endswith(".mrb") or file.endswith("_scp.bin"):
                 print(f"Decompiling {file}")
-                decompileFile(file)
+                decompileFile(file, profiler=profiler, diagnostics=diagnostics, budget=budget)
             elif file.endswith(".rb"):
                 print(f"Compiling {file}")
                 compileFile(file)
@@ -48,7 +134,37 @@ if __name__ == "__main__":
                 print(f"Unknown file type: {file}")
 
     tD = time.time() - t1
+    if diagnostics.files:
+        print(diagnostics.summaryText())
+    diagnosticsOut = getOption("--diagnosticsOut")
+    if diagnosticsOut:
+        diagnostics.writeJsonLines(diagnosticsOut)
+        print(f"Diagnostics written to {diagnosticsOut}")
     if tD < 0.5:
         print(f"Time: {(tD*1000):.1f}ms")
     else:
         print(f"Time: {tD:.1f}s")
+
+    if profiler is not None and printProfile:
+        profileOut = getOption("--profileOut")
+        if profileOut:
+            profiler.writeJson(profileOut)
+            print(f"Profile written to {profileOut}")
+        else:
+            import json
+            summary = profiler.summary()
+            del summary["files"]
+            summary.pop("opStats", None)
+            print(json.dumps(summary, indent=2))
+        if profiler.options.cProfileTopN > 0:
+            for statsFile in profiler.dumpSlowestStats(getOption("--profileStatsDir") or "profiles"):
+                print(f"cProfile stats written to {statsFile}")
+    if profiler is not None and profiler.opStats is not None:
+        opStatsOut = getOption("--opStatsOut")
+        if opStatsOut:
+            import json
+            with open(opStatsOut, "w", encoding="utf-8") as f:
+                json.dump(profiler.opStats.toJson(), f, indent=2)
+            print(f"Opcode stats written to {opStatsOut}")
+        else:
+            print(profiler.opStats.toTable())
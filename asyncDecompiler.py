@@ -0,0 +1,133 @@
+"""
+asyncio counterparts of the decompiler and compiler entry points.
+
+The decompiler work runs in an executor (by default the loop's thread pool, the decompiler is reentrant), so the event
+loop stays responsive. mrbc runs with asyncio.create_subprocess_exec. Cancelling a task cancels the work that hasn't
+started yet and kills a running mrbc, a file that is already being decompiled finishes in the background.
+"""
+from __future__ import annotations
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Iterable, List, Set, Tuple, Union
+
+from budget import Budget
+from compiler import getCompileCommand
+from decompiler import BytesLike, DecompileResult, _decompileItem, decompileWithBudget
+from diagnostics import Diagnostic, DiagnosticsCollector
+from profiling import FileProfile, Profiler
+from utils import ENCODING
+
+Items = Union[Iterable[Tuple[str, BytesLike]], AsyncIterable[Tuple[str, BytesLike]]]
+
+def _runInExecutor(executor: Executor|None, func: Callable, *args) -> asyncio.Future:
+    """Threads get a copy of the caller's context (settings like superinstructionsEnabled), processes pickled bytes"""
+    loop = asyncio.get_running_loop()
+    if isinstance(executor, ProcessPoolExecutor):
+        args = tuple(arg.tobytes() if isinstance(arg, memoryview) else arg for arg in args)
+        return loop.run_in_executor(executor, func, *args)
+    return loop.run_in_executor(executor, functools.partial(contextvars.copy_context().run, func, *args))
+
+async def decompileBytesAsync(data: BytesLike, executor: Executor|None = None, budget: Budget|None = None) -> str:
+    """decompileBytes() (decompileWithBudget() with a budget) in an executor"""
+    return await _runInExecutor(executor, decompileWithBudget, data, budget)
+
+def _decompileFile(file: str, outFile: str|None, budget: Budget|None) -> str:
+    with open(file, "rb") as f:
+        data = f.read()
+    code = decompileWithBudget(data, budget)
+    outFile = outFile or f"{file}.rb"
+    with open(outFile, "wb") as f:
+        f.write(code.encode(ENCODING, "ignore"))
+    return outFile
+
+async def decompileFileAsync(file: str, outFile: str|None = None, executor: Executor|None = None, budget: Budget|None = None) -> str:
+    """Reads, decompiles and writes a file in an executor, returns the path of the ruby file"""
+    return await _runInExecutor(executor, _decompileFile, file, outFile, budget)
+
+async def decompileManyAsync(items: Items, concurrency: int = 4, executor: Executor|None = None, profiler: Profiler|None = None,
+                             diagnostics: DiagnosticsCollector|None = None, budget: Budget|None = None) -> AsyncIterator[Tuple[str, DecompileResult]]:
+    """
+    Decompiles (name, bytes) pairs from a normal or async iterable and yields (name, source | exception) in the order
+    they complete. At most `concurrency` files are in flight, the input is only consumed as fast as results are taken.
+    Profiles and diagnostics are collected like with decompileMany(). Closing the generator (or cancelling the task
+    that iterates it) cancels every file that hasn't started yet.
+    """
+    profileOptions = profiler.options if profiler is not None else None
+    collectDiagnostics = diagnostics is not None
+    asyncItems = hasattr(items, "__aiter__")
+    iterator: Any = items.__aiter__() if asyncItems else iter(items)
+    pending: Set[asyncio.Future] = set()
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) < max(concurrency, 1):
+                try:
+                    name, data = await iterator.__anext__() if asyncItems else next(iterator)
+                except (StopIteration, StopAsyncIteration):
+                    exhausted = True
+                    break
+                pending.add(_runInExecutor(executor, _decompileItem, name, data, profileOptions, collectDiagnostics, budget))
+            if not pending:
+                return
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                itemResult: Tuple[str, DecompileResult, FileProfile|None, List[Diagnostic]|None] = future.result()
+                name, result, profile, fileDiagnostics = itemResult
+                if profile is not None:
+                    profiler.addProfile(profile)
+                if fileDiagnostics is not None:
+                    diagnostics.addFile(name, fileDiagnostics)
+                yield name, result
+    finally:
+        for future in pending:
+            future.cancel()
+
+async def compileFileAsync(file: str, outFile: str|None = None) -> int:
+    """compileFile() without blocking the loop. Returns mrbc's exit code."""
+    outFile = outFile or file + ".mrb"
+    process = await _startProcess(getCompileCommand(file, outFile))
+    return await _waitOrKill(process)
+
+async def compileSourceAsync(source: str) -> bytes:
+    """compileSource() without blocking the loop"""
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmpDir:
+        rbFile = os.path.join(tmpDir, "source.rb")
+        mrbFile = os.path.join(tmpDir, "source.mrb")
+        # small files, writing and reading them doesn't need an executor
+        with open(rbFile, "w", encoding="utf-8") as f:
+            f.write(source)
+        process = await _startProcess(getCompileCommand(rbFile, mrbFile), stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        try:
+            stdout, stderr = await process.communicate()
+        except asyncio.CancelledError:
+            await _kill(process)
+            raise
+        if process.returncode != 0:
+            raise Exception(f"mrbc failed ({process.returncode}): {stdout.decode(errors='replace')}{stderr.decode(errors='replace')}")
+        with open(mrbFile, "rb") as f:
+            return f.read()
+
+async def _startProcess(command: List[str], **kwargs) -> asyncio.subprocess.Process:
+    """create_subprocess_exec() that doesn't leave the process running if it gets cancelled while starting it"""
+    starting = asyncio.ensure_future(asyncio.create_subprocess_exec(*command, **kwargs))
+    try:
+        return await asyncio.shield(starting)
+    except asyncio.CancelledError:
+        await _kill(await starting)
+        raise
+
+async def _waitOrKill(process: asyncio.subprocess.Process) -> int:
+    try:
+        return await process.wait()
+    except asyncio.CancelledError:
+        await _kill(process)
+        raise
+
+async def _kill(process: asyncio.subprocess.Process) -> None:
+    if process.returncode is None:
+        process.kill()
+        await process.wait()
@@ -0,0 +1,138 @@
+"""
+Decompiler benchmark on synthetic workloads (see workloads.py).
+
+Every workload is compiled with the bundled mrbc and then parsed, decompiled and rendered separately.
+Results can be stored as a baseline, later runs are compared against it and regressions beyond
+a threshold make the script exit with code 1.
+
+python benchmarks/benchDecompile.py [--scale 2] [--only nestedIf,caseWhen] [--saveBaseline]
+"""
+from __future__ import annotations
+import argparse
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Dict, List
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+from compiler import compileSource
+from mrbParser import RiteFile, RiteIrepSection
+from mrbToRb.mrbToRb import mrbToRb
+from workloads import DEFAULT_SIZES, WORKLOADS
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "baseline.json")
+
+def countInstructions(irep: RiteIrepSection) -> int:
+    count = 0
+    stack = [irep]
+    while stack:
+        cur = stack.pop()
+        count += cur.iLen
+        stack.extend(cur.childIreps)
+    return count
+
+def timeStages(data: bytes) -> Dict[str, float]:
+    t1 = time.perf_counter()
+    riteFile = RiteFile(io.BytesIO(data))
+    t2 = time.perf_counter()
+    codeGen = mrbToRb(riteFile)
+    t3 = time.perf_counter()
+    codeGen.toStr()
+    t4 = time.perf_counter()
+    return {
+        "parse": t2 - t1,
+        "decompile": t3 - t2,
+        "render": t4 - t3,
+    }
+
+def peakMemory(data: bytes) -> int:
+    tracemalloc.start()
+    try:
+        riteFile = RiteFile(io.BytesIO(data))
+        mrbToRb(riteFile).toStr()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def runWorkload(name: str, size: int, repeat: int) -> Dict:
+    data = compileSource(WORKLOADS[name](size))
+    instructions = countInstructions(RiteFile(io.BytesIO(data)).irepBlock.section)
+    # each stage gets its best time over all repetitions
+    best: Dict[str, float] = {}
+    for _ in range(repeat):
+        for stageName, seconds in timeStages(data).items():
+            best[stageName] = min(best.get(stageName, seconds), seconds)
+    total = sum(best.values())
+    return {
+        "size": size,
+        "bytes": len(data),
+        "instructions": instructions,
+        "stages": best,
+        "total": total,
+        "instructionsPerSecond": instructions / total if total > 0 else 0,
+        "peakMemory": peakMemory(data),
+    }
+
+def compareToBaseline(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None or base["size"] != result["size"]:
+            continue
+        for key in ["parse", "decompile", "render"]:
+            if result["stages"][key] > base["stages"][key] * (1 + threshold):
+                regressions.append(f"{name}.{key}: {base['stages'][key]*1000:.2f}ms -> {result['stages'][key]*1000:.2f}ms")
+        if result["peakMemory"] > base["peakMemory"] * (1 + threshold):
+            regressions.append(f"{name}.peakMemory: {base['peakMemory']/1024:.0f}KB -> {result['peakMemory']/1024:.0f}KB")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the decompiler on synthetic workloads")
+    parser.add_argument("--only", help="comma separated list of workloads", default=",".join(WORKLOADS.keys()))
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier for the default workload sizes")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--saveBaseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative slowdown that counts as a regression")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results: Dict[str, Dict] = {}
+    print(f"{'workload':<20}{'size':>6}{'instr':>9}{'parse ms':>10}{'decomp ms':>11}{'render ms':>11}{'instr/s':>11}{'peak KB':>10}")
+    for name in args.only.split(","):
+        size = max(1, int(DEFAULT_SIZES[name] * args.scale))
+        result = runWorkload(name, size, args.repeat)
+        results[name] = result
+        stages = result["stages"]
+        print(f"{name:<20}{size:>6}{result['instructions']:>9}{stages['parse']*1000:>10.2f}{stages['decompile']*1000:>11.2f}"
+              f"{stages['render']*1000:>11.2f}{result['instructionsPerSecond']:>11.0f}{result['peakMemory']/1024:>10.0f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    exitCode = 0
+    if os.path.exists(args.baseline) and not args.saveBaseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compareToBaseline(results, baseline, args.threshold)
+        if regressions:
+            print(f"\nRegressions (> {args.threshold*100:.0f}% slower than baseline):")
+            for regression in regressions:
+                print(f"  {regression}")
+            exitCode = 1
+        else:
+            print("\nNo regressions compared to baseline")
+    if args.saveBaseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+    sys.exit(exitCode)
+
+if __name__ == "__main__":
+    main()
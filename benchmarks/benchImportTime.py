@@ -0,0 +1,129 @@
+"""
+Import time benchmark of the compile, decompile and analysis paths, measured with `python -X importtime`.
+
+Every path is imported in a fresh interpreter (best of --repeat runs, after one run that writes the bytecode caches).
+Each path also lists modules it must not pull in, for example compiling doesn't need the decompiler and decompiling
+doesn't need numpy. Such an import, or a path that got slower than the baseline by more than the threshold, makes
+the script exit with code 1.
+
+python benchmarks/benchImportTime.py [--only compile,decompile] [--repeat 5] [--top 8] [--saveBaseline] [--json results.json]
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "importBaseline.json")
+
+# name: (code that is timed, modules that it must not import)
+IMPORT_PATHS: Dict[str, Tuple[str, List[str]]] = {
+    "cli": ("import __init__", ["mrbParser", "mrbToRb", "decompiler", "profiling", "numpy", "concurrent.futures"]),
+    "compile": ("import compiler", ["mrbParser", "mrbToRb", "decompiler", "tempfile"]),
+    "decompile": ("import decompiler", ["numpy", "disassembler", "concurrent.futures", "cProfile", "tracemalloc", "inspect", "ctypes"]),
+    "decompileAll": ("import decompileAll", ["numpy", "disassembler", "concurrent.futures"]),
+    "analysis": ("import corpusAnalyzer", ["numpy", "mrbToRb", "concurrent.futures"]),
+}
+
+def importTimes(code: str) -> Dict[str, Tuple[int, int]]:
+    """(self, cumulative) microseconds of every module the code imports, by name. Top level imports get a `*` prefix."""
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"`{code}` failed: {result.stderr.strip().splitlines()[-1:]}")
+    times: Dict[str, Tuple[int, int]] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        name = parts[2].rstrip()[1:]
+        stripped = name.lstrip()
+        key = stripped if len(name) != len(stripped) else "*" + stripped
+        times[key] = (int(parts[0]), int(parts[1]))
+    return times
+
+def runPath(name: str, repeat: int, top: int) -> Dict:
+    code, forbidden = IMPORT_PATHS[name]
+    importTimes(code)
+    best: Dict[str, Tuple[int, int]]|None = None
+    bestTotal = 0
+    for _ in range(repeat):
+        times = importTimes(code)
+        # site and encodings are imported by every interpreter before the code runs
+        total = sum(cumulative for key, (_, cumulative) in times.items() if key.startswith("*") and key[1:] not in ("site", "encodings"))
+        if best is None or total < bestTotal:
+            best, bestTotal = times, total
+    assert best is not None
+    modules = { key.lstrip("*"): value for key, value in best.items() }
+    slowest = sorted(modules.items(), key=lambda item: -item[1][0])[:top]
+    return {
+        "total": bestTotal / 1e6,
+        "modules": len(modules),
+        "slowest": [{ "module": module, "self": selfTime / 1e6, "cumulative": cumulative / 1e6 } for module, (selfTime, cumulative) in slowest],
+        "forbidden": [module for module in forbidden if module in modules or any(m.startswith(module + ".") for m in modules)],
+    }
+
+def compareToBaseline(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is not None and result["total"] > base["total"] * (1 + threshold):
+            regressions.append(f"{name}: {base['total']*1000:.1f}ms -> {result['total']*1000:.1f}ms")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Import times of the compile, decompile and analysis paths")
+    parser.add_argument("--only", help="comma separated list of paths", default=",".join(IMPORT_PATHS.keys()))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=5, help="number of slowest modules (self time) to list per path")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--saveBaseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.3, help="relative slowdown that counts as a regression")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results: Dict[str, Dict] = {}
+    print(f"{'path':<14}{'import ms':>10}{'modules':>9}  slowest (self ms)")
+    for name in args.only.split(","):
+        result = runPath(name, args.repeat, args.top)
+        results[name] = result
+        slowest = ", ".join(f"{entry['module']} {entry['self']*1000:.1f}" for entry in result["slowest"])
+        print(f"{name:<14}{result['total']*1000:>10.1f}{result['modules']:>9}  {slowest}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    exitCode = 0
+    forbidden = [f"{name} imports {module}" for name, result in results.items() for module in result["forbidden"]]
+    if forbidden:
+        print("\nUnwanted imports:")
+        for entry in forbidden:
+            print(f"  {entry}")
+        exitCode = 1
+    if os.path.exists(args.baseline) and not args.saveBaseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compareToBaseline(results, baseline, args.threshold)
+        if regressions:
+            print(f"\nRegressions (> {args.threshold*100:.0f}% slower than baseline):")
+            for regression in regressions:
+                print(f"  {regression}")
+            exitCode = 1
+        else:
+            print("\nNo regressions compared to baseline")
+    if args.saveBaseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+    sys.exit(exitCode)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark of deeply nested scripts (see NESTING_WORKLOADS in workloads.py).
+
+Every workload is compiled at each depth and parsed, decompiled and rendered separately. Nesting must not turn into
+Python recursion, a RecursionError (or any other error) is reported as a failure and makes the script exit with code 1.
+
+python benchmarks/benchNesting.py [--depths 100,1000] [--only nestedIf,nestedBlocks] [--repeat 3] [--json results.json]
+"""
+from __future__ import annotations
+import argparse
+import io
+import json
+import os
+import sys
+from typing import Dict, List
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+from benchDecompile import countInstructions, timeStages
+from compiler import compileSource
+from mrbParser import RiteFile
+from workloads import NESTING_WORKLOADS
+
+def runDepth(name: str, depth: int, repeat: int) -> Dict:
+    data = compileSource(NESTING_WORKLOADS[name](depth))
+    instructions = countInstructions(RiteFile(io.BytesIO(data)).irepBlock.section)
+    best: Dict[str, float] = {}
+    for _ in range(repeat):
+        for stageName, seconds in timeStages(data).items():
+            best[stageName] = min(best.get(stageName, seconds), seconds)
+    return {
+        "depth": depth,
+        "instructions": instructions,
+        "stages": best,
+        "total": sum(best.values()),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Decompiler times of deeply nested scripts")
+    parser.add_argument("--depths", default="100,1000", help="comma separated nesting depths")
+    parser.add_argument("--only", help="comma separated workload names")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    names = args.only.split(",") if args.only else list(NESTING_WORKLOADS.keys())
+    depths = [int(depth) for depth in args.depths.split(",")]
+    results: Dict[str, List[Dict]] = {}
+    failures: List[str] = []
+    print(f"{'workload':<18}{'depth':>7}{'instr':>9}{'parse ms':>10}{'decomp ms':>11}{'render ms':>11}{'total ms':>10}")
+    for name in names:
+        results[name] = []
+        for depth in depths:
+            try:
+                result = runDepth(name, depth, args.repeat)
+            except Exception as e:
+                print(f"{name:<18}{depth:>7}  FAILED: {type(e).__name__}: {str(e)[:80]}")
+                failures.append(f"{name} at depth {depth}: {type(e).__name__}")
+                continue
+            results[name].append(result)
+            stages = result["stages"]
+            print(f"{name:<18}{depth:>7}{result['instructions']:>9}{stages['parse']*1000:>10.2f}"
+                  f"{stages['decompile']*1000:>11.2f}{stages['render']*1000:>11.2f}{result['total']*1000:>10.2f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if failures:
+        print(f"\n{len(failures)} failures:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark of the superinstruction pre-pass (see mrbToRb/superinstructions.py) on real scripts.
+
+Every file is decompiled with and without fused calls. The number of OpCodeReader.step() calls is counted with the
+opcode statistics of profiling.py, the times are the best of all repetitions without statistics. Both outputs have
+to be identical, otherwise the script exits with code 1.
+
+python benchmarks/benchSuperinstructions.py [<file or folder> ...] [--repeat 5] [--json results.json]
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from benchDecompile import countInstructions
+from corpusAnalyzer import findFiles
+from decompiler import decompileBytes, parseBytes
+from mrbToRb.superinstructions import superinstructionsEnabled
+from profiling import ProfileOptions, recordFile
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "examples")
+
+def countSteps(name: str, data: bytes) -> Tuple[str, int]:
+    """Output and number of step() calls of one decompile"""
+    with recordFile(name, ProfileOptions(countOps=True)) as profile:
+        output = decompileBytes(data)
+    return output, sum(profile.opStats.opCounts)
+
+def bestTime(data: bytes, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t1 = time.perf_counter()
+        decompileBytes(data)
+        best = min(best, time.perf_counter() - t1)
+    return best
+
+def runFile(file: str, repeat: int) -> Dict:
+    with open(file, "rb") as f:
+        data = f.read()
+    result: Dict = { "instructions": countInstructions(parseBytes(data).irepBlock.section) }
+    outputs = {}
+    for mode, enabled in [("plain", False), ("fused", True)]:
+        token = superinstructionsEnabled.set(enabled)
+        try:
+            outputs[mode], steps = countSteps(file, data)
+            result[mode] = { "steps": steps, "time": bestTime(data, repeat) }
+        finally:
+            superinstructionsEnabled.reset(token)
+    result["identical"] = outputs["plain"] == outputs["fused"]
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Step count and time of the decompiler with and without fused calls")
+    parser.add_argument("paths", nargs="*", default=[DEFAULT_PATH], help="mrb files or folders (default examples/)")
+    parser.add_argument("--ext", default="_scp.bin,.mrb", help="comma separated file endings, for folders")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    files = []
+    for path in args.paths:
+        files.extend(findFiles(path, args.ext.split(",")) if os.path.isdir(path) else [path])
+    results: Dict[str, Dict] = {}
+    totals = { "instructions": 0, "plainSteps": 0, "fusedSteps": 0, "plainTime": 0.0, "fusedTime": 0.0 }
+    print(f"{'file':<40}{'instr':>9}{'steps':>9}{'fused':>9}{'saved':>8}{'plain ms':>10}{'fused ms':>10}")
+    for file in files:
+        try:
+            result = runFile(file, args.repeat)
+        except Exception as e:
+            print(f"{os.path.basename(file)[:39]:<40}Error: {type(e).__name__}: {e}")
+            continue
+        results[file] = result
+        plain, fused = result["plain"], result["fused"]
+        totals["instructions"] += result["instructions"]
+        totals["plainSteps"] += plain["steps"]
+        totals["fusedSteps"] += fused["steps"]
+        totals["plainTime"] += plain["time"]
+        totals["fusedTime"] += fused["time"]
+        saved = 1 - fused["steps"] / plain["steps"] if plain["steps"] else 0
+        print(f"{os.path.basename(file)[:39]:<40}{result['instructions']:>9}{plain['steps']:>9}{fused['steps']:>9}{saved*100:>7.1f}%"
+              f"{plain['time']*1000:>10.2f}{fused['time']*1000:>10.2f}{'' if result['identical'] else '  OUTPUT DIFFERS'}")
+
+    saved = 1 - totals["fusedSteps"] / totals["plainSteps"] if totals["plainSteps"] else 0
+    print(f"\n{len(results)} files, {totals['instructions']} instructions")
+    print(f"step() calls: {totals['plainSteps']} -> {totals['fusedSteps']} ({saved*100:.1f}% fewer)")
+    print(f"time: {totals['plainTime']*1000:.1f}ms -> {totals['fusedTime']*1000:.1f}ms")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({ "files": results, "totals": totals }, f, indent=2)
+    differing = [file for file, result in results.items() if not result["identical"]]
+    if differing:
+        print(f"\nOutput differs for {len(differing)} files:")
+        for file in differing:
+            print(f"  {file}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
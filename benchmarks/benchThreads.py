@@ -0,0 +1,96 @@
+"""
+Scaling of decompileMany() with a thread pool and with a process pool.
+
+The files (default examples/, repeated --copies times) are decompiled once serially and then with every worker count
+in both modes. Process pools pay for starting the workers and for pickling every file and result, threads only scale
+on free-threaded Python (3.13t and later), on standard builds the GIL runs them one at a time. Every output has to be
+identical to the serial one, otherwise the script exits with code 1.
+
+python benchmarks/benchThreads.py [<file or folder> ...] [--workers 1,2,4,8] [--copies 20] [--repeat 3] [--json results.json]
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import sys
+import sysconfig
+import time
+from typing import Dict, List, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from corpusAnalyzer import findFiles
+from decompiler import decompileMany
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "examples")
+
+def buildInfo() -> Dict:
+    return {
+        "python": sys.version.split()[0],
+        "freeThreaded": bool(sysconfig.get_config_var("Py_GIL_DISABLED")),
+        # a free-threaded build can still run with the GIL (PYTHON_GIL=1, or an extension module that needs it)
+        "gilEnabled": sys._is_gil_enabled() if hasattr(sys, "_is_gil_enabled") else True,
+        "cpus": os.cpu_count(),
+    }
+
+def timeRun(items: List[Tuple[str, bytes]], workers: int, threads: bool, repeat: int) -> Tuple[float, List]:
+    """Best time of decompiling all items and the results of the last run"""
+    best = float("inf")
+    results: List = []
+    for _ in range(repeat):
+        t1 = time.perf_counter()
+        results = list(decompileMany(items, workers, threads=threads))
+        best = min(best, time.perf_counter() - t1)
+    return best, results
+
+def sameResults(results: List, expected: List) -> bool:
+    # exceptions don't compare equal, only their text
+    return [(name, str(result)) for name, result in results] == [(name, str(result)) for name, result in expected]
+
+def main():
+    parser = argparse.ArgumentParser(description="decompileMany() with threads and with processes")
+    parser.add_argument("paths", nargs="*", default=[DEFAULT_PATH], help="mrb files or folders (default examples/)")
+    parser.add_argument("--ext", default="_scp.bin,.mrb", help="comma separated file endings, for folders")
+    parser.add_argument("--workers", default="1,2,4,8", help="comma separated worker counts")
+    parser.add_argument("--copies", type=int, default=20, help="how often every file is decompiled per run")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    files = []
+    for path in args.paths:
+        files.extend(findFiles(path, args.ext.split(",")) if os.path.isdir(path) else [path])
+    items = []
+    for file in files:
+        with open(file, "rb") as f:
+            data = f.read()
+        items.extend((f"{file}#{copy}", data) for copy in range(args.copies))
+
+    info = buildInfo()
+    print(f"Python {info['python']}, free-threaded: {info['freeThreaded']}, GIL enabled: {info['gilEnabled']}, {info['cpus']} cpus")
+    print(f"{len(items)} files ({len(files)} x {args.copies})\n")
+    serialTime, expected = timeRun(items, 0, False, args.repeat)
+    print(f"{'mode':<10}{'workers':>8}{'ms':>10}{'files/s':>10}{'speedup':>9}")
+    print(f"{'serial':<10}{0:>8}{serialTime*1000:>10.1f}{len(items)/serialTime:>10.0f}{1:>8.2f}x")
+
+    results: Dict = { "build": info, "files": len(items), "serial": serialTime, "thread": {}, "process": {} }
+    differing = []
+    for mode in ["thread", "process"]:
+        for workers in [int(workers) for workers in args.workers.split(",")]:
+            seconds, modeResults = timeRun(items, workers, mode == "thread", args.repeat)
+            results[mode][workers] = seconds
+            identical = sameResults(modeResults, expected)
+            if not identical:
+                differing.append(f"{mode} with {workers} workers")
+            print(f"{mode:<10}{workers:>8}{seconds*1000:>10.1f}{len(items)/seconds:>10.0f}{serialTime/seconds:>8.2f}x"
+                  f"{'' if identical else '  OUTPUT DIFFERS'}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if differing:
+        print(f"\nOutput differs from the serial run for: {', '.join(differing)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
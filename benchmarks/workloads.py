@@ -0,0 +1,107 @@
+"""
+Generators for synthetic ruby scripts. Each one returns ruby source code whose size scales with `n`.
+"""
+from __future__ import annotations
+from typing import Callable, Dict
+
+def straightLine(n: int) -> str:
+    """One long method with n simple statements"""
+    lines = ["def straight_line(a, b)"]
+    for i in range(n):
+        lines.append(f"\tx{i % 50} = a + {i}")
+        lines.append(f"\tputs(x{i % 50}, b)")
+    lines.append("end")
+    return "\n".join(lines) + "\n"
+
+def nestedIf(n: int) -> str:
+    """if/else chains nested n levels deep"""
+    lines = ["def nested_if(a)"]
+    for i in range(n):
+        indent = "\t" * (i + 1)
+        lines.append(f"{indent}if a > {i}")
+        lines.append(f"{indent}\tputs({i})")
+    for i in reversed(range(n)):
+        indent = "\t" * (i + 1)
+        lines.append(f"{indent}else")
+        lines.append(f"{indent}\tputs(-{i})")
+        lines.append(f"{indent}end")
+    lines.append("end")
+    return "\n".join(lines) + "\n"
+
+def caseWhen(n: int) -> str:
+    """One case/when table with n branches"""
+    lines = ["def case_when(a)", "\tcase a"]
+    for i in range(n):
+        lines.append(f"\twhen {i}")
+        lines.append(f"\t\tputs(\"branch {i}\")")
+    lines.append("\telse")
+    lines.append("\t\tputs(\"default\")")
+    lines.append("\tend")
+    lines.append("end")
+    return "\n".join(lines) + "\n"
+
+def classesAndMethods(n: int) -> str:
+    """n classes with 10 methods each"""
+    lines = []
+    for c in range(n):
+        lines.append(f"class Class{c}")
+        for m in range(10):
+            lines.append(f"\tdef method{m}(a, b = {m})")
+            lines.append(f"\t\t@value{m} = a * b")
+            lines.append(f"\t\tself.other{m}(@value{m})")
+            lines.append("\tend")
+        lines.append("end")
+    return "\n".join(lines) + "\n"
+
+def stringConcat(n: int) -> str:
+    """Long string concatenations and interpolations"""
+    lines = ["def string_concat(a)", "\ts = \"\""]
+    for i in range(n):
+        lines.append(f"\ts = s + \"part {i} #{{a}} and #{{a + {i}}}\"")
+    lines.append("\tputs(s)")
+    lines.append("end")
+    return "\n".join(lines) + "\n"
+
+def nestedBlocks(n: int) -> str:
+    """Method calls with blocks nested n levels deep, every block is its own irep"""
+    lines = []
+    for i in range(n):
+        indent = "\t" * i
+        lines.append(f"{indent}each{i % 10} do |x{i}|")
+    lines.append("\t" * n + "puts(x0)")
+    for i in reversed(range(n)):
+        lines.append("\t" * i + "end")
+    return "\n".join(lines) + "\n"
+
+def nestedArrays(n: int) -> str:
+    """An array literal nested n levels deep"""
+    return f"x = {'[' * n}1{', 2]' * n}\n"
+
+def longExpression(n: int) -> str:
+    """One expression with n operators, rendered as a left leaning tree n levels deep"""
+    return "def long_expression(a)\n\tputs(a" + "".join(f" + a * {i}" for i in range(n)) + ")\nend\n"
+
+WORKLOADS: Dict[str, Callable[[int], str]] = {
+    "straightLine": straightLine,
+    "nestedIf": nestedIf,
+    "caseWhen": caseWhen,
+    "classesAndMethods": classesAndMethods,
+    "stringConcat": stringConcat,
+}
+
+# default sizes, chosen so that each workload takes roughly the same time
+DEFAULT_SIZES: Dict[str, int] = {
+    "straightLine": 2000,
+    "nestedIf": 100,
+    "caseWhen": 200,
+    "classesAndMethods": 50,
+    "stringConcat": 500,
+}
+
+# workloads of benchNesting.py, n is the nesting depth
+NESTING_WORKLOADS: Dict[str, Callable[[int], str]] = {
+    "nestedIf": nestedIf,
+    "nestedBlocks": nestedBlocks,
+    "nestedArrays": nestedArrays,
+    "longExpression": longExpression,
+}
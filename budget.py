@@ -0,0 +1,115 @@
+from __future__ import annotations
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+# the memory is only read every few checks, a read is a lot slower than a time check
+MEMORY_CHECK_INTERVAL = 256
+
+try:
+	PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+	PAGE_SIZE = 4096
+
+def currentMemory() -> int|None:
+	"""Resident size of this process in bytes, None where /proc/self/statm doesn't exist"""
+	try:
+		with open("/proc/self/statm", "rb") as f:
+			return int(f.read().split()[1]) * PAGE_SIZE
+	except (OSError, IndexError, ValueError):
+		return None
+
+class Budget:
+	"""
+	Time (seconds) and memory (bytes the process grows by) limits for decompiling a single file, None for no limit.
+	The memory limit needs /proc/self/statm (Linux), elsewhere only the time limit applies.
+	"""
+	maxSeconds: float|None
+	maxMemory: int|None
+
+	def __init__(self, maxSeconds: float|None = None, maxMemory: int|None = None):
+		self.maxSeconds = maxSeconds
+		self.maxMemory = maxMemory
+
+class BudgetExceeded(Exception):
+	"""Raised inside of the decompiler, irepPath and pc are where it stopped"""
+	kind: str		# time or memory
+	irepPath: str|None
+	pc: int|None
+
+	def __init__(self, kind: str, message: str, irepPath: str|None = None, pc: int|None = None):
+		super().__init__(message)
+		self.kind = kind
+		self.irepPath = irepPath
+		self.pc = pc
+
+class BudgetCheck:
+	"""The budget of the file that is decompiled right now"""
+	budget: Budget
+	deadline: float|None
+	memoryLimit: int|None
+	checks: int
+	exceededKind: str|None
+
+	def __init__(self, budget: Budget):
+		self.budget = budget
+		self.deadline = None
+		startMemory = currentMemory() if budget.maxMemory is not None else None
+		self.memoryLimit = startMemory + budget.maxMemory if startMemory is not None else None
+		self.checks = 0
+		self.exceededKind = None
+
+	def start(self) -> None:
+		"""Starts the clock, the time before (reading the start memory) doesn't count"""
+		if self.budget.maxSeconds is not None:
+			self.deadline = time.perf_counter() + self.budget.maxSeconds
+
+	def exceeded(self) -> bool:
+		"""Cheap enough to be called for every instruction"""
+		if self.deadline is not None and time.perf_counter() > self.deadline:
+			self.exceededKind = "time"
+			return True
+		if self.memoryLimit is not None:
+			self.checks += 1
+			if self.checks % MEMORY_CHECK_INTERVAL == 0:
+				memory = currentMemory()
+				if memory is not None and memory > self.memoryLimit:
+					self.exceededKind = "memory"
+					return True
+		return False
+
+	def error(self, irepPath: str|None = None, pc: int|None = None) -> BudgetExceeded:
+		if self.exceededKind == "memory":
+			message = f"Memory budget of {self.budget.maxMemory / 1024 / 1024:.0f}MB exceeded"
+		else:
+			message = f"Time budget of {self.budget.maxSeconds:g}s exceeded"
+		if irepPath is not None:
+			message += f" in irep {irepPath}" + (f" at pc {pc}" if pc is not None else "")
+		return BudgetExceeded(self.exceededKind or "time", message, irepPath, pc)
+
+_activeBudget: ContextVar[BudgetCheck|None] = ContextVar("activeBudget", default=None)
+
+def activeBudget() -> BudgetCheck|None:
+	return _activeBudget.get()
+
+def checkBudget(irepPath: str|None = None) -> None:
+	"""Raises BudgetExceeded if the budget of the current file is used up"""
+	check = _activeBudget.get()
+	if check is not None and check.exceeded():
+		raise check.error(irepPath)
+
+@contextmanager
+def enforceBudget(budget: Budget|None) -> Iterator[BudgetCheck|None]:
+	"""Everything inside of this block counts against `budget`"""
+	if budget is None:
+		yield None
+		return
+	check = BudgetCheck(budget)
+	token = _activeBudget.set(check)
+	check.start()
+	try:
+		yield check
+	finally:
+		_activeBudget.reset(token)
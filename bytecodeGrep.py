@@ -0,0 +1,236 @@
+"""
+Searches a corpus for method calls, constants, symbols and string literals directly in the bytecode, without decompiling.
+
+Every irep's symbol table (or pool) is checked first, ireps without a matching entry are skipped. Only the remaining
+iseqs are scanned for instructions whose symbol / pool operand points to a matching entry. Files are searched in a
+process pool and for exact (non regex) searches, files that don't contain the search text at all are skipped before parsing.
+With --context the files with hits (and only those) are decompiled and the matching lines are shown.
+
+python bytecodeGrep.py <searchDir> [--call setFlag] [--const Foo] [--symbol @bar] [--literal "some text"] [--regex] [--context 2]
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Dict, List, Tuple
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+from corpusAnalyzer import CHUNK_SIZE, chunks, findFiles, opcodeName
+from decompiler import decompileBytes
+from mrbParser import iterRawIreps, readRawIreps
+from opcodes import AllOpCodes, POOL_OPERANDS, SYMBOL_OPERANDS, rawOperand
+
+QUERY_OPERANDS = {
+    "call": { op: SYMBOL_OPERANDS[op] for op in [AllOpCodes.OP_SEND, AllOpCodes.OP_SENDB, AllOpCodes.OP_TAILCALL] },
+    "const": { op: SYMBOL_OPERANDS[op] for op in [AllOpCodes.OP_GETCONST, AllOpCodes.OP_SETCONST, AllOpCodes.OP_GETMCNST, AllOpCodes.OP_SETMCNST] },
+    "symbol": SYMBOL_OPERANDS,
+    "literal": POOL_OPERANDS,
+}
+
+class GrepQuery:
+    kind: str
+    text: str
+    regex: re.Pattern|None
+    operands: Dict[int, str]
+
+    def __init__(self, kind: str, text: str, isRegex: bool = False) -> None:
+        self.kind = kind
+        self.text = text
+        self.regex = re.compile(text) if isRegex else None
+        self.operands = QUERY_OPERANDS[kind]
+
+    @property
+    def searchesPool(self) -> bool:
+        return self.kind == "literal"
+
+    def matches(self, value: str|bytes) -> bool:
+        if isinstance(value, bytes):
+            value = value.decode("utf-8", "ignore")
+        if self.regex is not None:
+            return self.regex.search(value) is not None
+        if self.searchesPool:
+            return self.text in value
+        return value == self.text
+
+    def canMatchFile(self, data: bytes) -> bool:
+        """Cheap check on the raw file, symbols and pool strings are stored as plain utf-8"""
+        return self.regex is not None or self.text.encode("utf-8") in data
+
+class GrepHit:
+    file: str
+    irepPath: str
+    pc: int
+    opcode: int
+    kind: str
+    value: str
+
+    def __init__(self, file: str, irepPath: str, pc: int, opcode: int, kind: str, value: str) -> None:
+        self.file = file
+        self.irepPath = irepPath
+        self.pc = pc
+        self.opcode = opcode
+        self.kind = kind
+        self.value = value
+
+    def __str__(self) -> str:
+        return f"{self.file}:{self.irepPath}:{self.pc}: {opcodeName(self.opcode)} {self.kind} {self.value!r}"
+
+    def toJson(self) -> Dict:
+        return {
+            "file": self.file,
+            "irep": self.irepPath,
+            "pc": self.pc,
+            "opcode": opcodeName(self.opcode),
+            "kind": self.kind,
+            "value": self.value,
+        }
+
+class GrepStats:
+    files: int
+    skippedFiles: int
+    ireps: int
+    skippedIreps: int
+
+    def __init__(self) -> None:
+        self.files = 0
+        self.skippedFiles = 0
+        self.ireps = 0
+        self.skippedIreps = 0
+
+    def add(self, other: GrepStats) -> None:
+        self.files += other.files
+        self.skippedFiles += other.skippedFiles
+        self.ireps += other.ireps
+        self.skippedIreps += other.skippedIreps
+
+def grepBytes(name: str, data: bytes, queries: List[GrepQuery], stats: GrepStats|None = None) -> List[GrepHit]:
+    stats = stats or GrepStats()
+    stats.files += 1
+    queries = [query for query in queries if query.canMatchFile(data)]
+    if not queries:
+        stats.skippedFiles += 1
+        return []
+    hits = []
+    for irep in iterRawIreps(readRawIreps(data)):
+        stats.ireps += 1
+        # (operands, matching table indexes, query) of all queries that can match in this irep
+        candidates = []
+        for query in queries:
+            table = irep.pools if query.searchesPool else irep.symbols
+            indexes = { i for i, value in enumerate(table) if query.matches(value) }
+            if indexes:
+                candidates.append((query, indexes))
+        if not candidates:
+            stats.skippedIreps += 1
+            continue
+        for pc, code in enumerate(irep.iseq):
+            opcode = code & 0x7f
+            for query, indexes in candidates:
+                operand = query.operands.get(opcode)
+                if operand is None:
+                    continue
+                index = rawOperand(code, operand)
+                if index in indexes:
+                    value = irep.pools[index].decode("utf-8", "ignore") if query.searchesPool else irep.symbols[index]
+                    hits.append(GrepHit(name, irep.path, pc, opcode, query.kind, value))
+    return hits
+
+def contextLines(source: str, values: List[str], context: int) -> List[str]:
+    """grep -C like excerpt of all lines that contain one of the values"""
+    lines = source.split("\n")
+    matching = [i for i, line in enumerate(lines) if any(value in line for value in values)]
+    shown = sorted({ j for i in matching for j in range(max(0, i - context), min(len(lines), i + context + 1)) })
+    excerpt = []
+    for k, i in enumerate(shown):
+        if k > 0 and shown[k - 1] != i - 1:
+            excerpt.append("--")
+        excerpt.append(f"{i + 1:>5}{':' if i in matching else '-'} {lines[i]}")
+    return excerpt
+
+# (file, hits, decompiled context or None, error or None)
+FileResult = Tuple[str, List[GrepHit], List[str]|None, str|None]
+
+def grepChunk(files: List[str], queries: List[GrepQuery], context: int) -> Tuple[List[FileResult], GrepStats]:
+    stats = GrepStats()
+    results = []
+    for file in files:
+        try:
+            with open(file, "rb") as f:
+                data = f.read()
+            hits = grepBytes(file, data, queries, stats)
+            excerpt = None
+            if hits and context >= 0:
+                source = decompileBytes(data)
+                excerpt = contextLines(source, sorted({ hit.value for hit in hits }), context)
+            results.append((file, hits, excerpt, None))
+        except Exception as e:
+            results.append((file, [], None, f"{type(e).__name__}: {e}"))
+    return results, stats
+
+def grepFiles(files: List[str], queries: List[GrepQuery], workers: int = 0, context: int = -1) -> Tuple[List[FileResult], GrepStats]:
+    """Searches all files. context >= 0 also decompiles files with hits and returns that many lines around every match."""
+    if workers > 0:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunkResults = list(executor.map(grepChunk, chunks(files, CHUNK_SIZE), repeat(queries), repeat(context)))
+    else:
+        chunkResults = [grepChunk(files, queries, context)]
+    results = []
+    stats = GrepStats()
+    for chunkResult, chunkStats in chunkResults:
+        results.extend(chunkResult)
+        stats.add(chunkStats)
+    return results, stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Search method calls, constants, symbols and literals in the bytecode of a corpus")
+    parser.add_argument("searchDir")
+    parser.add_argument("--call", action="append", default=[], help="method name of OP_SEND/OP_SENDB/OP_TAILCALL")
+    parser.add_argument("--const", action="append", default=[], help="constant name of OP_GETCONST/OP_SETCONST/OP_GETMCNST/OP_SETMCNST")
+    parser.add_argument("--symbol", action="append", default=[], help="any symbol operand (methods, constants, variables, symbol literals)")
+    parser.add_argument("--literal", action="append", default=[], help="part of a string or number literal")
+    parser.add_argument("--regex", action="store_true", help="search texts are regular expressions")
+    parser.add_argument("--context", type=int, default=-1, help="decompile files with hits and show N lines around matches")
+    parser.add_argument("--ext", default="_scp.bin,.mrb", help="comma separated file endings")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--json", help="also write all hits as JSON")
+    args = parser.parse_args()
+
+    queries = [GrepQuery(kind, text, args.regex) for kind in QUERY_OPERANDS.keys() for text in getattr(args, kind)]
+    if not queries:
+        parser.error("nothing to search for, use --call, --const, --symbol or --literal")
+
+    t1 = time.time()
+    files = findFiles(args.searchDir, args.ext.split(","))
+    results, stats = grepFiles(files, queries, args.workers if args.workers > 1 else 0, args.context)
+    hitCount = 0
+    hitFiles = 0
+    for file, hits, excerpt, error in results:
+        if error is not None:
+            print(f"Error in {file}: {error}")
+        if not hits:
+            continue
+        hitCount += len(hits)
+        hitFiles += 1
+        for hit in hits:
+            print(hit)
+        if excerpt is not None:
+            print("\n".join(excerpt))
+            print()
+    print(f"{hitCount} hits in {hitFiles} files ({stats.files} files searched, {stats.skippedFiles} skipped without parsing, "
+          f"{stats.skippedIreps}/{stats.ireps} ireps skipped by symbol table) in {time.time() - t1:.2f}s")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "hits": [hit.toJson() for _, hits, _, _ in results for hit in hits],
+                "errors": [{ "file": file, "error": error } for file, _, _, error in results if error is not None],
+            }, f, indent=2)
+
+if __name__ == "__main__":
+    main()
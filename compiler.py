@@ -0,0 +1,32 @@
+from __future__ import annotations
+import os
+import subprocess
+
+WIN_BIN = "bins\\windows\\mrbc.exe"
+LINUX_BIN = "bins/linux/mrbc"
+
+def getMrbcPath() -> str:
+    curDir = os.path.dirname(os.path.realpath(__file__))
+    return os.path.join(curDir, WIN_BIN if os.name == "nt" else LINUX_BIN)
+
+def getCompileCommand(file: str, outFile: str) -> list[str]:
+    return [getMrbcPath(), "-o", outFile, file]
+
+def compileFile(file: str, outFile: str|None = None) -> int:
+    """Compiles a ruby file with the bundled mrbc. Returns mrbc's exit code."""
+    outFile = outFile or file + ".mrb"
+    return subprocess.call(getCompileCommand(file, outFile))
+
+def compileSource(source: str) -> bytes:
+    """Compiles ruby source code and returns the mrb binary"""
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmpDir:
+        rbFile = os.path.join(tmpDir, "source.rb")
+        mrbFile = os.path.join(tmpDir, "source.mrb")
+        with open(rbFile, "w", encoding="utf-8") as f:
+            f.write(source)
+        result = subprocess.run(getCompileCommand(rbFile, mrbFile), capture_output=True, text=True)
+        if result.returncode != 0:
+            raise Exception(f"mrbc failed ({result.returncode}): {result.stdout}{result.stderr}")
+        with open(mrbFile, "rb") as f:
+            return f.read()
@@ -0,0 +1,181 @@
+"""
+Opcode statistics of a whole corpus of mrb files.
+
+Files are scanned in a process pool with readRawIreps (no MrbCode objects). Every file is reduced to an opcode histogram,
+which are then combined into total counts, per opcode file coverage and example files.
+Uses NumPy (bincount) if it's installed, otherwise plain python.
+
+python corpusAnalyzer.py <searchDir> [--out stats.txt] [--json stats.json] [--workers 8] [--ext _scp.bin]
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+from mrbParser import iterRawIreps, readRawIreps
+from opcodes import opcodes
+
+# opcodes are 7 bit
+HISTOGRAM_SIZE = 0x80
+CHUNK_SIZE = 64
+
+# False until loadNumpy() ran. The other corpus tools only use the helpers of this module, they shouldn't pay for numpy
+_numpy = False
+
+def loadNumpy():
+    """The numpy module, None if it isn't installed"""
+    global _numpy
+    if _numpy is False:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = None
+    return _numpy
+
+def opcodeName(opcode: int) -> str:
+    return opcodes[opcode][0] if opcode < len(opcodes) else f"OP_{opcode}"
+
+def findFiles(searchDir: str, extensions: Sequence[str]) -> List[str]:
+    found = []
+    for root, dirs, files in os.walk(searchDir):
+        for file in files:
+            if any(file.endswith(ext) for ext in extensions):
+                found.append(os.path.join(root, file))
+    return sorted(found)
+
+def fileHistogram(data: bytes):
+    """Opcode counts of all ireps in one mrb file"""
+    ireps = list(iterRawIreps(readRawIreps(data, False)))
+    np = loadNumpy()
+    if np is not None:
+        iseq = np.concatenate([np.frombuffer(irep.iseq, dtype=np.uint32) for irep in ireps])
+        return np.bincount(iseq & 0x7f, minlength=HISTOGRAM_SIZE).astype(np.uint32)
+    histogram = [0] * HISTOGRAM_SIZE
+    for irep in ireps:
+        for code in irep.iseq:
+            histogram[code & 0x7f] += 1
+    return histogram
+
+def analyzeChunk(files: List[str]) -> List[Tuple[str, object|None, str|None]]:
+    results = []
+    for file in files:
+        try:
+            with open(file, "rb") as f:
+                results.append((file, fileHistogram(f.read()), None))
+        except Exception as e:
+            results.append((file, None, f"{type(e).__name__}: {e}"))
+    return results
+
+def chunks(items: List[str], size: int) -> Iterator[List[str]]:
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+class CorpusStats:
+    files: List[str]
+    totals: List[int]
+    coverage: List[int]
+    examples: List[List[str]]
+    errors: List[Tuple[str, str]]
+
+    def __init__(self, files: List[str], histograms: List, errors: List[Tuple[str, str]], exampleCount: int) -> None:
+        self.files = files
+        self.errors = errors
+        np = loadNumpy()
+        if np is not None and histograms:
+            matrix = np.vstack(histograms)
+            self.totals = matrix.sum(axis=0, dtype=np.int64).tolist()
+            self.coverage = np.count_nonzero(matrix, axis=0).tolist()
+            self.examples = [[files[i] for i in np.flatnonzero(matrix[:, op])[:exampleCount]] for op in range(HISTOGRAM_SIZE)]
+            return
+        self.totals = [0] * HISTOGRAM_SIZE
+        self.coverage = [0] * HISTOGRAM_SIZE
+        self.examples = [[] for _ in range(HISTOGRAM_SIZE)]
+        for file, histogram in zip(files, histograms):
+            for op, count in enumerate(histogram):
+                if count == 0:
+                    continue
+                self.totals[op] += count
+                self.coverage[op] += 1
+                if len(self.examples[op]) < exampleCount:
+                    self.examples[op].append(file)
+
+    def usedOpcodes(self) -> range:
+        # all known opcodes, plus invalid ones that actually appear
+        lastUsed = max([op for op in range(HISTOGRAM_SIZE) if self.totals[op] > 0], default=0)
+        return range(max(len(opcodes), lastUsed + 1))
+
+    def toText(self) -> str:
+        """The format of usedOpCodes.txt: name, total count and example files. The file coverage is in toJson()."""
+        lines = []
+        for op in self.usedOpcodes():
+            examples = ", ".join(os.path.basename(f) for f in self.examples[op])
+            lines.append(f"{opcodeName(op)}:\t{self.totals[op]}\t\t{examples}")
+        return "\n".join(lines) + "\n"
+
+    def toJson(self) -> Dict:
+        return {
+            "fileCount": len(self.files),
+            "errors": [{ "file": file, "error": error } for file, error in self.errors],
+            "opcodes": {
+                opcodeName(op): {
+                    "count": self.totals[op],
+                    "files": self.coverage[op],
+                    "examples": self.examples[op],
+                }
+                for op in self.usedOpcodes()
+            },
+        }
+
+def analyzeCorpus(files: List[str], workers: int = 0, exampleCount: int = 5) -> CorpusStats:
+    if workers > 0:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunkResults = list(executor.map(analyzeChunk, chunks(files, CHUNK_SIZE)))
+    else:
+        chunkResults = [analyzeChunk(files)]
+    okFiles = []
+    histograms = []
+    errors = []
+    for results in chunkResults:
+        for file, histogram, error in results:
+            if error is not None:
+                errors.append((file, error))
+            else:
+                okFiles.append(file)
+                histograms.append(histogram)
+    return CorpusStats(okFiles, histograms, errors, exampleCount)
+
+def main():
+    parser = argparse.ArgumentParser(description="Count opcodes across a corpus of mrb files")
+    parser.add_argument("searchDir")
+    parser.add_argument("--ext", default="_scp.bin,.mrb", help="comma separated file endings")
+    parser.add_argument("--out", help="write the text summary (in the usedOpCodes.txt format) to this file instead of stdout")
+    parser.add_argument("--json", help="also write the stats as JSON")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--examples", type=int, default=5, help="number of example files per opcode")
+    args = parser.parse_args()
+
+    t1 = time.time()
+    files = findFiles(args.searchDir, args.ext.split(","))
+    stats = analyzeCorpus(files, args.workers if args.workers > 1 else 0, args.examples)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(stats.toText())
+    else:
+        sys.stdout.write(stats.toText())
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(stats.toJson(), f, indent=2)
+    # stdout may be the summary itself
+    for file, error in stats.errors:
+        print(f"Error in {file}: {error}", file=sys.stderr)
+    print(f"Analyzed {len(stats.files)}/{len(files)} files in {time.time() - t1:.2f}s{f', written to {args.out}' if args.out else ''}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
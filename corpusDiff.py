@@ -0,0 +1,259 @@
+"""
+Structural diff of two versions of a corpus, down to single methods.
+
+Files are matched by their path relative to the corpus folder, files with identical content are skipped without
+parsing. In the remaining files every irep gets a fingerprint of its instructions, pools, symbols and (for the
+subtree fingerprint) children. Definitions (see structureScanner.py) are matched by qualified name and compared by
+fingerprint: methods by the subtree of their body (so blocks are included), classes and modules only by their own
+body irep, the top level code as "main". Definitions that were added on one side and removed on the other, but have
+the same fingerprint, are reported as moved. Only changed definitions get decompiled.
+
+python corpusDiff.py <oldDir> <newDir> [--decompile] [--html diff.html] [--json diff.json] [--workers 8]
+"""
+from __future__ import annotations
+import argparse
+import difflib
+import hashlib
+import json
+import os
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Dict, List, Tuple
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+from corpusAnalyzer import CHUNK_SIZE, chunks, findFiles
+from decompiler import decompileBytes, decompileDefinition
+from mrbParser import RawIrep, iterRawIreps, readRawIreps
+from structureScanner import TOP_LEVEL_OWNER, FileStructure
+
+# (own, subtree) fingerprint of an irep
+Fingerprint = Tuple[bytes, bytes]
+
+def irepFingerprints(root: RawIrep) -> Dict[str, Fingerprint]:
+    fingerprints = {}
+    # children come after their parent in file order, so going backwards they are always done first
+    for irep in reversed(list(iterRawIreps(root))):
+        own = hashlib.sha1()
+        own.update(struct.pack(">HHI", irep.numLocalVariables, irep.numRegisterVariables, len(irep.iseq)))
+        own.update(irep.iseq.tobytes())
+        for table in [irep.pools, [symbol.encode("utf-8") for symbol in irep.symbols]]:
+            own.update(struct.pack(">I", len(table)))
+            for value in table:
+                own.update(struct.pack(">I", len(value)))
+                own.update(value)
+        ownDigest = own.digest()
+        subtree = hashlib.sha1(ownDigest)
+        for child in irep.children:
+            subtree.update(fingerprints[child.path][1])
+        fingerprints[irep.path] = (ownDigest, subtree.digest())
+    return fingerprints
+
+class DefinitionChange:
+    status: str             # added, removed, changed or moved
+    kind: str               # class, module, sclass, method or main
+    qualifiedName: str
+    oldName: str|None       # for moved definitions with a different name
+    oldPath: str|None       # body irep
+    newPath: str|None
+    oldSource: str|None     # decompiled old and new definition, only for changed definitions
+    newSource: str|None
+
+    def __init__(self, status: str, kind: str, qualifiedName: str, oldPath: str|None, newPath: str|None) -> None:
+        self.status = status
+        self.kind = kind
+        self.qualifiedName = qualifiedName
+        self.oldName = None
+        self.oldPath = oldPath
+        self.newPath = newPath
+        self.oldSource = None
+        self.newSource = None
+
+    def __str__(self) -> str:
+        text = f"{self.status:<8} {self.kind:<7} {self.qualifiedName}"
+        if self.status == "moved":
+            text += f"  ({self.oldName + ' ' if self.oldName else ''}{self.oldPath} -> {self.newPath})"
+        return text
+
+    def toJson(self) -> Dict:
+        json = {
+            "status": self.status,
+            "kind": self.kind,
+            "qualifiedName": self.qualifiedName,
+            "oldIrep": self.oldPath,
+            "newIrep": self.newPath,
+        }
+        if self.oldName is not None:
+            json["oldName"] = self.oldName
+        return json
+
+# (kind, qualified name, body irep path, fingerprint) of every comparable definition, keyed by qualified name and
+# the number of earlier definitions with the same name (classes can be reopened, methods redefined)
+DefinitionKeys = Dict[Tuple[str, int], Tuple[str, str, str, bytes]]
+
+def definitionKeys(root: RawIrep) -> DefinitionKeys:
+    fingerprints = irepFingerprints(root)
+    keys = { (TOP_LEVEL_OWNER, 0): ("main", TOP_LEVEL_OWNER, "/", fingerprints["/"][0]) }
+    for definition in FileStructure(root, False).definitions:
+        if definition.kind == "block" or definition.bodyPath is None:
+            continue
+        own, subtree = fingerprints[definition.bodyPath]
+        fingerprint = subtree if definition.kind == "method" else own
+        n = 0
+        while (definition.qualifiedName, n) in keys:
+            n += 1
+        keys[(definition.qualifiedName, n)] = (definition.kind, definition.qualifiedName, definition.bodyPath, fingerprint)
+    return keys
+
+def diffBytes(oldData: bytes, newData: bytes) -> List[DefinitionChange]:
+    """Added, removed, changed and moved definitions between two versions of a mrb binary"""
+    oldKeys = definitionKeys(readRawIreps(oldData))
+    newKeys = definitionKeys(readRawIreps(newData))
+    changes = []
+    added = []
+    for key, (kind, name, newPath, newFingerprint) in newKeys.items():
+        old = oldKeys.get(key)
+        if old is None:
+            added.append(key)
+        elif old[3] != newFingerprint:
+            changes.append(DefinitionChange("changed", kind, name, old[2], newPath))
+        elif old[2] != newPath:
+            changes.append(DefinitionChange("moved", kind, name, old[2], newPath))
+    removed = [key for key in oldKeys.keys() if key not in newKeys]
+    # renamed or re-nested definitions with an unchanged body
+    removedByFingerprint = { (oldKeys[key][0], oldKeys[key][3]): key for key in removed }
+    for key in added:
+        kind, name, newPath, fingerprint = newKeys[key]
+        oldKey = removedByFingerprint.pop((kind, fingerprint), None)
+        if oldKey is None:
+            changes.append(DefinitionChange("added", kind, name, None, newPath))
+            continue
+        removed.remove(oldKey)
+        change = DefinitionChange("moved", kind, name, oldKeys[oldKey][2], newPath)
+        change.oldName = oldKeys[oldKey][1]
+        changes.append(change)
+    for key in removed:
+        kind, name, oldPath, _ = oldKeys[key]
+        changes.append(DefinitionChange("removed", kind, name, oldPath, None))
+    return changes
+
+def decompileChanged(changes: List[DefinitionChange], oldData: bytes, newData: bytes) -> None:
+    """Fills in oldSource and newSource of all changed definitions (the top level code is decompiled as a whole file)"""
+    for change in changes:
+        if change.status != "changed":
+            continue
+        for data, attribute in [(oldData, "oldSource"), (newData, "newSource")]:
+            try:
+                source = decompileBytes(data) if change.kind == "main" else decompileDefinition(data, change.qualifiedName)
+                setattr(change, attribute, source)
+            except Exception as e:
+                setattr(change, attribute, f"# Error: {type(e).__name__}: {e}")
+
+def sideBySide(old: str, new: str, width: int) -> List[str]:
+    """Two column view of the changed lines (and a line of context around them)"""
+    oldLines = old.expandtabs(4).split("\n")
+    newLines = new.expandtabs(4).split("\n")
+    column = max(10, (width - 3) // 2)
+    lines = []
+    for group in difflib.SequenceMatcher(None, oldLines, newLines, autojunk=False).get_grouped_opcodes(1):
+        if lines:
+            lines.append("-" * width)
+        for tag, i1, i2, j1, j2 in group:
+            marker = { "equal": " ", "replace": "|", "delete": "<", "insert": ">" }[tag]
+            for k in range(max(i2 - i1, j2 - j1)):
+                left = oldLines[i1 + k] if i1 + k < i2 else ""
+                right = newLines[j1 + k] if j1 + k < j2 else ""
+                lines.append(f"{left[:column]:<{column}} {marker} {right[:column]}")
+    return lines
+
+# (relative path, status of the file, definition changes, error)
+FileDiff = Tuple[str, str, List[DefinitionChange], str|None]
+
+def diffChunk(pairs: List[Tuple[str, str, str]], decompile: bool) -> List[FileDiff]:
+    results = []
+    for relPath, oldFile, newFile in pairs:
+        try:
+            with open(oldFile, "rb") as f:
+                oldData = f.read()
+            with open(newFile, "rb") as f:
+                newData = f.read()
+            if oldData == newData:
+                continue
+            changes = diffBytes(oldData, newData)
+            if decompile:
+                decompileChanged(changes, oldData, newData)
+            results.append((relPath, "changed", changes, None))
+        except Exception as e:
+            results.append((relPath, "changed", [], f"{type(e).__name__}: {e}"))
+    return results
+
+def diffCorpora(oldDir: str, newDir: str, extensions: List[str], workers: int = 0, decompile: bool = False) -> List[FileDiff]:
+    oldFiles = { os.path.relpath(file, oldDir): file for file in findFiles(oldDir, extensions) }
+    newFiles = { os.path.relpath(file, newDir): file for file in findFiles(newDir, extensions) }
+    results: List[FileDiff] = []
+    results.extend((relPath, "removed", [], None) for relPath in sorted(oldFiles.keys() - newFiles.keys()))
+    results.extend((relPath, "added", [], None) for relPath in sorted(newFiles.keys() - oldFiles.keys()))
+    # identical files are skipped in diffChunk, before parsing
+    pairs = [(relPath, oldFiles[relPath], newFiles[relPath]) for relPath in sorted(oldFiles.keys() & newFiles.keys())]
+    if workers > 0 and len(pairs) > CHUNK_SIZE:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for chunkResults in executor.map(diffChunk, chunks(pairs, CHUNK_SIZE), repeat(decompile)):
+                results.extend(chunkResults)
+    else:
+        results.extend(diffChunk(pairs, decompile))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Diff two corpus versions by irep fingerprints and decompile only changed definitions")
+    parser.add_argument("oldDir")
+    parser.add_argument("newDir")
+    parser.add_argument("--ext", default="_scp.bin,.mrb", help="comma separated file endings")
+    parser.add_argument("--decompile", action="store_true", help="decompile changed definitions and show them side by side")
+    parser.add_argument("--width", type=int, default=160, help="width of the side by side view")
+    parser.add_argument("--html", help="write the side by side view of changed definitions to this html file (implies --decompile)")
+    parser.add_argument("--json", help="also write all changes as JSON")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    t1 = time.time()
+    decompile = args.decompile or args.html is not None
+    results = diffCorpora(args.oldDir, args.newDir, args.ext.split(","), args.workers if args.workers > 1 else 0, decompile)
+    htmlDiff = difflib.HtmlDiff(wrapcolumn=args.width // 2)
+    htmlTables = []
+    counts = { "added": 0, "removed": 0, "changed": 0, "moved": 0 }
+    for relPath, status, changes, error in results:
+        print(f"{status} {relPath}")
+        if error is not None:
+            print(f"  Error: {error}")
+        for change in changes:
+            counts[change.status] += 1
+            print(f"  {change}")
+            if change.oldSource is None or change.newSource is None:
+                continue
+            if args.html:
+                htmlTables.append(f"<h3>{relPath}: {change.qualifiedName}</h3>")
+                htmlTables.append(htmlDiff.make_table(change.oldSource.split("\n"), change.newSource.split("\n"), "old", "new", True, 2))
+            else:
+                print("\n".join("    " + line for line in sideBySide(change.oldSource, change.newSource, args.width)))
+    fileCounts = { status: sum(1 for _, fileStatus, _, _ in results if fileStatus == status) for status in ["added", "removed", "changed"] }
+    print(f"Files: {fileCounts['added']} added, {fileCounts['removed']} removed, {fileCounts['changed']} changed")
+    print(f"Definitions: {counts['added']} added, {counts['removed']} removed, {counts['changed']} changed, {counts['moved']} moved")
+    print(f"Done in {time.time() - t1:.2f}s")
+
+    if args.html:
+        with open(args.html, "w", encoding="utf-8") as f:
+            f.write(htmlDiff.make_file([], [], "old", "new").replace("<table", "\n".join(htmlTables) + "<table", 1))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump([{
+                "file": relPath,
+                "status": status,
+                "changes": [change.toJson() for change in changes],
+                "error": error,
+            } for relPath, status, changes, error in results], f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,123 @@
+from __future__ import annotations
 import os
-import traceback
+import time
+from typing import Callable, Iterator, List, Tuple
 
-from mrbParser import RiteFile
-from mrbToRb.mrbToRb import mrbToRb
+from decompiler import decompileMany
+from budget import Budget
+from diagnostics import DiagnosticsCollector, collectFile, reportException
+from pipeline import AsyncWriter, PipelineStats, prefetchFiles
+from profiling import Profiler
+from utils import ENCODING
 
-def decompileAll(searchDir: str):
-    filesFound = 0
-    filesDecompiled = 0
+# bounds of the queues between the stages of a pipelined run
+PREFETCH_FILES = 16
+WRITE_QUEUE_SIZE = 16
+
+def isMrbFile(file: str) -> bool:
+    return file.endswith("_scp.bin") or file.endswith(".mrb")
+
+def findMrbFiles(searchDir: str) -> Iterator[str]:
     for root, dirs, files in os.walk(searchDir):
         for file in files:
-            if not (file.endswith("_scp.bin") or file.endswith(".mrb")):
-                continue
+            if isMrbFile(file):
+                yield os.path.join(root, file)
+
+def readFiles(filePaths: Iterator[str], onError: Callable[[str, OSError], None], readTimes: List[Tuple[str, float]]) -> Iterator[Tuple[str, bytes]]:
+    """Files that can't be read are passed to onError and skipped. The time of every read is added to readTimes."""
+    for filePath in filePaths:
+        t1 = time.perf_counter()
+        try:
+            with open(filePath, "rb") as f:
+                data = f.read()
+        except OSError as e:
+            onError(filePath, e)
+            continue
+        readTimes.append((filePath, time.perf_counter() - t1))
+        yield filePath, data
+
+def reportFileError(diagnostics: DiagnosticsCollector, filePath: str, e: Exception) -> None:
+    with collectFile() as fileDiagnostics:
+        reportException(e)
+    diagnostics.addFile(filePath, fileDiagnostics)
+
+def decompileAll(searchDir: str, workers: int = 0, profiler: Profiler|None = None, diagnostics: DiagnosticsCollector|None = None,
+                 budget: Budget|None = None, threads: bool = False, pipelined: bool = False, readers: int = 4) -> PipelineStats|None:
+    """
+    Without a diagnostics collector, the diagnostics are printed per file and summarized at the end.
+    With workers > 0, files are decompiled in that many processes, or threads with threads = True.
+    pipelined = True overlaps the disk I/O with decompiling: `readers` threads prefetch the files and a background
+    thread writes the results. The utilization of every stage is printed and returned.
+    """
+    ownsDiagnostics = diagnostics is None
+    if diagnostics is None:
+        diagnostics = DiagnosticsCollector()
+    filesFound = 0
+    filesDecompiled = 0
+
+    def readFailed(filePath: str, e: OSError) -> None:
+        nonlocal filesFound
+        filesFound += 1
+        reportFileError(diagnostics, filePath, e)
+
+    # (name, seconds), added to the profiles once the files are decompiled
+    readTimes: List[Tuple[str, float]] = []
+    stats: PipelineStats|None = None
+    writer: AsyncWriter|None = None
+    items: Iterator[Tuple[str, bytes]]
+    decompileProfiler = profiler
+    if pipelined:
+        stats = PipelineStats(readers, workers)
+        items = prefetchFiles(findMrbFiles(searchDir), readers, PREFETCH_FILES, stats, readFailed, readTimes)
+        writer = AsyncWriter(stats, WRITE_QUEUE_SIZE)
+        # the per file times (measured where the file is decompiled) are the busy time of the decompile stage
+        decompileProfiler = profiler or Profiler()
+    else:
+        items = readFiles(findMrbFiles(searchDir), readFailed, readTimes)
+    firstProfile = len(decompileProfiler.files) if decompileProfiler is not None else 0
+    try:
+        for filePath, result in decompileMany(items, workers, profiler=decompileProfiler, diagnostics=diagnostics,
+                                              budget=budget, threads=threads):
             filesFound += 1
-            filePath = os.path.join(root, file)
+            if isinstance(result, Exception):
+                continue
+            if writer is not None:
+                filesDecompiled += 1
+                writer.put(filePath, f"{filePath}.rb", result)
+                continue
+            t1 = time.perf_counter()
             try:
-                with open(filePath, "rb") as f:
-                    riteFile = RiteFile(f)
-                    codesRes = mrbToRb(riteFile)
                 with open(f"{filePath}.rb", "wb") as f:
-                    f.write(codesRes.toStr().encode("utf-8", "ignore"))
-                filesDecompiled += 1
-            except:
-                print(f"Error decompiling {filePath}")
-                traceback.print_exc()
+                    f.write(result.encode(ENCODING, "ignore"))
+            except OSError as e:
+                reportFileError(diagnostics, filePath, e)
                 continue
+            filesDecompiled += 1
+            if profiler is not None:
+                profiler.addStage(filePath, "write", time.perf_counter() - t1)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is not None:
+        for filePath, e in writer.errors:
+            reportFileError(diagnostics, filePath, e)
+        filesDecompiled -= len(writer.errors)
+    if stats is not None and decompileProfiler is not None:
+        stats.finish()
+        # before the read and write times are added to the profiles
+        for profile in decompileProfiler.files[firstProfile:]:
+            stats.addBusy("decompile", profile.totalTime)
+    if profiler is not None:
+        for filePath, seconds in readTimes:
+            profiler.addStage(filePath, "read", seconds)
+        if writer is not None:
+            for filePath, seconds in writer.writeTimes:
+                profiler.addStage(filePath, "write", seconds)
 
     print(f"\nDecompiled {filesDecompiled}/{filesFound} files")
+    if ownsDiagnostics:
+        print(diagnostics.summaryText())
+    if stats is None:
+        return None
+    print(stats.toText())
+    return stats
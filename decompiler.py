@@ -0,0 +1,175 @@
+from __future__ import annotations
+import contextvars
+import io
+from collections import deque
+from typing import TYPE_CHECKING, Any, BinaryIO, Callable, Deque, Iterable, Iterator, List, Tuple, Union
+
+from budget import Budget, BudgetExceeded, enforceBudget
+from diagnostics import Diagnostic, DiagnosticsCollector, collectFile, report, reportException
+from mrbParser import RiteFile, readIrepSubtree, readRawIreps
+from mrbToRb.codeGenerator import CodeGen
+from mrbToRb.mrbToRb import instructionsToRb, mrbToRb
+from mrbToRb.rbExpressions import ClassSymbolEx, MainClass, SymbolEx, render
+from profiling import FileProfile, ProfileOptions, Profiler, profileStage, recordFile
+from structureScanner import Definition, FileStructure, definitionEnd, definitionSlice, definitionSymbol
+from utils import ENCODING
+
+# concurrent.futures (and logging, multiprocessing) is only imported for parallel runs, the disassembler (and numpy) only for
+# files that run out of their budget
+if TYPE_CHECKING:
+    from concurrent.futures import Executor, Future
+
+BytesLike = Union[bytes, bytearray, memoryview]
+DecompileResult = Union[str, Exception]
+
+def parseBytes(data: BytesLike) -> RiteFile:
+    return RiteFile(io.BytesIO(data))
+
+def decompileToCodeGen(data: BytesLike) -> CodeGen:
+    return mrbToRb(parseBytes(data))
+
+def decompileBytes(data: BytesLike) -> str:
+    """Decompiles an in-memory mrb binary and returns the ruby source."""
+    codeGen = decompileToCodeGen(data)
+    with profileStage("render"):
+        return codeGen.toStr()
+
+def decompileWithBudget(data: BytesLike, budget: Budget|None) -> str:
+    """
+    decompileBytes() within a time and memory budget. If it runs out, a diagnostic is reported and the disassembly
+    listing of the irep where it stopped (of the whole file if it stopped while parsing) is returned instead, as comments.
+    """
+    try:
+        with enforceBudget(budget):
+            return decompileBytes(data)
+    except BudgetExceeded as e:
+        report("error", "budgetExceeded", str(e), e.irepPath, e.pc)
+        from disassembler import disassembleBytes
+        listing = disassembleBytes(bytes(data), e.irepPath)
+        return "\n".join([f"# {e}, disassembly instead:"] + [f"# {line}" if line else "#" for line in listing])
+
+def decompileToSink(data: BytesLike, sink: BinaryIO|Callable[[bytes], Any]) -> None:
+    """Decompiles an in-memory mrb binary and streams the encoded source expression by expression into `sink`
+    (a binary file like object or a write callback)."""
+    write = sink if callable(sink) else sink.write
+    codeGen = decompileToCodeGen(data)
+    with profileStage("render"):
+        codeGen.writeTo(lambda text: write(text.encode(ENCODING, "ignore")))
+
+def decompileDefinition(data: BytesLike, qualifiedName: str) -> str:
+    """
+    Decompiles only one method, class or module of an mrb binary, by its qualified name ("Class#method",
+    "Class.singletonMethod", "Mod::Class", "Object#topLevelMethod"). The definition is found with a scan of the
+    raw irep tree and only its body irep is parsed and decompiled, so the time doesn't depend on the rest of the file.
+    """
+    root = readRawIreps(data)
+    structure = FileStructure(root, False, definitionSymbol(qualifiedName))
+    definitions = [d for d in structure.find(qualifiedName) if d.kind != "block" and d.bodyPath is not None]
+    if not definitions:
+        raise Exception(f"{qualifiedName} is not defined")
+    # a class can be reopened or a method redefined
+    return "\n".join(_decompileDefinition(data, structure, d) for d in definitions)
+
+def _decompileDefinition(data: BytesLike, structure: FileStructure, definition: Definition) -> str:
+    root = structure.ireps["/"]
+    definingIrep = structure.ireps[definition.irepPath]
+    bodyI = next(i for i, child in enumerate(definingIrep.children) if child.path == definition.bodyPath)
+    irep, lvars = readIrepSubtree(data, root, definition.irepPath, False)
+    body, bodyLvars = readIrepSubtree(data, root, definition.bodyPath)
+    # only the body gets parsed, all other children stay empty
+    irep.childIreps = [body if i == bodyI else None for i in range(irep.numChildIreps)]
+    lvars.childLvars = [bodyLvars if i == bodyI else None for i in range(irep.numChildIreps)]
+
+    localRegisters = { lvar.symbolRegister for lvar in lvars.lvarRecords }
+    pcs = definitionSlice(definingIrep, definitionEnd(definingIrep, definition), localRegisters)
+    scope = structure.scopes[definition.irepPath]
+    if scope.definition == -1:
+        currentClass = MainClass(0)
+    else:
+        currentClass = ClassSymbolEx(0, SymbolEx(0, scope.className.split("::")[-1]), None, scope.isSingleton)
+    codeGen = instructionsToRb(irep, lvars, pcs, currentClass)
+    # everything before the definition itself is only set up
+    with profileStage("render"):
+        return render(codeGen.getExpressions()[-1])
+
+def _decompileItem(name: str, data: BytesLike, profileOptions: ProfileOptions|None = None, collectDiagnostics: bool = False,
+                   budget: Budget|None = None) -> Tuple[str, DecompileResult, FileProfile|None, List[Diagnostic]|None]:
+    if not collectDiagnostics:
+        return _profileItem(name, data, profileOptions, budget) + (None,)
+    with collectFile() as diagnostics:
+        name, result, profile = _profileItem(name, data, profileOptions, budget)
+        if isinstance(result, Exception):
+            reportException(result)
+    return name, result, profile, diagnostics
+
+def _profileItem(name: str, data: BytesLike, profileOptions: ProfileOptions|None,
+                 budget: Budget|None) -> Tuple[str, DecompileResult, FileProfile|None]:
+    if profileOptions is None:
+        try:
+            return name, decompileWithBudget(data, budget), None
+        except Exception as e:
+            return name, e, None
+    with recordFile(name, profileOptions) as profile:
+        try:
+            result: DecompileResult = decompileWithBudget(data, budget)
+        except Exception as e:
+            result = e
+    return name, result, profile
+
+def decompileMany(items: Iterable[Tuple[str, BytesLike]], workers: int = 0, executor: Executor|None = None,
+                  profiler: Profiler|None = None, diagnostics: DiagnosticsCollector|None = None,
+                  budget: Budget|None = None, threads: bool = False) -> Iterator[Tuple[str, DecompileResult]]:
+    """
+    Lazily decompiles (name, bytes) pairs and yields (name, source | exception) in input order.
+    With workers > 0 (or an explicit executor) files are decompiled in parallel, in worker processes or with
+    threads = True in a thread pool (the decompiler shares no mutable state, on free-threaded Python the threads
+    run in parallel). At most 2 * workers files are in flight at once, so the input iterable is only consumed as
+    fast as results are taken.
+    If a profiler is given, every file gets profiled, also inside of worker processes. The same goes for the
+    diagnostics of every file (and its exception), they are added to `diagnostics` when the file is taken.
+    With a budget, a file that runs out of time or memory yields a disassembly listing instead (see decompileWithBudget()).
+    In threads, the memory budget and traced allocations count the memory of the whole process.
+    """
+    profileOptions = profiler.options if profiler is not None else None
+    collectDiagnostics = diagnostics is not None
+
+    def finish(itemResult: Tuple[str, DecompileResult, FileProfile|None, List[Diagnostic]|None]) -> Tuple[str, DecompileResult]:
+        name, result, profile, fileDiagnostics = itemResult
+        if profile is not None:
+            profiler.addProfile(profile)
+        if fileDiagnostics is not None:
+            diagnostics.addFile(name, fileDiagnostics)
+        return name, result
+
+    if workers <= 0 and executor is None:
+        for name, data in items:
+            yield finish(_decompileItem(name, data, profileOptions, collectDiagnostics, budget))
+        return
+
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+    ownsExecutor = executor is None
+    if executor is None:
+        executor = ThreadPoolExecutor(max_workers=workers) if threads else ProcessPoolExecutor(max_workers=workers)
+    inThreads = isinstance(executor, ThreadPoolExecutor)
+    maxInFlight = max(workers, 1) * 2
+    pending: Deque[Future] = deque()
+    try:
+        for name, data in items:
+            if inThreads:
+                # every file gets a copy of the caller's context, with its settings (superinstructionsEnabled, ...)
+                context = contextvars.copy_context()
+                pending.append(executor.submit(context.run, _decompileItem, name, data, profileOptions, collectDiagnostics, budget))
+            else:
+                # memoryviews can't be pickled
+                if isinstance(data, memoryview):
+                    data = data.tobytes()
+                pending.append(executor.submit(_decompileItem, name, data, profileOptions, collectDiagnostics, budget))
+            if len(pending) >= maxInFlight:
+                yield finish(pending.popleft().result())
+        while pending:
+            yield finish(pending.popleft().result())
+    finally:
+        for future in pending:
+            future.cancel()
+        if ownsExecutor:
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,155 @@
+from __future__ import annotations
+import sys
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, TextIO, Tuple
+
+# most severe first
+SEVERITIES = ["error", "warning", "info"]
+
+class Diagnostic:
+	"""Something the decompiler couldn't map to ruby code, or a file that failed"""
+	severity: str
+	kind: str					# short machine readable name, for example unexpectedJmp, jmpFallback, exception
+	message: str
+	file: str|None
+	irepPath: str|None			# "/" for the root, "/2/0" for the first child of the third child
+	pc: int|None
+	opcode: str|None
+	details: str|None			# traceback of exceptions
+
+	def __init__(self, severity: str, kind: str, message: str, irepPath: str|None = None, pc: int|None = None,
+				 opcode: str|None = None, details: str|None = None):
+		self.severity = severity
+		self.kind = kind
+		self.message = message
+		self.file = None
+		self.irepPath = irepPath
+		self.pc = pc
+		self.opcode = opcode
+		self.details = details
+
+	def location(self) -> str:
+		if self.irepPath is None:
+			return ""
+		return f"{self.irepPath}:{self.pc}" if self.pc is not None else self.irepPath
+
+	def toJson(self) -> Dict[str, Any]:
+		return {
+			"severity": self.severity,
+			"kind": self.kind,
+			"file": self.file,
+			"irepPath": self.irepPath,
+			"pc": self.pc,
+			"opcode": self.opcode,
+			"message": self.message,
+			"details": self.details,
+		}
+
+_activeDiagnostics: ContextVar[List[Diagnostic]|None] = ContextVar("activeDiagnostics", default=None)
+
+def report(severity: str, kind: str, message: str, irepPath: str|None = None, pc: int|None = None,
+		   opcode: str|None = None, details: str|None = None) -> None:
+	"""Adds a diagnostic to the file that is collected right now (see collectFile()), otherwise it is dropped"""
+	diagnostics = _activeDiagnostics.get()
+	if diagnostics is not None:
+		diagnostics.append(Diagnostic(severity, kind, message, irepPath, pc, opcode, details))
+
+def reportException(e: BaseException) -> None:
+	import traceback
+	report("error", "exception", f"{type(e).__name__}: {e}", details="".join(traceback.format_exception(type(e), e, e.__traceback__)))
+
+@contextmanager
+def collectFile() -> Iterator[List[Diagnostic]]:
+	"""Collects all diagnostics reported inside this block, also works inside of worker processes"""
+	diagnostics: List[Diagnostic] = []
+	token = _activeDiagnostics.set(diagnostics)
+	try:
+		yield diagnostics
+	finally:
+		_activeDiagnostics.reset(token)
+
+class DiagnosticsCollector:
+	"""
+	Diagnostics of a whole run, by file. Every file is added (and echoed) at once when it is done, so the output of
+	parallel runs doesn't interleave. Nothing is printed with echo = False.
+	"""
+	files: Dict[str, List[Diagnostic]]
+	echo: bool
+	out: TextIO|None
+
+	def __init__(self, echo: bool = True, out: TextIO|None = None):
+		self.files = {}
+		self.echo = echo
+		self.out = out
+
+	@contextmanager
+	def file(self, name: str) -> Iterator[List[Diagnostic]]:
+		"""Collects the diagnostics of the file `name` in this block"""
+		with collectFile() as diagnostics:
+			try:
+				yield diagnostics
+			except Exception as e:
+				reportException(e)
+				raise
+			finally:
+				self.addFile(name, diagnostics)
+
+	def addFile(self, name: str, diagnostics: List[Diagnostic]) -> None:
+		for diagnostic in diagnostics:
+			diagnostic.file = name
+		self.files.setdefault(name, []).extend(diagnostics)
+		if self.echo and diagnostics:
+			print(self.fileText(name, diagnostics), file=self.out or sys.stdout)
+
+	def diagnostics(self) -> Iterator[Diagnostic]:
+		for diagnostics in self.files.values():
+			yield from diagnostics
+
+	def fileText(self, name: str, diagnostics: List[Diagnostic]) -> str:
+		"""Identical messages are only listed once, with their count and first location"""
+		lines = [f"{name}: {self.countsText(diagnostics)}"]
+		groups: Dict[Tuple[str, str, str], List[Diagnostic]] = {}
+		for diagnostic in diagnostics:
+			groups.setdefault((diagnostic.severity, diagnostic.kind, diagnostic.message), []).append(diagnostic)
+		for (severity, _, message), group in sorted(groups.items(), key=lambda item: SEVERITIES.index(item[0][0])):
+			count = f" ({len(group)}x)" if len(group) > 1 else ""
+			location = group[0].location()
+			lines.append(f"  {severity}{' at ' + location if location else ''}: {message}{count}")
+		return "\n".join(lines)
+
+	def countsText(self, diagnostics: List[Diagnostic]) -> str:
+		counts = self.countBy(diagnostics, lambda d: d.severity)
+		return ", ".join(f"{counts[severity]} {severity}{'s' if counts[severity] != 1 else ''}" for severity in SEVERITIES if severity in counts)
+
+	def countBy(self, diagnostics, key) -> Dict[str, int]:
+		counts: Dict[str, int] = {}
+		for diagnostic in diagnostics:
+			counts[key(diagnostic)] = counts.get(key(diagnostic), 0) + 1
+		return counts
+
+	def summary(self) -> Dict[str, Any]:
+		diagnostics = list(self.diagnostics())
+		filesWithDiagnostics = [name for name, fileDiagnostics in self.files.items() if fileDiagnostics]
+		return {
+			"files": len(self.files),
+			"filesWithDiagnostics": len(filesWithDiagnostics),
+			"severities": self.countBy(diagnostics, lambda d: d.severity),
+			"kinds": self.countBy(diagnostics, lambda d: d.kind),
+			"failedFiles": [name for name in filesWithDiagnostics if any(d.kind == "exception" for d in self.files[name])],
+		}
+
+	def summaryText(self) -> str:
+		summary = self.summary()
+		if summary["filesWithDiagnostics"] == 0:
+			return f"No diagnostics in {summary['files']} files"
+		kinds = ", ".join(f"{kind} {count}" for kind, count in sorted(summary["kinds"].items(), key=lambda item: -item[1]))
+		return (f"Diagnostics: {self.countsText(list(self.diagnostics()))} in {summary['filesWithDiagnostics']}/{summary['files']} files "
+				f"({kinds}), {len(summary['failedFiles'])} files failed")
+
+	def writeJsonLines(self, path: str) -> None:
+		"""One JSON object per diagnostic"""
+		import json
+		with open(path, "w", encoding="utf-8") as f:
+			for diagnostic in self.diagnostics():
+				f.write(json.dumps(diagnostic.toJson()) + "\n")
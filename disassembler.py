@@ -0,0 +1,118 @@
+"""
+Annotated bytecode listing of mrb files, for when the decompiled output can't be trusted (for example `raise "ERROR: Unexpected JMP"`).
+
+Every irep is listed with its position in the irep tree, followed by one line per instruction: pc, MrbCode.__str__ and
+the resolved symbol, pool value, child irep or jump target. Jump targets are marked with ">" and instructions that
+markDeadCode() wouldn't reach with "x". No expressions are built, the listing is streamed to stdout or a file.
+
+python disassembler.py <file or folder> ... [--out listing.txt] [--irep /2/0] [--workers 8]
+"""
+from __future__ import annotations
+import argparse
+import functools
+import os
+import sys
+import time
+from itertools import repeat
+from typing import Iterator, List, TextIO
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+from corpusAnalyzer import CHUNK_SIZE, chunks, findFiles
+from mrbParser import RawIrep, iterRawIreps, readRawIreps
+from opcodes import CHILD_IREP_OPERANDS, JUMP_OPCODES, POOL_OPERANDS, SYMBOL_OPERANDS, getMrbCode, rawJumpTarget, rawOperand, rawReachable
+
+# width of the MrbCode.__str__ column
+CODE_WIDTH = 48
+
+# distinct raw instructions whose MrbCode.__str__ is kept, most instructions repeat a lot across a corpus
+CODE_TEXT_CACHE_SIZE = 1 << 14
+
+@functools.lru_cache(maxsize=CODE_TEXT_CACHE_SIZE)
+def codeText(code: int) -> str:
+    """MrbCode.__str__ of a raw instruction. Bounded and thread safe, the budget fallback lists files on worker threads."""
+    return str(getMrbCode(code))
+
+def annotation(irep: RawIrep, pc: int, code: int) -> str:
+    opcode = code & 0x7f
+    if opcode in JUMP_OPCODES:
+        return f"-> {rawJumpTarget(code, pc)}"
+    operand = SYMBOL_OPERANDS.get(opcode)
+    if operand is not None:
+        index = rawOperand(code, operand)
+        return f":{irep.symbols[index]}" if index < len(irep.symbols) else f"symbol {index} out of range"
+    operand = POOL_OPERANDS.get(opcode)
+    if operand is not None:
+        index = rawOperand(code, operand)
+        return repr(irep.pools[index].decode("utf-8", "replace")) if index < len(irep.pools) else f"pool {index} out of range"
+    operand = CHILD_IREP_OPERANDS.get(opcode)
+    if operand is not None:
+        index = rawOperand(code, operand)
+        return f"irep {irep.childPath(index)}" if index < len(irep.children) else f"irep {index} out of range"
+    return ""
+
+def disassembleIrep(irep: RawIrep) -> Iterator[str]:
+    yield (f"irep {irep.path}  locals: {irep.numLocalVariables}  registers: {irep.numRegisterVariables}  "
+           f"iseq: {len(irep.iseq)}  pools: {len(irep.pools)}  symbols: {len(irep.symbols)}  children: {len(irep.children)}")
+    if irep.lvars:
+        yield "  lvars: " + " ".join(f"{name or '_'}=r{register}" for name, register in irep.lvars)
+    reachable = rawReachable(irep.iseq)
+    targets = { rawJumpTarget(code, pc) for pc, code in enumerate(irep.iseq) if code & 0x7f in JUMP_OPCODES }
+    for pc, code in enumerate(irep.iseq):
+        marker = (">" if pc in targets else " ") + (" " if reachable[pc] else "x")
+        text = codeText(code)
+        note = annotation(irep, pc, code)
+        yield f"{marker} {pc:>5}  {text:<{CODE_WIDTH}}  ; {note}" if note else f"{marker} {pc:>5}  {text}"
+    yield ""
+
+def disassembleBytes(data: bytes, irepPath: str|None = None) -> Iterator[str]:
+    """Listing lines of all ireps of a mrb binary, or only of the irep at irepPath"""
+    for irep in iterRawIreps(readRawIreps(data, readLvars=True)):
+        if irepPath is None or irep.path == irepPath:
+            yield from disassembleIrep(irep)
+
+def disassembleChunk(files: List[str], irepPath: str|None) -> List[str]:
+    listings = []
+    for file in files:
+        try:
+            with open(file, "rb") as f:
+                lines = list(disassembleBytes(f.read(), irepPath))
+            listings.append(f"# {file}\n" + "\n".join(lines) + "\n")
+        except Exception as e:
+            listings.append(f"# {file}\n# Error: {type(e).__name__}: {e}\n\n")
+    return listings
+
+def disassembleFiles(files: List[str], out: TextIO, workers: int = 0, irepPath: str|None = None) -> None:
+    """Writes the listings of all files to out, in order, as soon as the chunk of a file is done"""
+    if workers > 0 and len(files) > CHUNK_SIZE:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for listings in executor.map(disassembleChunk, chunks(files, CHUNK_SIZE), repeat(irepPath)):
+                out.writelines(listings)
+        return
+    for file in files:
+        out.writelines(disassembleChunk([file], irepPath))
+
+def main():
+    parser = argparse.ArgumentParser(description="Annotated bytecode listing of mrb files")
+    parser.add_argument("paths", nargs="+", help="mrb files or folders")
+    parser.add_argument("--ext", default="_scp.bin,.mrb", help="comma separated file endings, for folders")
+    parser.add_argument("--out", help="write the listing to this file instead of stdout")
+    parser.add_argument("--irep", help="only list the irep at this path, for example /2/0")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    t1 = time.time()
+    files = []
+    for path in args.paths:
+        files.extend(findFiles(path, args.ext.split(",")) if os.path.isdir(path) else [path])
+    workers = args.workers if args.workers > 1 else 0
+    if args.out:
+        with open(args.out, "w", encoding="utf-8", buffering=1 << 20) as f:
+            disassembleFiles(files, f, workers, args.irep)
+        print(f"Disassembled {len(files)} files in {time.time() - t1:.2f}s")
+    else:
+        disassembleFiles(files, sys.stdout, workers, args.irep)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+v1 = someRand()
+v2 = someRand()
+v3 = someRand()
+v4 = someRand()
+var = v1 && v2
+var = v1 || v2
+var = v1 && v2 || v3
+var = v1 && (v2 || v3)
+var = v1 && (v2 || v3) && v4
+var = v1 && (v2 || v4) && v3 || var
+# STOP
\ No newline at end of file
@@ -0,0 +1,25 @@
+v1 = someRand()
+
+case v1
+when (1) === v1, (2) === v1, rand1(), rand() === v1, (4) === v1
+	var = []
+when (2) === v1, (3) === v1
+	var = v1 + 2
+when (4) === v1
+	var = v1 || nil
+else
+	var = v1
+end
+
+puts("yep")
+
+case
+when someFun()
+	var = v1
+when someFun2()
+	var = []
+end
+
+x = []
+puts(var)
+# STOP
\ No newline at end of file
@@ -0,0 +1,74 @@
+nil
+module MyMod
+	nil
+	module NestedMod
+		nil
+		nil
+		class Class1
+			nil
+		end
+		
+	end
+	
+end
+
+nil
+nil
+class Class2
+	def printHello()
+		self.puts("Hello")
+	end
+	
+	:printHello
+end
+
+nil
+class Class3 < Class2
+	def test()
+		x = 1
+		y = 2
+		self.puts(x + y)
+	end
+	
+	:test
+end
+
+nil
+nil
+class Class4
+	@@y = 2
+	def initialize()
+		@x = 1
+	end
+	
+	def test()
+		self.puts(@x + @@y)
+	end
+	
+	:test
+end
+
+nil
+nil
+class Class5
+	def self.single()
+		nil
+	end
+	
+	:single
+end
+
+test = Class5.new()
+def test.single2()
+	nil
+end
+
+class << test
+	def single3()
+		nil
+	end
+	
+	:single3
+end
+
+# STOP
\ No newline at end of file
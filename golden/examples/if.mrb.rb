@@ -0,0 +1,28 @@
+v1 = someRand()
+v2 = someRand()
+x = []
+if v1
+	puts(1)
+end
+x = []
+if v1
+	puts(2)
+else
+	puts(3)
+end
+x = []
+if v1
+	puts(4)
+	if v2
+		puts(44)
+	else
+		puts(55)
+	end
+else
+	if v2
+		puts(5)
+	else
+		puts(6)
+	end
+end
+# STOP
\ No newline at end of file
@@ -0,0 +1,46 @@
+def printHello()
+	puts("Hello")
+end
+
+def notA(a)
+	!a
+end
+
+def aPlusB(a, b)
+	res = a + b
+	res + 1
+end
+
+def aPlusBPlusC(a, b, c)
+	res = a + b + c
+end
+
+def aMultB(a, aa, aaa, b = 1.0, c = 2.0)
+	res = a * b
+end
+
+def printAll(prefix, *args)
+	args.each() { |arg| puts("#{prefix} #{arg}") }
+end
+
+def methodWithBlockParam(a, b, &block)
+	block.call(a, b)
+end
+
+offset = 2
+(1..3).each() { |i| puts(i + offset) }
+(1..3).each() { puts() }
+(1...3).each() { |i| puts("YEP#{i}") }
+(1...3).each() { puts() }
+myHash = {
+	"a" => 1,
+	:b => 2,
+	"c" => 3,
+}
+(1..5).each() { |i| puts(i) }
+myHash.each() { |k, v| 
+	puts("#{k} => #{v + offset}")
+	offset = offset + 1
+}
+myHash.each() { |k, v| puts("#{k} => #{v + offset}") }
+# STOP
\ No newline at end of file
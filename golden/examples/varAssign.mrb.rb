@@ -0,0 +1,20 @@
+ar = [ 1, 2, "3", 1, 2, "3", 1, 2, "3", 1, 2, "3" ]
+x = 4 == false
+y = 4 <= 5
+myInt1 = 12
+myInt2 = myInt1 + 3
+myInt2 = -myInt2
+myFloat = 1123.456 / 1.25e-10
+mySym = :xyz
+a = self
+b = true & false
+myStr = "Hello " + "World"
+myInt1 = myInt1 + 12
+myInt2 = myInt2 + (myInt1 ** (2) / 2) ** (1)
+myInt1 = myInt1 * 3 + 4
+concatStr = "C: #{myInt1} #{myInt2} #{myStr}"
+MyMod::SomeConst = 42
+puts()
+puts(concatStr)
+puts(MyMod::SomeConst)
+# STOP
\ No newline at end of file
@@ -0,0 +1,54 @@
+x = 1 + 2
+until x == 3
+	puts(x)
+	x = x + 1
+end
+while MyMod::X < 42 && rand() < 0.5 || x == 3
+	puts("Hello World")
+end
+while x < 10
+	puts(x)
+	x = x + 1
+	if x == 6
+		next
+	end
+end
+while x < 20
+	if x == 15
+		break
+	end
+end
+while true
+	(1..10).each() { |i| 
+		if i == 5
+			while i < 10
+				puts(i)
+				i = i + 1
+			end
+		end
+		puts(i)
+	}
+end
+def test()
+	if rand()
+		return
+	end
+	(1..10).each() { |i| 
+		if i == 5
+			nil
+			next
+		else
+			if i == 8
+				break
+			else
+				if i == 9
+					return
+				end
+			end
+		end
+		puts(i)
+	}
+end
+
+:test
+# STOP
\ No newline at end of file
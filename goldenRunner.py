@@ -0,0 +1,198 @@
+"""
+Golden output regression runner.
+
+Decompiles every mrb file of one or more corpus folders (in parallel) and compares the results against stored golden .rb files.
+Only mismatches are shown as unified diffs. Decompile times are compared against the times stored with the goldens,
+so output changes and performance regressions show up in the same run. A corpus file without golden and a golden
+whose corpus file is gone fail the run like a changed output, --update records the new file or drops the golden.
+
+python goldenRunner.py [corpusDir ...] [--goldenDir golden] [--workers 4] [--update] [--updateTimes]
+
+Golden files of a corpus are stored in <goldenDir>/<corpus path>/, next to a manifest.json with hashes and times. The corpus
+path is relative to the repository for corpora inside of it (golden/examples/), otherwise it's the absolute path without
+the root or drive (golden/data/extracted/ for /data/extracted), so corpora with the same folder name don't share goldens.
+"""
+from __future__ import annotations
+import argparse
+import difflib
+import hashlib
+import json
+import os
+import sys
+from typing import Dict, Iterator, List, Tuple
+
+ROOT = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(ROOT)
+
+from decompileAll import findMrbFiles
+from decompiler import decompileMany
+from profiling import Profiler
+from utils import ENCODING
+
+MANIFEST_NAME = "manifest.json"
+DEFAULT_CORPUS = os.path.join(ROOT, "examples")
+DEFAULT_GOLDEN_DIR = os.path.join(ROOT, "golden")
+
+def hashText(text: str) -> str:
+    return hashlib.sha1(text.encode(ENCODING, "ignore")).hexdigest()
+
+def corpusKey(corpusDir: str) -> str:
+    """Folder of the corpus' goldens, relative to the golden dir"""
+    path = os.path.realpath(corpusDir)
+    if os.path.commonpath([path, ROOT]) == ROOT:
+        return os.path.relpath(path, ROOT)
+    drive, path = os.path.splitdrive(path)
+    return os.path.join(drive.replace(":", ""), path.lstrip(os.sep))
+
+class GoldenCorpus:
+    corpusDir: str
+    goldenDir: str
+    manifest: Dict[str, Dict]
+
+    def __init__(self, corpusDir: str, goldenRoot: str) -> None:
+        self.corpusDir = corpusDir
+        self.goldenDir = os.path.join(goldenRoot, corpusKey(corpusDir))
+        manifestPath = os.path.join(self.goldenDir, MANIFEST_NAME)
+        if os.path.exists(manifestPath):
+            with open(manifestPath, "r", encoding="utf-8") as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {}
+
+    def relPath(self, file: str) -> str:
+        return os.path.relpath(file, self.corpusDir).replace("\\", "/")
+
+    def goldenPath(self, relPath: str) -> str:
+        return os.path.join(self.goldenDir, relPath + ".rb")
+
+    def readGolden(self, relPath: str) -> str:
+        with open(self.goldenPath(relPath), "r", encoding=ENCODING) as f:
+            return f.read()
+
+    def writeGolden(self, relPath: str, text: str) -> None:
+        path = self.goldenPath(relPath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(text.encode(ENCODING, "ignore"))
+
+    def removeGolden(self, relPath: str) -> None:
+        del self.manifest[relPath]
+        if os.path.exists(self.goldenPath(relPath)):
+            os.remove(self.goldenPath(relPath))
+
+    def saveManifest(self) -> None:
+        os.makedirs(self.goldenDir, exist_ok=True)
+        with open(os.path.join(self.goldenDir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+
+def readCorpora(corpora: List[GoldenCorpus]) -> Iterator[Tuple[str, bytes]]:
+    for corpus in corpora:
+        for file in findMrbFiles(corpus.corpusDir):
+            with open(file, "rb") as f:
+                yield file, f.read()
+
+def formatDelta(oldTime: float|None, newTime: float) -> str:
+    if oldTime is None:
+        return f"{newTime*1000:8.1f}ms (new)"
+    delta = newTime - oldTime
+    relative = delta / oldTime * 100 if oldTime > 0 else 0
+    return f"{newTime*1000:8.1f}ms ({'+' if delta >= 0 else ''}{delta*1000:.1f}ms, {'+' if relative >= 0 else ''}{relative:.0f}%)"
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare decompiler outputs against stored golden files")
+    parser.add_argument("corpora", nargs="*", default=[DEFAULT_CORPUS], help="folders with mrb files (default examples/)")
+    parser.add_argument("--goldenDir", default=DEFAULT_GOLDEN_DIR)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--update", action="store_true", help="store the current outputs and times as the new goldens")
+    parser.add_argument("--updateTimes", action="store_true", help="only store the current times")
+    parser.add_argument("--slowdown", type=float, default=0.25, help="relative slowdown that gets reported")
+    parser.add_argument("--quiet", action="store_true", help="don't print diffs")
+    args = parser.parse_args()
+
+    corpora = [GoldenCorpus(corpusDir, args.goldenDir) for corpusDir in args.corpora]
+    def corpusOf(file: str) -> GoldenCorpus:
+        for corpus in corpora:
+            if os.path.commonpath([os.path.abspath(file), os.path.abspath(corpus.corpusDir)]) == os.path.abspath(corpus.corpusDir):
+                return corpus
+        raise Exception(f"No corpus for {file}")
+
+    profiler = Profiler()
+    matches = 0
+    mismatches: List[str] = []
+    missing: List[str] = []
+    errors: List[str] = []
+    slower: List[str] = []
+    seen: Dict[GoldenCorpus, set] = { corpus: set() for corpus in corpora }
+    workers = args.workers if args.workers > 1 else 0
+    for file, result in decompileMany(readCorpora(corpora), workers, profiler=profiler):
+        corpus = corpusOf(file)
+        relPath = corpus.relPath(file)
+        seen[corpus].add(relPath)
+        newTime = profiler.files[-1].totalTime
+        entry = corpus.manifest.get(relPath)
+        oldTime = entry.get("time") if entry else None
+        if isinstance(result, Exception):
+            errors.append(f"{file}: {result}")
+            continue
+        newHash = hashText(result)
+
+        if args.update:
+            corpus.writeGolden(relPath, result)
+            corpus.manifest[relPath] = { "hash": newHash, "time": newTime }
+            continue
+        if args.updateTimes:
+            if entry is not None:
+                entry["time"] = newTime
+            continue
+
+        if entry is None:
+            missing.append(file)
+        elif entry["hash"] == newHash:
+            matches += 1
+        else:
+            mismatches.append(file)
+            if not args.quiet:
+                golden = corpus.readGolden(relPath)
+                diff = difflib.unified_diff(golden.splitlines(), result.splitlines(), f"golden/{relPath}.rb", f"{file}.rb", lineterm="")
+                print("\n".join(diff))
+                print()
+        if oldTime is not None and newTime > oldTime * (1 + args.slowdown):
+            slower.append(f"{file}: {formatDelta(oldTime, newTime)}")
+        print(f"{'OK  ' if entry is not None and entry['hash'] == newHash else 'FAIL'} {formatDelta(oldTime, newTime)}  {file}")
+
+    # goldens of files that were deleted from the corpus since they were recorded
+    deleted = [(corpus, relPath) for corpus in corpora for relPath in sorted(corpus.manifest) if relPath not in seen[corpus]]
+    if args.update or args.updateTimes:
+        for corpus, relPath in deleted:
+            if args.update:
+                corpus.removeGolden(relPath)
+        for corpus in corpora:
+            corpus.saveManifest()
+        if args.update and deleted:
+            print(f"Removed the goldens of {len(deleted)} deleted files")
+        print(f"Updated goldens of {len(profiler.files)} files")
+        return
+
+    print(f"\n{matches} matching, {len(mismatches)} changed, {len(missing)} without golden, {len(deleted)} deleted, {len(errors)} errors")
+    for file in missing:
+        print(f"  no golden: {file}")
+    for corpus, relPath in deleted:
+        print(f"  deleted: {os.path.join(corpus.corpusDir, relPath)}")
+    if missing or deleted:
+        print("  (run with --update to record them)")
+    for error in errors:
+        print(f"  error: {error}")
+    if slower:
+        print(f"\n{len(slower)} files are more than {args.slowdown*100:.0f}% slower:")
+        for line in slower:
+            print(f"  {line}")
+    totalOld = 0.0
+    for profile in profiler.files:
+        corpus = corpusOf(profile.name)
+        totalOld += corpus.manifest.get(corpus.relPath(profile.name), {}).get("time", 0)
+    totalNew = sum(f.totalTime for f in profiler.files)
+    print(f"\nTotal decompile time: {formatDelta(totalOld or None, totalNew)}")
+    sys.exit(1 if mismatches or missing or deleted or errors else 0)
+
+if __name__ == "__main__":
+    main()
@@ -38,7 +38,7 @@ def read_string(file, maxLen = -1) -> str:
     binaryString = b""
     while maxLen == -1 or len(binaryString) < maxLen:
         char = file.read(1)
-        if char == b'\x00':
+        if char == b'\x00' or char == b'':
             break
         binaryString += char
     return binaryString.decode('utf-8', 'ignore')
@@ -0,0 +1,252 @@
+"""
+Columnar export of every instruction of a corpus, for offline analysis with NumPy.
+
+The dump is a folder of .npy files (so that they can be memory mapped on load) plus a meta.json:
+
+per instruction:    fileId, irepId, pc, opcode, A, B, C, Bx, sBx, raw
+per irep:           irepFile, irepParent, irepStart, irepLen, irepNumRegs, irepNumLocals,
+                    irepSymStart, irepSymLen, irepPoolStart, irepPoolLen
+string tables:      symbolData + symbolOffsets, poolData + poolOffsets (utf-8 / raw bytes, offsets[i]:offsets[i+1])
+meta.json:          file names and irep paths
+
+python iseqExport.py <searchDir> <outDir> [--workers 8]
+
+    dump = InstructionDump.load("outDir")
+    epush = dump.opcode == AllOpCodes.OP_EPUSH
+    files = {dump.files[i] for i in np.unique(dump.fileId[epush])}
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+from corpusAnalyzer import chunks, findFiles
+from mrbParser import iterRawIreps, readRawIreps
+
+META_NAME = "meta.json"
+INSTRUCTION_COLUMNS = ["fileId", "irepId", "pc", "opcode", "A", "B", "C", "Bx", "sBx", "raw"]
+IREP_COLUMNS = ["irepFile", "irepParent", "irepStart", "irepLen", "irepNumRegs", "irepNumLocals",
+                "irepSymStart", "irepSymLen", "irepPoolStart", "irepPoolLen"]
+STRING_TABLES = ["symbol", "pool"]
+
+def requireNumpy():
+    """The numpy module, it's only imported once a dump is built or loaded"""
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("NumPy is required for instruction dumps (pip install numpy)") from None
+    return numpy
+
+# (path, parent index in the file, iseq bytes, register count, local count, symbols, pools)
+IrepRecord = Tuple[str, int, bytes, int, int, List[str], List[bytes]]
+
+def readFileIreps(file: str) -> List[IrepRecord]:
+    with open(file, "rb") as f:
+        root = readRawIreps(f.read())
+    ireps = list(iterRawIreps(root))
+    indexes = { id(irep): i for i, irep in enumerate(ireps) }
+    parents = [-1] * len(ireps)
+    for i, irep in enumerate(ireps):
+        for child in irep.children:
+            parents[indexes[id(child)]] = i
+    return [
+        (irep.path, parents[i], irep.iseq.tobytes(), irep.numRegisterVariables, irep.numLocalVariables, irep.symbols, irep.pools)
+        for i, irep in enumerate(ireps)
+    ]
+
+def readChunk(files: List[str]) -> List[Tuple[str, List[IrepRecord]|None, str|None]]:
+    results = []
+    for file in files:
+        try:
+            results.append((file, readFileIreps(file), None))
+        except Exception as e:
+            results.append((file, None, f"{type(e).__name__}: {e}"))
+    return results
+
+class _StringTableBuilder:
+    parts: List[bytes]
+    offsets: List[int]
+
+    def __init__(self) -> None:
+        self.parts = []
+        self.offsets = [0]
+
+    def add(self, value: bytes) -> None:
+        self.parts.append(value)
+        self.offsets.append(self.offsets[-1] + len(value))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def toArrays(self):
+        np = requireNumpy()
+        return np.frombuffer(b"".join(self.parts), dtype=np.uint8), np.array(self.offsets, dtype=np.int64)
+
+def buildColumns(files: List[str], workers: int = 0, baseDir: str|None = None) -> Tuple[Dict, Dict]:
+    """Reads all files and returns (columns, meta)"""
+    np = requireNumpy()
+    if workers > 0:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunkResults = list(executor.map(readChunk, chunks(files, 64)))
+    else:
+        chunkResults = [readChunk(files)]
+
+    fileNames: List[str] = []
+    errors: List[Dict] = []
+    irepPaths: List[str] = []
+    irepColumns: Dict[str, List[int]] = { name: [] for name in IREP_COLUMNS }
+    iseqParts: List[bytes] = []
+    symbols = _StringTableBuilder()
+    pools = _StringTableBuilder()
+    instructionCount = 0
+    for results in chunkResults:
+        for file, ireps, error in results:
+            if ireps is None:
+                errors.append({ "file": file, "error": error })
+                continue
+            fileId = len(fileNames)
+            fileNames.append(os.path.relpath(file, baseDir) if baseDir else file)
+            firstIrepId = len(irepPaths)
+            for path, parent, iseq, numRegs, numLocals, irepSymbols, irepPools in ireps:
+                iLen = len(iseq) // 4
+                irepPaths.append(path)
+                irepColumns["irepFile"].append(fileId)
+                irepColumns["irepParent"].append(firstIrepId + parent if parent >= 0 else -1)
+                irepColumns["irepStart"].append(instructionCount)
+                irepColumns["irepLen"].append(iLen)
+                irepColumns["irepNumRegs"].append(numRegs)
+                irepColumns["irepNumLocals"].append(numLocals)
+                irepColumns["irepSymStart"].append(len(symbols))
+                irepColumns["irepSymLen"].append(len(irepSymbols))
+                irepColumns["irepPoolStart"].append(len(pools))
+                irepColumns["irepPoolLen"].append(len(irepPools))
+                for symbol in irepSymbols:
+                    symbols.add(symbol.encode("utf-8"))
+                for pool in irepPools:
+                    pools.add(pool)
+                iseqParts.append(iseq)
+                instructionCount += iLen
+
+    # decode all operand fields at once
+    irepLens = np.array(irepColumns["irepLen"], dtype=np.int64)
+    raw = np.frombuffer(b"".join(iseqParts), dtype=np.uint32)
+    irepId = np.repeat(np.arange(len(irepPaths), dtype=np.uint32), irepLens)
+    irepStarts = np.array(irepColumns["irepStart"], dtype=np.int64)
+    columns = {
+        "raw": raw,
+        "irepId": irepId,
+        "fileId": np.array(irepColumns["irepFile"], dtype=np.uint32)[irepId] if len(irepId) else np.zeros(0, np.uint32),
+        "pc": (np.arange(len(raw), dtype=np.int64) - np.repeat(irepStarts, irepLens)).astype(np.uint32),
+        "opcode": (raw & 0x7f).astype(np.uint8),
+        "A": ((raw >> 23) & 0x1ff).astype(np.uint16),
+        "B": ((raw >> 14) & 0x1ff).astype(np.uint16),
+        "C": ((raw >> 7) & 0x7f).astype(np.uint8),
+        "Bx": ((raw >> 7) & 0xffff).astype(np.uint16),
+        "sBx": (((raw >> 7) & 0xffff).astype(np.int32) - 0x7fff),
+    }
+    for name in IREP_COLUMNS:
+        columns[name] = np.array(irepColumns[name], dtype=np.int64)
+    columns["symbolData"], columns["symbolOffsets"] = symbols.toArrays()
+    columns["poolData"], columns["poolOffsets"] = pools.toArrays()
+    meta = {
+        "baseDir": os.path.abspath(baseDir) if baseDir else None,
+        "files": fileNames,
+        "irepPaths": irepPaths,
+        "instructionCount": instructionCount,
+        "errors": errors,
+    }
+    return columns, meta
+
+def exportCorpus(files: List[str], outDir: str, workers: int = 0, baseDir: str|None = None) -> Dict:
+    """Writes the instruction dump of `files` to `outDir`. Returns the meta data."""
+    np = requireNumpy()
+    columns, meta = buildColumns(files, workers, baseDir)
+    os.makedirs(outDir, exist_ok=True)
+    for name, column in columns.items():
+        np.save(os.path.join(outDir, f"{name}.npy"), column)
+    with open(os.path.join(outDir, META_NAME), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    return meta
+
+class InstructionDump:
+    """
+    Instruction columns of a corpus. All columns are available as attributes (dump.opcode, dump.irepStart, ...).
+    Use InstructionDump.load() for a memory mapped dump from disk or InstructionDump.build() to read a corpus directly.
+    """
+    baseDir: str|None
+    files: List[str]
+    irepPaths: List[str]
+    errors: List[Dict]
+
+    def __init__(self, columns: Dict, meta: Dict) -> None:
+        self.baseDir = meta.get("baseDir")
+        self.files = meta["files"]
+        self.irepPaths = meta["irepPaths"]
+        self.errors = meta["errors"]
+        for name, column in columns.items():
+            setattr(self, name, column)
+
+    @staticmethod
+    def load(dumpDir: str) -> InstructionDump:
+        np = requireNumpy()
+        with open(os.path.join(dumpDir, META_NAME), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        columnNames = INSTRUCTION_COLUMNS + IREP_COLUMNS + [f"{table}{part}" for table in STRING_TABLES for part in ["Data", "Offsets"]]
+        columns = { name: np.load(os.path.join(dumpDir, f"{name}.npy"), mmap_mode="r") for name in columnNames }
+        return InstructionDump(columns, meta)
+
+    @staticmethod
+    def build(files: List[str], workers: int = 0, baseDir: str|None = None) -> InstructionDump:
+        return InstructionDump(*buildColumns(files, workers, baseDir))
+
+    def filePath(self, fileId: int) -> str:
+        file = self.files[fileId]
+        return os.path.join(self.baseDir, file) if self.baseDir else file
+
+    def __len__(self):
+        return len(self.raw)
+
+    def irepSlice(self, irepId: int) -> slice:
+        start = int(self.irepStart[irepId])
+        return slice(start, start + int(self.irepLen[irepId]))
+
+    def symbol(self, irepId: int, index: int) -> str:
+        """Symbol `index` of an irep's symbol table"""
+        i = int(self.irepSymStart[irepId]) + index
+        return bytes(self.symbolData[self.symbolOffsets[i] : self.symbolOffsets[i + 1]]).decode("utf-8", "ignore")
+
+    def symbols(self, irepId: int) -> List[str]:
+        return [self.symbol(irepId, i) for i in range(int(self.irepSymLen[irepId]))]
+
+    def pool(self, irepId: int, index: int) -> bytes:
+        i = int(self.irepPoolStart[irepId]) + index
+        return bytes(self.poolData[self.poolOffsets[i] : self.poolOffsets[i + 1]])
+
+    def location(self, instruction: int) -> str:
+        """file:irepPath:pc of an instruction"""
+        irepId = int(self.irepId[instruction])
+        return f"{self.files[int(self.fileId[instruction])]}:{self.irepPaths[irepId]}:{int(self.pc[instruction])}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Export all instructions of a corpus into memory mappable columns")
+    parser.add_argument("searchDir")
+    parser.add_argument("outDir")
+    parser.add_argument("--ext", default="_scp.bin,.mrb", help="comma separated file endings")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    t1 = time.time()
+    files = findFiles(args.searchDir, args.ext.split(","))
+    meta = exportCorpus(files, args.outDir, args.workers if args.workers > 1 else 0, args.searchDir)
+    for error in meta["errors"]:
+        print(f"Error in {error['file']}: {error['error']}")
+    print(f"Exported {meta['instructionCount']} instructions of {len(meta['files'])} files in {time.time() - t1:.2f}s to {args.outDir}")
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,13 @@
 from __future__ import annotations
-from typing import BinaryIO, List
+import io
+import struct
+import sys
+from array import array
+from typing import BinaryIO, Iterator, List, Tuple
+from budget import checkBudget
 from ioUtils import *
 from opcodes import MrbCode, getMrbCode, markDeadCode
+from profiling import profileStage
 
 class RiteBinaryHeader:
 	"""
@@ -108,42 +114,63 @@ class RiteIrepSection:
 
 	poolLen: int
 	pools: List[bytes]
+	# tt of every pool entry (0 string, 1 fixnum, 2 float)
+	poolTypes: List[int]
 
 	symbolsLen: int
 	symbols: List[str]
+	# indexes of symbols that are stored as null (0xffff) instead of a name, they are "" in symbols
+	nullSymbols: List[int]
 
 	childIreps: List[RiteIrepSection]
 
-	def __init__(self, file: BinaryIO) -> None:
-		self.recordSize = read_uint32(file)
-		self.numLocalVariables = read_uint16(file)
-		self.numRegisterVariables = read_uint16(file)
-		self.numChildIreps = read_uint16(file)
-		
-		self.iLen = read_uint32(file)
-		# align to 4 bytes
-		file.read((4 - (file.tell() & 3)) & 3)
-		self.mrbCodes = []
-		for i in range(self.iLen):
-			self.mrbCodes.append(getMrbCode(read_uint32(file)))
-		markDeadCode(self.mrbCodes, 0)
-		
-		self.poolLen = read_uint32(file)
-		self.pools = []
-		for i in range(self.poolLen):
-			read_uint8(file)	# tt
-			poolDataLen = read_uint16(file)
-			self.pools.append(file.read(poolDataLen))
+	def __init__(self, file: BinaryIO, readChildren: bool = True) -> None:
+		with profileStage("iseqDecode"):
+			self.recordSize = read_uint32(file)
+			self.numLocalVariables = read_uint16(file)
+			self.numRegisterVariables = read_uint16(file)
+			self.numChildIreps = read_uint16(file)
+
+			self.iLen = read_uint32(file)
+			# align to 4 bytes
+			file.read((4 - (file.tell() & 3)) & 3)
+			self.mrbCodes = []
+			for i in range(self.iLen):
+				self.mrbCodes.append(getMrbCode(read_uint32(file)))
+		with profileStage("markDeadCode"):
+			markDeadCode(self.mrbCodes, 0)
 		
-		self.symbolsLen = read_uint32(file)
-		self.symbols = []
-		for i in range(self.symbolsLen):
-			symbolNameLength = read_uint16(file)
-			self.symbols.append(read_string(file, symbolNameLength + 1) if symbolNameLength != 0xffff else "")
+		with profileStage("irepTables"):
+			self.poolLen = read_uint32(file)
+			self.pools = []
+			self.poolTypes = []
+			for i in range(self.poolLen):
+				self.poolTypes.append(read_uint8(file))
+				poolDataLen = read_uint16(file)
+				self.pools.append(file.read(poolDataLen))
+
+			self.symbolsLen = read_uint32(file)
+			self.symbols = []
+			self.nullSymbols = []
+			for i in range(self.symbolsLen):
+				symbolNameLength = read_uint16(file)
+				if symbolNameLength == 0xffff:
+					self.nullSymbols.append(i)
+				self.symbols.append(read_string(file, symbolNameLength + 1) if symbolNameLength != 0xffff else "")
 		
 		self.childIreps = []
-		for i in range(self.numChildIreps):
-			self.childIreps.append(RiteIrepSection(file))
+		if readChildren:
+			# children follow their parent depth first, read them with a stack instead of recursion
+			stack = [self]
+			while stack:
+				irep = stack[-1]
+				if len(irep.childIreps) == irep.numChildIreps:
+					stack.pop()
+					continue
+				checkBudget()
+				child = RiteIrepSection(file, False)
+				irep.childIreps.append(child)
+				stack.append(child)
 
 class RiteLvar:
 	"""
@@ -178,15 +205,25 @@ class RiteLvarRecord:
 	lvarRecords: List[RiteLvar]
 	childLvars: List[RiteLvarRecord]
 
-	def __init__(self, file: BinaryIO|None, irepSection: RiteIrepSection, symbols: List[str]) -> None:
+	def __init__(self, file: BinaryIO|None, irepSection: RiteIrepSection, symbols: List[str], readChildren: bool = True) -> None:
 		self.lvarRecords = []
 		self.childLvars = []
 		if file is not None:
 			for i in range(irepSection.numLocalVariables - 1):
 				self.lvarRecords.append(RiteLvar(file, symbols))
 
-			for i in range(irepSection.numChildIreps):
-				self.childLvars.append(RiteLvarRecord(file, irepSection.childIreps[i], symbols))
+			if readChildren:
+				# same order as the ireps, see RiteIrepSection
+				stack: List[Tuple[RiteLvarRecord, RiteIrepSection]] = [(self, irepSection)]
+				while stack:
+					record, irep = stack[-1]
+					if len(record.childLvars) == irep.numChildIreps:
+						stack.pop()
+						continue
+					childIrep = irep.childIreps[len(record.childLvars)]
+					child = RiteLvarRecord(file, childIrep, symbols, False)
+					record.childLvars.append(child)
+					stack.append((child, childIrep))
 
 class RiteIrepBlock:
 	"""
@@ -200,7 +237,8 @@ class RiteIrepBlock:
 	section: RiteIrepSection
 	
 	def __init__(self, file: BinaryIO) -> None:
-		self.header = RiteIrepSectionHeader(file)
+		with profileStage("header"):
+			self.header = RiteIrepSectionHeader(file)
 		self.section = RiteIrepSection(file)
 
 class RiteLvarBlock:
@@ -218,21 +256,27 @@ class RiteLvarBlock:
 	};
 	"""
 	header: RiteSectionHeader|None
+	symbols: List[str]
 	section: RiteLvarRecord
 	
 	def __init__(self, file: BinaryIO|None, irepSection: RiteIrepSection) -> None:
 		if file is not None:
 			self.header = RiteSectionHeader(file)
-			symbolsLen = read_uint32(file)
-			symbols = []
-			for i in range(symbolsLen):
-				strLen = read_uint16(file)
-				symbols.append(read_string(file, strLen))
-			self.section = RiteLvarRecord(file, irepSection, symbols)
+			self.symbols = readLvarSymbols(file)
+			self.section = RiteLvarRecord(file, irepSection, self.symbols)
 		else:
 			self.header = None
+			self.symbols = []
 			self.section = RiteLvarRecord(None, irepSection, [])
 
+def readLvarSymbols(file: BinaryIO) -> List[str]:
+	symbolsLen = read_uint32(file)
+	symbols = []
+	for i in range(symbolsLen):
+		strLen = read_uint16(file)
+		symbols.append(read_string(file, strLen))
+	return symbols
+
 class RiteFooter:
 	"""
 	struct RiteFooter
@@ -255,13 +299,173 @@ class RiteFile:
 	footer: RiteFooter
 
 	def __init__(self, file: BinaryIO) -> None:
-		self.header = RiteBinaryHeader(file)
+		with profileStage("header"):
+			self.header = RiteBinaryHeader(file)
 		remainingSize = self.header.binarySize - 0x16
 		size1 = file.tell()
 		self.irepBlock = RiteIrepBlock(file)
 		remainingSize -= file.tell() - size1
-		if remainingSize > 0x8:
-			self.lvarBlock = RiteLvarBlock(file, self.irepBlock.section)
-		else:
-			self.lvarBlock = RiteLvarBlock(None, self.irepBlock.section)
-		self.footer = RiteFooter(file)
+		with profileStage("lvars"):
+			if remainingSize > 0x8:
+				self.lvarBlock = RiteLvarBlock(file, self.irepBlock.section)
+			else:
+				self.lvarBlock = RiteLvarBlock(None, self.irepBlock.section)
+		with profileStage("header"):
+			self.footer = RiteFooter(file)
+
+class RawIrep:
+	"""
+	Lightweight irep record for bulk analysis. The iseq is kept as an array of raw 32 bit instructions,
+	without any MrbCode objects. `path` is the position in the irep tree ("/" for the root, "/2/0" for the
+	first child of the third child).
+	"""
+	path: str
+	offset: int
+	recordSize: int
+	numLocalVariables: int
+	numRegisterVariables: int
+	iseq: array
+	pools: List[bytes]
+	symbols: List[str]
+	# (name, register) of all local variables, only with readRawIreps(readLvars=True)
+	lvars: List[Tuple[str|None, int]]
+	children: List[RawIrep]
+
+	def __init__(self, path: str, offset: int) -> None:
+		self.path = path
+		self.offset = offset
+		self.pools = []
+		self.symbols = []
+		self.lvars = []
+		self.children = []
+
+	def childPath(self, i: int) -> str:
+		return f"{self.path}{i}" if self.path.endswith("/") else f"{self.path}/{i}"
+
+RITE_HEADER_SIZE = 0x16
+RITE_SECTION_HEADER_SIZE = 12
+
+def readRawIreps(data: bytes|bytearray|memoryview, readTables: bool = True, readLvars: bool = False) -> RawIrep:
+	"""
+	Reads the irep tree of a mrb binary without creating per instruction objects.
+	With readTables = False pools and symbols are only skipped, which is enough for opcode statistics.
+	With readLvars = True the local variable names of the lvar section are read as well.
+	"""
+	data = memoryview(data)
+	unpackFrom = struct.unpack_from
+	offset = RITE_HEADER_SIZE + RITE_SECTION_HEADER_SIZE
+	root = RawIrep("/", offset)
+	# (irep, number of children) for every irep whose children haven't been read yet
+	stack: List[RawIrep] = []
+	pendingChildren: List[int] = []
+	cur: RawIrep|None = root
+	while cur is not None:
+		cur.offset = offset
+		cur.recordSize, cur.numLocalVariables, cur.numRegisterVariables, numChildIreps, iLen = unpackFrom(">IHHHI", data, offset)
+		offset += 14
+		offset += (4 - (offset & 3)) & 3
+		cur.iseq = array("I")
+		cur.iseq.frombytes(data[offset : offset + iLen * 4])
+		if len(cur.iseq) != iLen:
+			raise Exception("Unexpected end of data")
+		if sys.byteorder == "little":
+			cur.iseq.byteswap()
+		offset += iLen * 4
+
+		poolLen, = unpackFrom(">I", data, offset)
+		offset += 4
+		for i in range(poolLen):
+			poolDataLen, = unpackFrom(">H", data, offset + 1)
+			offset += 3
+			if readTables:
+				cur.pools.append(data[offset : offset + poolDataLen].tobytes())
+			offset += poolDataLen
+
+		symbolsLen, = unpackFrom(">I", data, offset)
+		offset += 4
+		for i in range(symbolsLen):
+			symbolNameLength, = unpackFrom(">H", data, offset)
+			offset += 2
+			if symbolNameLength == 0xffff:
+				if readTables:
+					cur.symbols.append("")
+				continue
+			if readTables:
+				cur.symbols.append(data[offset : offset + symbolNameLength].tobytes().decode("utf-8", "ignore"))
+			offset += symbolNameLength + 1
+
+		# continue with the first child, or with the next sibling of the closest parent that has unread children
+		if numChildIreps > 0:
+			stack.append(cur)
+			pendingChildren.append(numChildIreps)
+		cur = None
+		while stack:
+			parent = stack[-1]
+			if len(parent.children) < pendingChildren[-1]:
+				cur = RawIrep(parent.childPath(len(parent.children)), offset)
+				parent.children.append(cur)
+				break
+			stack.pop()
+			pendingChildren.pop()
+	if readLvars:
+		_readRawLvars(data, offset, root)
+	return root
+
+def _readRawLvars(data: memoryview, offset: int, root: RawIrep) -> None:
+	# same check as in RiteFile, the lvar section is optional
+	binarySize, = struct.unpack_from(">I", data, 10)
+	if binarySize - offset <= 0x8 or data[offset : offset + 4].tobytes() != b"LVAR":
+		return
+	offset += 8
+	symbolsLen, = struct.unpack_from(">I", data, offset)
+	offset += 4
+	symbols = []
+	for i in range(symbolsLen):
+		strLen, = struct.unpack_from(">H", data, offset)
+		offset += 2
+		symbols.append(data[offset : offset + strLen].tobytes().decode("utf-8", "ignore"))
+		offset += strLen
+	for irep in iterRawIreps(root):
+		for i in range(irep.numLocalVariables - 1):
+			symbolIndex, register = struct.unpack_from(">HH", data, offset)
+			offset += 4
+			irep.lvars.append((symbols[symbolIndex] if symbolIndex != 0xffff else None, register))
+
+def iterRawIreps(root: RawIrep) -> Iterator[RawIrep]:
+	"""All ireps of the tree in file order"""
+	stack = [root]
+	while stack:
+		irep = stack.pop()
+		yield irep
+		stack.extend(reversed(irep.children))
+
+def readIrepSubtree(data: bytes|bytearray|memoryview, root: RawIrep, path: str, readChildren: bool = True) -> Tuple[RiteIrepSection, RiteLvarRecord]:
+	"""
+	Parses only the irep at `path` of the readRawIreps() tree `root` (and its children) and its local variables,
+	without touching the rest of the file.
+	"""
+	target = None
+	# the lvar records are stored in the same order as the ireps
+	lvarsOffset = 0
+	for irep in iterRawIreps(root):
+		if irep.path == path:
+			target = irep
+			break
+		lvarsOffset += max(irep.numLocalVariables - 1, 0) * 4
+	if target is None:
+		raise Exception(f"No irep at {path}")
+	file = io.BytesIO(data)
+	file.seek(target.offset)
+	irep = RiteIrepSection(file, readChildren)
+
+	# same check as in RiteFile: the lvar section follows the irep section, if there is one
+	binarySize, = struct.unpack_from(">I", data, 10)
+	irepSectionSize, = struct.unpack_from(">I", data, RITE_HEADER_SIZE + 4)
+	lvarStart = RITE_HEADER_SIZE + irepSectionSize
+	if binarySize - lvarStart <= 0x8:
+		return irep, RiteLvarRecord(None, irep, [])
+	file.seek(lvarStart)
+	RiteSectionHeader(file)
+	symbols = readLvarSymbols(file)
+	file.seek(lvarsOffset, io.SEEK_CUR)
+	return irep, RiteLvarRecord(file, irep, symbols, readChildren)
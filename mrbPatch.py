@@ -0,0 +1,120 @@
+"""
+Small in-place edits of mrb binaries (literals, symbols, instruction operands), without a decompile -> edit -> mrbc round trip.
+
+The file is parsed into a RiteFile, the edits are applied to its irep tree and mrbWriter.serializeRiteFile writes it
+back with all sizes and the crc recalculated. Ireps are addressed by their path in the irep tree ("/" for the root,
+"/2/0" for the first child of the third child, see disassembler.py for a listing).
+
+python mrbPatch.py <in.mrb> <out.mrb> [--irep /2/0] [--pool 0=text] [--symbol 3=newName] [--operand 12:B=4]
+"""
+from __future__ import annotations
+import argparse
+import io
+import os
+import sys
+from typing import Dict, Tuple
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+from mrbParser import RiteFile, RiteIrepSection
+from mrbWriter import serializeRiteFile
+from opcodes import JUMP_OPCODES, getMrbCode, markDeadCode, opcodes
+
+# (shift, mask) of every operand of a raw 32 bit instruction, sBx is stored in the Bx bits
+OPERAND_FIELDS: Dict[str, Tuple[int, int]] = {
+    "A": (23, 0x1ff),
+    "B": (14, 0x1ff),
+    "C": (7, 0x7f),
+    "Bx": (7, 0xffff),
+    "sBx": (7, 0xffff),
+    "Ax": (7, 0x1ffffff),
+    "Bz": (9, 0x3fff),
+    "Cz": (7, 0x3),
+}
+POOL_STRING = 0
+
+def findIrep(riteFile: RiteFile, path: str) -> RiteIrepSection:
+    irep = riteFile.irepBlock.section
+    for part in path.strip("/").split("/") if path != "/" else []:
+        index = int(part)
+        if index >= len(irep.childIreps):
+            raise Exception(f"No irep at {path}")
+        irep = irep.childIreps[index]
+    return irep
+
+def replacePool(irep: RiteIrepSection, index: int, value: str|bytes, poolType: int|None = None) -> None:
+    """Replaces a literal. Numbers are stored as text as well, poolType (0 string, 1 fixnum, 2 float) defaults to the old type."""
+    if index >= len(irep.pools):
+        raise Exception(f"Pool index {index} out of range ({len(irep.pools)} entries)")
+    irep.pools[index] = value.encode("utf-8") if isinstance(value, str) else value
+    if poolType is not None:
+        irep.poolTypes[index] = poolType
+
+def replaceSymbol(irep: RiteIrepSection, index: int, name: str) -> None:
+    """Renames a symbol of one irep, all instructions of the irep that reference it are affected"""
+    if index >= len(irep.symbols):
+        raise Exception(f"Symbol index {index} out of range ({len(irep.symbols)} entries)")
+    irep.symbols[index] = name
+    if index in irep.nullSymbols:
+        irep.nullSymbols.remove(index)
+
+def setOperand(irep: RiteIrepSection, pc: int, operand: str, value: int) -> None:
+    """Rewrites one operand (A, B, C, Bx, sBx, Ax, Bz or Cz) of the instruction at pc"""
+    if pc >= len(irep.mrbCodes):
+        raise Exception(f"pc {pc} out of range ({len(irep.mrbCodes)} instructions)")
+    code = irep.mrbCodes[pc]
+    if operand not in OPERAND_FIELDS or not hasattr(code, operand):
+        raise Exception(f"{opcodes[code.opcode][0]} has no operand {operand}")
+    shift, mask = OPERAND_FIELDS[operand]
+    raw = value + (0xffff >> 1) if operand == "sBx" else value
+    if raw < 0 or raw > mask:
+        raise Exception(f"{value} doesn't fit into {operand}")
+    irep.mrbCodes[pc] = getMrbCode((code.fullOpcode & ~(mask << shift)) | (raw << shift))
+    if code.opcode in JUMP_OPCODES:
+        for other in irep.mrbCodes:
+            other.stats.isReachable = False
+        markDeadCode(irep.mrbCodes, 0)
+    else:
+        irep.mrbCodes[pc].stats = code.stats
+
+def patchBytes(data: bytes, edits) -> bytes:
+    """Parses data, calls edits(riteFile) and serializes the result"""
+    riteFile = RiteFile(io.BytesIO(data))
+    edits(riteFile)
+    return serializeRiteFile(riteFile)
+
+def parseAssignment(text: str) -> Tuple[str, str]:
+    key, sep, value = text.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError(f"expected key=value, got {text}")
+    return key, value
+
+def main():
+    parser = argparse.ArgumentParser(description="Replace literals, symbols and instruction operands of a mrb file")
+    parser.add_argument("inFile")
+    parser.add_argument("outFile")
+    parser.add_argument("--irep", default="/", help="path of the irep to edit, for example /2/0")
+    parser.add_argument("--pool", action="append", default=[], type=parseAssignment, help="index=new literal")
+    parser.add_argument("--symbol", action="append", default=[], type=parseAssignment, help="index=new symbol name")
+    parser.add_argument("--operand", action="append", default=[], type=parseAssignment, help="pc:operand=value, for example 12:B=4")
+    args = parser.parse_args()
+
+    def edits(riteFile: RiteFile):
+        irep = findIrep(riteFile, args.irep)
+        for index, value in args.pool:
+            replacePool(irep, int(index), value)
+        for index, name in args.symbol:
+            replaceSymbol(irep, int(index), name)
+        for location, value in args.operand:
+            pc, _, operand = location.partition(":")
+            setOperand(irep, int(pc), operand, int(value, 0))
+
+    with open(args.inFile, "rb") as f:
+        data = f.read()
+    patched = patchBytes(data, edits)
+    with open(args.outFile, "wb") as f:
+        f.write(patched)
+    print(f"Wrote {args.outFile} ({len(data)} -> {len(patched)} bytes)")
+
+if __name__ == "__main__":
+    main()
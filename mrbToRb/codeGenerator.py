@@ -1,6 +1,6 @@
-from typing import List
+from typing import Any, Callable, List
 
-from mrbToRb.rbExpressions import Expression, LineCommentEx
+from mrbToRb.rbExpressions import Expression, LineCommentEx, render
 
 
 class CodeGen:
@@ -24,14 +24,14 @@ class CodeGen:
 			self.expressions.pop(lastIndex)
 
 	def toStr(self) -> str:
-		result = ""
-		for exp in self.expressions:
-			if exp.canBeOptimizedAway and exp.hasUsages:
-				continue
-			if not self.includeComments and isinstance(exp, LineCommentEx):
-				continue
-			result += f"{exp}\n"
-		return result[:-1]
+		return "\n".join(map(render, self.getExpressions()))
+
+	def writeTo(self, write: Callable[[str], Any]) -> None:
+		"""Same output as toStr(), but written one expression at a time"""
+		for i, exp in enumerate(self.getExpressions()):
+			if i > 0:
+				write("\n")
+			write(render(exp))
 
 	def getExpressions(self) -> List[Expression]:
 		exps: List[Expression] = []
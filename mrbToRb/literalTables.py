@@ -0,0 +1,63 @@
+"""
+Recognizer for literal tables: arrays and hashes that are built only from literal loads (and nested literal tables).
+
+Data heavy scripts are mostly long runs like LOADI/LOADSYM/STRING ... ARRAY (or HASH) into a constant. Instead of
+loading every element into a register and pushing it to the CodeGen, only to drop it again when the ARRAY uses it,
+OpCodeReader builds such a table in one pass over the run (see OpCodeReader.parseLiteralTable()). The output is the
+same either way, the pass can be switched off with `literalTablesEnabled`.
+
+All positions are relative to the section (the OpCodeFeed), the same way OpCodeReader sees them.
+"""
+from __future__ import annotations
+from contextvars import ContextVar
+from typing import Dict, Iterable, Set
+
+from mrbToRb.opCodeFeed import OpCodeFeed
+from opcodes import JUMP_OPCODES, AllOpCodes
+
+# set to False to let OpCodeReader step through the elements of every table
+literalTablesEnabled: ContextVar[bool] = ContextVar("literalTablesEnabled", default=True)
+
+LITERAL_OPCODES = frozenset({
+    AllOpCodes.OP_LOADL, AllOpCodes.OP_LOADI, AllOpCodes.OP_LOADSYM, AllOpCodes.OP_LOADNIL,
+    AllOpCodes.OP_LOADT, AllOpCodes.OP_LOADF, AllOpCodes.OP_STRING,
+})
+TABLE_OPCODES = frozenset({ AllOpCodes.OP_ARRAY, AllOpCodes.OP_HASH })
+
+def findLiteralTables(opcodes: OpCodeFeed, localRegisters: Iterable[int]) -> Dict[int, int]:
+    """
+    Position of the ARRAY/HASH of every outermost literal table, by the position of its first load. Elements have
+    to be loaded into consecutive registers, none of them a local variable, and no jump may land inside the run.
+    """
+    codes = opcodes.opcodes
+    lvarRegisters: Set[int] = set(localRegisters)
+    jumpTargets = { i + code.sBx for i, code in enumerate(codes) if code.opcode in JUMP_OPCODES }
+    # start of every table (nested ones included), by the position of its ARRAY/HASH
+    starts: Dict[int, int] = {}
+    tables: Dict[int, int] = {}
+    for end in [i for i, code in enumerate(codes) if code.opcode in TABLE_OPCODES]:
+        table = codes[end]
+        count = table.C * 2 if table.opcode == AllOpCodes.OP_HASH else table.C
+        if count == 0 or end in jumpTargets:
+            continue
+        # walk back from the last element to the first one
+        register = table.B + count - 1
+        pos = end - 1
+        while register >= table.B and pos >= 0:
+            element = codes[pos]
+            if register in lvarRegisters:
+                break
+            if element.opcode in LITERAL_OPCODES and element.A == register:
+                pos -= 1
+            elif element.opcode in TABLE_OPCODES and pos in starts and element.A == register and element.B == register:
+                pos = starts[pos] - 1
+            else:
+                break
+            register -= 1
+            if register >= table.B and pos + 1 in jumpTargets:
+                break
+        if register >= table.B:
+            continue
+        starts[end] = pos + 1
+        tables[pos + 1] = end
+    return tables
@@ -1,15 +1,29 @@
 from __future__ import annotations
+import copy
+from typing import List
 
 from .codeGenerator import CodeGen
 from .opcodeReader import OpCodeReader
-from mrbParser import RiteFile
+from mrbParser import RiteFile, RiteIrepSection, RiteLvarRecord
+from profiling import profileStage
 from .parsingConext import ParsingContext, ParsingState
-from .rbExpressions import MainClass
+from .rbExpressions import MainClass, SymbolEx
 
 
 def mrbToRb(riteFile: RiteFile) -> CodeGen:
 	codeGen = CodeGen()
 	irepConverter = OpCodeReader(riteFile.irepBlock.section, riteFile.lvarBlock.section, None, MainClass(0), codeGen,
 								 ParsingContext(ParsingState.NORMAL))
-	irepConverter.parseOps()
+	with profileStage("parseOps"):
+		irepConverter.parseOps()
+	return codeGen
+
+def instructionsToRb(irep: RiteIrepSection, lvars: RiteLvarRecord, pcs: List[int], currentClass: SymbolEx) -> CodeGen:
+	"""Decompiles only some instructions of an irep, like the ones that define a single method"""
+	codeGen = CodeGen()
+	sliceIrep = copy.copy(irep)
+	sliceIrep.mrbCodes = [irep.mrbCodes[pc] for pc in pcs]
+	irepConverter = OpCodeReader(sliceIrep, lvars, None, currentClass, codeGen, ParsingContext(ParsingState.NORMAL))
+	with profileStage("parseOps"):
+		irepConverter.parseOps()
 	return codeGen
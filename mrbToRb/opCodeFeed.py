@@ -1,7 +1,7 @@
 from __future__ import annotations
 from typing import List, Union
 
-from opcodes import *
+from opcodes import MrbCode, MrbCodeABC, MrbCodeABx, MrbCodeAsBx, MrbCodeAx
 
 
 class OpCodeFeed:
@@ -44,8 +44,9 @@ class OpCodeFeed:
         else:
             raise TypeError(f"Invalid slice type {type(item)}")
 
-    def getJumpedOpcodes(self, count: int) -> List[MrbCode]:
-        start = self.offset + self.pos
+    def getJumpedOpcodes(self, pos: int, count: int) -> List[MrbCode]:
+        """Instructions that a jump at pos with sBx = count skips, also outside of this section"""
+        start = self.offset + pos
         return self.fullOpcodes[start + 1:start + count]
 
     def getRel(self, offset: int):
@@ -1,17 +1,57 @@
 from __future__ import annotations
 
 import copy
-from typing import cast, Tuple, Type
+import time
+from contextvars import ContextVar
+from typing import cast, Any, Callable, Generator, Tuple, Type
 
+from budget import activeBudget
+from diagnostics import report
 from mrbParser import RiteLvarRecord, RiteIrepSection
 from mrbToRb.codeGenerator import CodeGen
+from mrbToRb.literalTables import findLiteralTables, literalTablesEnabled
 from mrbToRb.opCodeFeed import OpCodeFeed
 from mrbToRb.parsingConext import ParsingContext, ParsingState
+from mrbToRb.regions import BRANCH_OPCODES, Region, classifyJump, findJumpPositions, findRegions
 from mrbToRb.register import Register
+from mrbToRb.superinstructions import SYMBOL_LOAD_OPCODES, findFusedCalls, superinstructionsEnabled
 from mrbToRb.rbExpressions import *
-from opcodes import *
+from opcodes import OPCODE_NAMES, AllOpCodes, MrbCode, MrbCodeABC, MrbCodeABzCz, MrbCodeAsBx, MrbCodeAspec
+from profiling import activeOpStats, countStructure
 from utils import ENCODING
 
+# gets called with (jmpCode, message) for every JMP that couldn't be mapped to ruby code
+unhandledJmpListener: ContextVar[Callable[[MrbCode, str], None]|None] = ContextVar("unhandledJmpListener", default=None)
+
+# Nested sections and ireps are parsed as tasks: generators that yield the tasks they depend on and get back their
+# return values. runTask() drives them with an explicit stack, so deep nesting doesn't hit the recursion limit.
+Task = Generator["Task", Any, Any]
+
+def runTask(task: Task) -> Any:
+    """Runs task and everything it yields, returns its return value"""
+    stack: List[Task] = [task]
+    value: Any = None
+    error: BaseException|None = None
+    while stack:
+        try:
+            if error is not None:
+                thrown, error = error, None
+                child = stack[-1].throw(thrown)
+            else:
+                child = stack[-1].send(value)
+        except StopIteration as e:
+            stack.pop()
+            value = e.value
+            continue
+        except BaseException as e:
+            stack.pop()
+            if not stack:
+                raise
+            error = e
+            continue
+        stack.append(child)
+        value = None
+    return value
 
 class OpCodeReader:
     registers: List[Register]
@@ -27,9 +67,17 @@ class OpCodeReader:
     childLvars: List[RiteLvarRecord]
     localVarsMap: Dict[int, SymbolEx]
     codeGen: CodeGen
+    regions: Dict[int, Region]
+    irepPath: str           # path of the irep in the irep tree, for diagnostics ("/", "/2/0")
+    pcOffset: int           # pc of the first instruction of irep.mrbCodes, if they don't start at the beginning of the irep
+    # pre-pass tables of the whole irep, shared by all section readers. Positions are relative to opcodes.fullOpcodes
+    jumpPositions: List[int]
+    literalTables: Dict[int, int]
+    fusedCalls: Dict[int, int]
 
     def __init__(self, irep: RiteIrepSection, lvars: RiteLvarRecord, parent: OpCodeReader | None, curClass: SymbolEx,
-                 codeGen: CodeGen, context: ParsingContext, fullIrepCodes: List[MrbCode]|None = None, originalIrepOffset: int = 0):
+                 codeGen: CodeGen, context: ParsingContext, fullIrepCodes: List[MrbCode]|None = None, originalIrepOffset: int = 0,
+                 irepReader: OpCodeReader|None = None):
         self.parent = parent
         self.pool = list(map(lambda b: b.decode(ENCODING, "ignore"), irep.pools))
         self.symbols = list(map(lambda s: SymbolEx(0, s), irep.symbols))
@@ -47,60 +95,64 @@ class OpCodeReader:
         self.childLvars = lvars.childLvars
         self.codeGen = codeGen
         self.context = context
-
-    def step(self):
+        self.irepPath = "/"
+        self.pcOffset = 0
+        if irepReader is None:
+            # the tables of a section are a subset of those of the whole irep (it has more jump targets), so nested
+            # sections don't have to scan their instructions again
+            self.jumpPositions = findJumpPositions(self.opcodes)
+            self.literalTables = findLiteralTables(self.opcodes, self.localVarsMap.keys()) if literalTablesEnabled.get() else {}
+            self.fusedCalls = findFusedCalls(self.opcodes, self.localVarsMap.keys()) if superinstructionsEnabled.get() else {}
+        else:
+            self.jumpPositions = irepReader.jumpPositions
+            self.literalTables = irepReader.literalTables
+            self.fusedCalls = irepReader.fusedCalls
+        self.regions = findRegions(self.opcodes, self.whenCondRegister(), context.isWhileLoop(), self.jumpPositions)
+
+    def step(self) -> Task|None:
+        """
+        Handles the instruction at the current position and moves on. Instructions with nested sections or ireps
+        return a task instead, the reader moves on once it is done (see parseOpsTask()).
+        """
         opcode = self.opcodes.cur()
         # self.codeGen.pushExp(LineCommentEx(0, str(opcode)))
 
-        def pushExpToCodeGen(regI: int, expression: Expression, localVarsMap: Dict|None = None):
-            if not localVarsMap:
-                localVarsMap = self.localVarsMap
-            if regI in localVarsMap:
-                self.codeGen.pushExp(AssignmentEx(regI, localVarsMap[regI], expression))
-            else:
-                self.codeGen.pushExp(expression)
-
         def unhandledOpCode():
             raise Exception("Unhandled opcode: " + str(opcode))
 
-        if opcode.opcode == AllOpCodes.OP_NOP:
+        offset = self.opcodes.offset
+        tableEnd = self.literalTables.get(self.opcodes.pos + offset, -1) - offset
+        fusedCallEnd = self.fusedCalls.get(self.opcodes.pos + offset, -1) - offset if self.fusedCalls else -1
+        if 0 <= tableEnd < len(self.opcodes):
+            exp = self.parseLiteralTable(tableEnd)
+            self.registers[exp.register].load(exp)
+            self.pushExpToCodeGen(exp.register, exp)
+        elif 0 <= fusedCallEnd < len(self.opcodes):
+            exp = self.parseFusedCall(fusedCallEnd)
+            self.registers[exp.register].load(exp)
+            self.pushExpToCodeGen(exp.register, exp)
+        elif opcode.opcode == AllOpCodes.OP_NOP:
             pass
         elif opcode.opcode == AllOpCodes.OP_MOVE:
             val = self.registers[opcode.B].valueOrSymbol
             self.registers[opcode.A].moveIn(self.registers[opcode.B])
-            pushExpToCodeGen(opcode.A, val)
+            self.pushExpToCodeGen(opcode.A, val)
         elif AllOpCodes.OP_LOADL <= opcode.opcode <= AllOpCodes.OP_LOADF:
-            value: Expression
-            if opcode.opcode == AllOpCodes.OP_LOADL:
-                value = LiteralEx(opcode.A, self.pool[opcode.Bx])
-            elif opcode.opcode == AllOpCodes.OP_LOADI:
-                value = LiteralEx(opcode.A, opcode.sBx)
-            elif opcode.opcode == AllOpCodes.OP_LOADSYM:
-                value = SymbolValEx(opcode.A, self.symbols[opcode.Bx])
-            elif opcode.opcode == AllOpCodes.OP_LOADNIL:
-                value = NilEx(opcode.A)
-            elif opcode.opcode == AllOpCodes.OP_LOADSELF:
-                value = SelfEx(opcode.A)
-            elif opcode.opcode == AllOpCodes.OP_LOADT:
-                value = TrueEx(opcode.A)
-            elif opcode.opcode == AllOpCodes.OP_LOADF:
-                value = FalseEx(opcode.A)
-            else:
-                raise Exception("Unknown load opcode " + str(opcode))
+            value = self.literalValue(opcode)
             self.registers[opcode.A].load(value)
-            pushExpToCodeGen(opcode.A, value)
+            self.pushExpToCodeGen(opcode.A, value)
 
         elif opcode.opcode in { AllOpCodes.OP_GETGLOBAL, AllOpCodes.OP_GETSPECIAL, AllOpCodes.OP_GETIV, AllOpCodes.OP_GETCV, AllOpCodes.OP_GETCONST }:
             exp = SymbolEx(opcode.A, self.symbols[opcode.Bx])
             self.registers[opcode.A].load(exp)
-            pushExpToCodeGen(opcode.A, exp)
+            self.pushExpToCodeGen(opcode.A, exp)
         elif opcode.opcode in { AllOpCodes.OP_SETGLOBAL , AllOpCodes.OP_SETSPECIAL, AllOpCodes.OP_SETIV, AllOpCodes.OP_SETCV, AllOpCodes.OP_SETCONST }:
             exp = AssignmentEx(opcode.A, SymbolEx(opcode.A, self.symbols[opcode.Bx]), self.registers[opcode.A].value)
             self.codeGen.pushExp(exp)
         elif opcode.opcode == AllOpCodes.OP_GETMCNST:
             exp = MConstSymbolEx(opcode.A, self.registers[opcode.A].value, self.symbols[opcode.Bx])
             self.registers[opcode.A].load(exp)
-            pushExpToCodeGen(opcode.A, exp)
+            self.pushExpToCodeGen(opcode.A, exp)
         elif opcode.opcode == AllOpCodes.OP_SETMCNST:
             mConstExp = MConstSymbolEx(opcode.A, self.registers[opcode.A + 1].value, self.symbols[opcode.Bx])
             exp = AssignmentEx(opcode.A + 1, mConstExp, self.registers[opcode.A].value)
@@ -109,33 +161,16 @@ class OpCodeReader:
             upVar, _ = self.findUpVar(opcode.B)
             val = SymbolEx(upVar.lvarSymbol.register, upVar.lvarSymbol.value)
             self.registers[opcode.A].load(val)
-            pushExpToCodeGen(opcode.A, val)
+            self.pushExpToCodeGen(opcode.A, val)
         elif opcode.opcode == AllOpCodes.OP_SETUPVAR:
             upVarReg, context = self.findUpVar(opcode.B)
             upVarReg.moveIn(self.registers[opcode.A])
-            pushExpToCodeGen(opcode.B, upVarReg.value, context.localVarsMap)
-
-        elif opcode.opcode == AllOpCodes.OP_JMP:
-            if opcode.sBx < 0:
-                self.codeGen.pushExp(StatementEx(0, "next"))
-            elif self.opcodes.pos + opcode.sBx >= len(self.opcodes):
-                if self.context.isWhileLoop():
-                    self.codeGen.pushExp(StatementEx(0, "break"))
-                else:
-                    jumpedOpcodes = self.opcodes.getJumpedOpcodes(opcode.sBx)
-                    if len(jumpedOpcodes) == 0 or len(jumpedOpcodes) <= 2 and all(not code.stats.isReachable for code in jumpedOpcodes):
-                        self.opcodes.jump(opcode.sBx)
-                    else:
-                        self.codeGen.pushExp(RaiseEx(0, StringEx(0, f"ERROR: Unexpected JMP {'+' if opcode.sBx > 0 else ''}{opcode.sBx}! (continuing anyways)")))
-                        for jmpOp in jumpedOpcodes:
-                            self.codeGen.pushExp(LineCommentEx(0, str(jmpOp)))
-                        print(f"ERROR: Unexpected JMP {'+' if opcode.sBx > 0 else ''}{opcode.sBx} ({len(jumpedOpcodes)})! (continuing anyways)")
-            else:
-                self.parseWhileOrUntil()
-        elif opcode.opcode == AllOpCodes.OP_JMPIF:
-            self.parseJMPIF()
-        elif opcode.opcode == AllOpCodes.OP_JMPNOT:
-            self.parseJMPNOT()
+            self.pushExpToCodeGen(opcode.B, upVarReg.value, context.localVarsMap)
+
+        elif opcode.opcode in BRANCH_OPCODES:
+            task = self.parseRegion(self.regionAt(self.opcodes.pos))
+            if task is not None:
+                return task
         # elif opcode.opcode == AllOpCodes.OP_ONERR:
         #     unhandledOpCode()
         # elif opcode.opcode == AllOpCodes.OP_RESCUE:
@@ -161,13 +196,13 @@ class OpCodeReader:
                 methodSymbol = SymbolEx(opcode.A, "yield")
             exp = MethodCallEx(opcode.A, srcObj, methodSymbol, args)
             self.registers[opcode.A].load(exp)
-            pushExpToCodeGen(opcode.A, exp)
+            self.pushExpToCodeGen(opcode.A, exp)
         elif opcode.opcode == AllOpCodes.OP_SENDB:
             args = [reg.value for reg in self.registers[opcode.A + 1: opcode.A + 1 + opcode.C]]
             block = cast(LambdaEx, self.registers[opcode.A + opcode.C + 1].value)
             exp = MethodCallWithBlockEx(opcode.A, self.registers[opcode.A].value, self.symbols[opcode.B], args, block)
             self.registers[opcode.A].load(exp)
-            pushExpToCodeGen(opcode.A, exp)
+            self.pushExpToCodeGen(opcode.A, exp)
         # elif opcode.opcode == AllOpCodes.OP_FSEND:
         #     unhandledOpCode()
         # elif opcode.opcode == AllOpCodes.OP_CALL:
@@ -179,7 +214,7 @@ class OpCodeReader:
                 args = []
             exp = MethodCallEx(opcode.A, None, SymbolEx(0, "super"), args)
             self.registers[opcode.A].load(exp)
-            pushExpToCodeGen(opcode.A, exp)
+            self.pushExpToCodeGen(opcode.A, exp)
         elif opcode.opcode == AllOpCodes.OP_ARGARY:
             exp = RaiseEx(0, StringEx(0, "ERROR: OP_ARGARY should not be visible!"))
             self.registers[opcode.A].load(exp)
@@ -220,17 +255,17 @@ class OpCodeReader:
             else:
                 raise Exception("Unknown arithmetic opcode " + str(opcode))
             self.registers[opcode.A].load(exp)
-            pushExpToCodeGen(opcode.A, exp)
+            self.pushExpToCodeGen(opcode.A, exp)
         elif AllOpCodes.OP_EQ <= opcode.opcode <= AllOpCodes.OP_GE:
             exp = BoolExpEx(opcode.A, self.registers[opcode.A].value, self.registers[opcode.A + 1].value, self.symbols[opcode.B])
             self.registers[opcode.A].load(exp)
-            pushExpToCodeGen(opcode.A, exp)
+            self.pushExpToCodeGen(opcode.A, exp)
 
         elif opcode.opcode == AllOpCodes.OP_ARRAY:
             elements = [reg.value for reg in self.registers[opcode.B : opcode.B + opcode.C]]
             exp = ArrayEx(opcode.A, elements)
             self.registers[opcode.A].load(exp)
-            pushExpToCodeGen(opcode.A, exp)
+            self.pushExpToCodeGen(opcode.A, exp)
         elif opcode.opcode == AllOpCodes.OP_ARYCAT:
             exp = ArrayConcatEx(opcode.A, self.registers[opcode.A].value, self.registers[opcode.B].value)
             self.codeGen.pushExp(exp)
@@ -240,7 +275,7 @@ class OpCodeReader:
         elif opcode.opcode == AllOpCodes.OP_AREF:
             exp = ArrayRefEx(opcode.A, self.registers[opcode.B].value, opcode.C)
             self.registers[opcode.A].load(exp)
-            pushExpToCodeGen(opcode.A, exp)
+            self.pushExpToCodeGen(opcode.A, exp)
         # elif opcode.opcode == AllOpCodes.OP_ASET:
         #     exp = ArraySetEx(opcode.A, cast(SymbolEx, self.registers[opcode.B].value), opcode.C, self.registers[opcode.A].value)
         #     self.codeGen.pushExp(exp)
@@ -248,13 +283,13 @@ class OpCodeReader:
         #     unhandledOpCode()
 
         elif opcode.opcode == AllOpCodes.OP_STRING:
-            exp = StringEx(opcode.A, self.pool[opcode.Bx])
+            exp = self.literalValue(opcode)
             self.registers[opcode.A].load(exp)
-            pushExpToCodeGen(opcode.A, exp)
+            self.pushExpToCodeGen(opcode.A, exp)
         elif opcode.opcode == AllOpCodes.OP_STRCAT:
             exp = StringConcatEx(opcode.A, self.registers[opcode.A].value, self.registers[opcode.B].value)
             self.registers[opcode.A].load(exp)
-            pushExpToCodeGen(opcode.A, exp)
+            self.pushExpToCodeGen(opcode.A, exp)
 
         elif opcode.opcode == AllOpCodes.OP_HASH:
             keys = self.registers[opcode.B : opcode.B + opcode.C*2 : 2]
@@ -264,62 +299,36 @@ class OpCodeReader:
             combinedDict = dict(zip(keys, values))
             exp = HashEx(opcode.A, combinedDict)
             self.registers[opcode.A].load(exp)
-            pushExpToCodeGen(opcode.A, exp)
+            self.pushExpToCodeGen(opcode.A, exp)
 
         elif opcode.opcode == AllOpCodes.OP_LAMBDA:
-            args, body = self.parseLambda(self.currentClass)
-            nextOpcode = self.opcodes.getRel(1)
-            if nextOpcode.opcode == AllOpCodes.OP_METHOD:
-                self.opcodes.next()
-                srcObj = self.registers[nextOpcode.A].value
-                if srcObj is self.currentClass:
-                    srcObj.hasUsages = True
-                    srcObj = None
-                elif isinstance(srcObj, SelfEx) and isinstance(self.currentClass, MainClass):
-                    srcObj = self.currentClass
-                exp = MethodEx(0, self.symbols[nextOpcode.B], args,
-                               BlockEx(opcode.A, body), srcObj)
-                self.codeGen.pushExp(exp)
-            else:
-                exp = LambdaEx(opcode.A, args, BlockEx(0, body))
-                self.registers[opcode.A].load(exp)
-                pushExpToCodeGen(opcode.A, exp)
-
+            return self.parseLambdaOpcode(opcode)
 
         elif opcode.opcode == AllOpCodes.OP_RANGE:
             exp = RangeEx(opcode.A, self.registers[opcode.B].value, self.registers[opcode.B + 1].value, bool(opcode.C))
             self.registers[opcode.A].load(exp)
-            pushExpToCodeGen(opcode.A, exp)
+            self.pushExpToCodeGen(opcode.A, exp)
 
         elif opcode.opcode == AllOpCodes.OP_OCLASS:
             exp = ClassSymbolEx(opcode.A, StringEx(0, "Object"))
             self.registers[opcode.A].load(exp)
-            pushExpToCodeGen(opcode.A, exp)
+            self.pushExpToCodeGen(opcode.A, exp)
         elif opcode.opcode == AllOpCodes.OP_CLASS:
             parentClass = self.registers[opcode.A + 1].value
             if isinstance(parentClass, NilEx):
                 parentClass = None
             exp = ClassSymbolEx(opcode.A, self.symbols[opcode.B], parentClass)
             self.registers[opcode.A].load(exp)
-            pushExpToCodeGen(opcode.A, exp)
+            self.pushExpToCodeGen(opcode.A, exp)
         elif opcode.opcode == AllOpCodes.OP_MODULE:
             exp = ModuleSymbolEx(opcode.A, self.symbols[opcode.B])
             self.registers[opcode.A].load(exp)
-            pushExpToCodeGen(opcode.A, exp)
+            self.pushExpToCodeGen(opcode.A, exp)
         elif opcode.opcode == AllOpCodes.OP_EXEC:
             target = self.registers[opcode.A].value
             if not isinstance(target, ClassSymbolEx) and not isinstance(target, ModuleSymbolEx):
                 unhandledOpCode()
-            codeGen = CodeGen()
-            innerContext = self.context.pushAndNew(ParsingState.NORMAL)
-            opcodeReader = OpCodeReader(self.childIreps[opcode.Bx], self.childLvars[opcode.Bx], self, target, codeGen, innerContext)
-            opcodeReader.parseOps()
-            body = BlockEx(0, codeGen.getExpressions())
-            if isinstance(target, ClassSymbolEx):
-                exp = ClassEx(opcode.A, target, body, target.isSingleton)
-            else:
-                exp = ModuleEx(opcode.A, target, body)
-            self.codeGen.pushExp(exp)
+            return self.parseExec(opcode, target)
         elif opcode.opcode == AllOpCodes.OP_METHOD:
             if self.opcodes.getRel(-2).opcode != AllOpCodes.OP_SCLASS and self.opcodes.getRel(-1) != AllOpCodes.OP_LAMBDA:
                 unhandledOpCode()
@@ -331,12 +340,12 @@ class OpCodeReader:
         elif opcode.opcode == AllOpCodes.OP_SCLASS:
             exp = ClassSymbolEx(opcode.A, self.registers[opcode.B].value, None, True)
             self.registers[opcode.A].load(exp)
-            pushExpToCodeGen(opcode.A, exp)
+            self.pushExpToCodeGen(opcode.A, exp)
 
         elif opcode.opcode == AllOpCodes.OP_TCLASS:
             classSym = self.currentClass
             self.registers[opcode.A].load(classSym)
-            pushExpToCodeGen(opcode.A, classSym)
+            self.pushExpToCodeGen(opcode.A, classSym)
 
         # elif opcode.opcode == AllOpCodes.OP_DEBUG:
         #     unhandledOpCode()
@@ -363,17 +372,166 @@ class OpCodeReader:
         self.opcodes.next()
 
     def parseOps(self):
+        runTask(self.parseOpsTask())
+
+    def parseOpsTask(self) -> Task:
+        """All instructions of this reader. Nested readers are yielded to runTask() instead of being run recursively."""
+        opStats = activeOpStats()
+        budget = activeBudget()
+        if opStats is None:
+            while self.opcodes.hasNext():
+                if budget is not None and budget.exceeded():
+                    raise budget.error(self.irepPath, self.pc())
+                task = self.step()
+                if task is not None:
+                    yield task
+                    self.opcodes.next()
+            return
+        perfCounter = time.perf_counter
         while self.opcodes.hasNext():
-            self.step()
+            if budget is not None and budget.exceeded():
+                raise budget.error(self.irepPath, self.pc())
+            opcode = self.opcodes.cur().opcode
+            opStats.enterOp()
+            t1 = perfCounter()
+            task = self.step()
+            if task is not None:
+                yield task
+                self.opcodes.next()
+            opStats.exitOp(opcode, perfCounter() - t1)
+
+    def pushExpToCodeGen(self, regI: int, expression: Expression, localVarsMap: Dict|None = None):
+        if not localVarsMap:
+            localVarsMap = self.localVarsMap
+        if regI in localVarsMap:
+            self.codeGen.pushExp(AssignmentEx(regI, localVarsMap[regI], expression))
+        else:
+            self.codeGen.pushExp(expression)
+
+    def parseLambdaOpcode(self, opcode: MrbCode) -> Task:
+        args, body = yield self.parseLambda(self.currentClass)
+        nextOpcode = self.opcodes.getRel(1)
+        if nextOpcode.opcode == AllOpCodes.OP_METHOD:
+            self.opcodes.next()
+            srcObj = self.registers[nextOpcode.A].value
+            if srcObj is self.currentClass:
+                srcObj.hasUsages = True
+                srcObj = None
+            elif isinstance(srcObj, SelfEx) and isinstance(self.currentClass, MainClass):
+                srcObj = self.currentClass
+            exp = MethodEx(0, self.symbols[nextOpcode.B], args,
+                           BlockEx(opcode.A, body), srcObj)
+            self.codeGen.pushExp(exp)
+        else:
+            exp = LambdaEx(opcode.A, args, BlockEx(0, body))
+            self.registers[opcode.A].load(exp)
+            self.pushExpToCodeGen(opcode.A, exp)
+
+    def parseExec(self, opcode: MrbCode, target: SymbolEx) -> Task:
+        codeGen = CodeGen()
+        innerContext = self.context.pushAndNew(ParsingState.NORMAL)
+        opcodeReader = OpCodeReader(self.childIreps[opcode.Bx], self.childLvars[opcode.Bx], self, target, codeGen, innerContext)
+        opcodeReader.irepPath = self.childIrepPath(opcode.Bx)
+        yield opcodeReader.parseOpsTask()
+        body = BlockEx(0, codeGen.getExpressions())
+        if isinstance(target, ClassSymbolEx):
+            exp = ClassEx(opcode.A, target, body, target.isSingleton)
+        else:
+            exp = ModuleEx(opcode.A, target, body)
+        self.codeGen.pushExp(exp)
+
+    def literalValue(self, opcode: MrbCode) -> Expression:
+        """Expression of a LOADL ... LOADF or STRING"""
+        if opcode.opcode == AllOpCodes.OP_LOADL:
+            return LiteralEx(opcode.A, self.pool[opcode.Bx])
+        elif opcode.opcode == AllOpCodes.OP_LOADI:
+            return LiteralEx(opcode.A, opcode.sBx)
+        elif opcode.opcode == AllOpCodes.OP_LOADSYM:
+            return SymbolValEx(opcode.A, self.symbols[opcode.Bx])
+        elif opcode.opcode == AllOpCodes.OP_LOADNIL:
+            return NilEx(opcode.A)
+        elif opcode.opcode == AllOpCodes.OP_LOADSELF:
+            return SelfEx(opcode.A)
+        elif opcode.opcode == AllOpCodes.OP_LOADT:
+            return TrueEx(opcode.A)
+        elif opcode.opcode == AllOpCodes.OP_LOADF:
+            return FalseEx(opcode.A)
+        elif opcode.opcode == AllOpCodes.OP_STRING:
+            return StringEx(opcode.A, self.pool[opcode.Bx])
+        else:
+            raise Exception("Unknown load opcode " + str(opcode))
+
+    @countStructure
+    def parseLiteralTable(self, end: int) -> Expression:
+        """
+        Builds the literal table (see literalTables.py) from the current position to the ARRAY/HASH at end in one pass.
+        The elements are loaded into their registers like step() would (later instructions, like a splat, can still
+        read them), but never pushed to the CodeGen. The reader continues at end.
+        """
+        stack: List[Expression] = []
+        for opcode in self.opcodes.opcodes[self.opcodes.pos : end + 1]:
+            if opcode.opcode == AllOpCodes.OP_ARRAY:
+                start = len(stack) - opcode.C
+                exp: Expression = ArrayEx(opcode.A, stack[start:])
+            elif opcode.opcode == AllOpCodes.OP_HASH:
+                start = len(stack) - opcode.C * 2
+                exp = HashEx(opcode.A, dict(zip(stack[start::2], stack[start + 1::2])))
+            else:
+                exp = self.literalValue(opcode)
+                self.registers[opcode.A].load(exp)
+                stack.append(exp)
+                continue
+            del stack[start:]
+            self.registers[opcode.A].load(exp)
+            stack.append(exp)
+        self.opcodes.seek(end)
+        return stack[0]
+
+    @countStructure
+    def parseFusedCall(self, end: int) -> Expression:
+        """
+        Builds the call (see superinstructions.py) from the receiver load at the current position to the SEND at end,
+        the same way step() would for each instruction. The arguments are loaded into their registers too (later
+        instructions can still read them), only the CodeGen entries are skipped. The reader continues at end.
+        """
+        receiver = self.opcodes.cur()
+        args: List[Expression] = []
+        for opcode in self.opcodes.opcodes[self.opcodes.pos + 1 : end]:
+            if opcode.opcode == AllOpCodes.OP_MOVE:
+                args.append(self.registers[opcode.B].valueOrSymbol)
+                self.registers[opcode.A].moveIn(self.registers[opcode.B])
+                continue
+            elif opcode.opcode in SYMBOL_LOAD_OPCODES:
+                arg: Expression = SymbolEx(opcode.A, self.symbols[opcode.Bx])
+            else:
+                arg = self.literalValue(opcode)
+            args.append(arg)
+            self.registers[opcode.A].load(arg)
+        srcObj: Expression|None
+        if receiver.opcode == AllOpCodes.OP_LOADSELF:
+            srcObj = SelfEx(receiver.A)
+            if isinstance(self.currentClass, MainClass):
+                srcObj.hasUsages = True
+                srcObj = None
+        elif receiver.opcode == AllOpCodes.OP_MOVE:
+            srcObj = self.registers[receiver.B].valueOrSymbol
+        else:
+            srcObj = SymbolEx(receiver.A, self.symbols[receiver.Bx])
+        send = self.opcodes[end]
+        self.opcodes.seek(end)
+        return MethodCallEx(send.A, srcObj, self.symbols[send.B], args)
 
     def findUpVar(self, register: int, _checkSelf = False) -> Tuple[Register, OpCodeReader]:
-        if _checkSelf and register in self.localVarsMap:
-            return self.registers[register], self
-        if self.parent is not None:
-            return self.parent.findUpVar(register, True)
+        reader = self if _checkSelf else self.parent
+        while reader is not None:
+            if register in reader.localVarsMap:
+                return reader.registers[register], reader
+            reader = reader.parent
         raise Exception("Could not find upvar for register " + str(register))
 
-    def parseLambda(self, parentClass: SymbolEx) -> Tuple[List[MethodArgumentEx], List[Expression]]:
+    @countStructure
+    def parseLambda(self, parentClass: SymbolEx) -> Task:
+        """Task that returns the arguments and the body of the lambda at the current position"""
         args: List[MethodArgumentEx] = []
         body: List[Expression]
         opcode = cast(MrbCodeABzCz, self.opcodes.cur())
@@ -405,10 +563,13 @@ class OpCodeReader:
                     methodStartPointer = instructionsPointer + jmpEndInstruction.sBx + 1
                     startPointer = instructionsPointer + jmpStartInstruction.sBx
                     endPointer = instructionsPointer + jmpEndInstruction.sBx + 1
-                    tmpIrep = copy.deepcopy(irep)
+                    tmpIrep = copy.copy(irep)
                     tmpIrep.mrbCodes = tmpIrep.mrbCodes[startPointer : endPointer]
+                    self.countSectionParse(endPointer - startPointer)
                     opcodeReader = OpCodeReader(tmpIrep, lvars, self, parentClass, CodeGen(), self.context.pushAndNew(ParsingState.METHOD))
-                    opcodeReader.parseOps()
+                    opcodeReader.irepPath = self.childIrepPath(opcode.Bz)
+                    opcodeReader.pcOffset = startPointer
+                    yield opcodeReader.parseOpsTask()
                     argVal = opcodeReader.registers[lvars.lvarRecords[lvarIndex].symbolRegister].value
 
                     args.append(MethodArgumentEx(argReg, argSym, argVal))
@@ -453,44 +614,97 @@ class OpCodeReader:
                 else:
                     raise Exception("Invalid for loop args")
 
-        # body
-        irep.mrbCodes = irep.mrbCodes[methodStartPointer:]
+        # body, a copy so the parsed file stays untouched and can be decompiled again
+        bodyIrep = copy.copy(irep)
+        bodyIrep.mrbCodes = irep.mrbCodes[methodStartPointer:]
+        self.countSectionParse(len(bodyIrep.mrbCodes))
         codeGen = CodeGen()
-        opcodeReader = OpCodeReader(irep, lvars, self, parentClass, codeGen, self.context.pushAndNew(innerState))
-        opcodeReader.parseOps()
+        opcodeReader = OpCodeReader(bodyIrep, lvars, self, parentClass, codeGen, self.context.pushAndNew(innerState))
+        opcodeReader.irepPath = self.childIrepPath(opcode.Bz)
+        opcodeReader.pcOffset = methodStartPointer
+        yield opcodeReader.parseOpsTask()
         body = codeGen.getExpressions()
 
         return args, body
 
-    def parseSection(self, start: int, end: int, newContext: ParsingContext|None = None, copyRegister = True) -> CodeGen:
+    def parseSection(self, start: int, end: int, newContext: ParsingContext|None = None, copyRegister = True) -> Task:
+        """Task that parses the instructions from start to end with a new reader and returns its CodeGen"""
         if start > end:
             raise Exception("Invalid section")
         tmpIrep = copy.copy(self.irep)
         tmpIrep.mrbCodes = tmpIrep.mrbCodes[start : end]
+        self.countSectionParse(end - start)
         codeGen = CodeGen()
-        opcodeReader = OpCodeReader(tmpIrep, self.lvars, self.parent, self.currentClass, codeGen, newContext or self.context, self.opcodes.fullOpcodes, self.opcodes.offset + start)
+        opcodeReader = OpCodeReader(tmpIrep, self.lvars, self.parent, self.currentClass, codeGen, newContext or self.context,
+                                    self.opcodes.fullOpcodes, self.opcodes.offset + start, self)
+        opcodeReader.irepPath = self.irepPath
+        opcodeReader.pcOffset = self.pcOffset
         if copyRegister:
             for i in range(len(self.registers)):
                 opcodeReader.registers[i] = copy.copy(self.registers[i])
-        opcodeReader.parseOps()
+        yield opcodeReader.parseOpsTask()
         return codeGen
 
-    def parseAndOrOr(self, jmpCode: MrbCodeAsBx, expClass: Type[AndEx|OrEx]):
+    def countSectionParse(self, opcodeCount: int):
+        opStats = activeOpStats()
+        if opStats is not None:
+            opStats.sectionParsed(opcodeCount)
+
+    def whenCondRegister(self) -> int|None:
+        return self.context.data["condRegister"] if self.context.isWhenCond() else None
+
+    def regionAt(self, pos: int) -> Region:
+        region = self.regions.get(pos)
+        if region is None:
+            # only after a region that the reader can't continue from
+            region = classifyJump(self.opcodes, pos, self.whenCondRegister(), self.context.isWhileLoop())
+        return region
+
+    def parseRegion(self, region: Region) -> Task|None:
+        """Handles the region of the jump at the current position, regions with sections return the task that parses them"""
+        jmpCode = cast(MrbCodeAsBx, self.opcodes[region.pos])
+        if region.kind == "next":
+            self.codeGen.pushExp(StatementEx(0, "next"))
+        elif region.kind == "break":
+            self.codeGen.pushExp(StatementEx(0, "break"))
+        elif region.kind == "skip":
+            self.opcodes.seek(region.resume)
+        elif region.kind == "unexpected":
+            self.codeGen.pushExp(RaiseEx(0, StringEx(0, f"ERROR: Unexpected JMP {'+' if jmpCode.sBx > 0 else ''}{jmpCode.sBx}! (continuing anyways)")))
+            for jmpOp in region.jumped:
+                self.codeGen.pushExp(LineCommentEx(0, str(jmpOp)))
+            self.reportUnhandledJmp(jmpCode, "error", "unexpectedJmp", f"ERROR: Unexpected JMP {'+' if jmpCode.sBx > 0 else ''}{jmpCode.sBx} ({len(region.jumped)})! (continuing anyways)")
+        elif region.kind == "while" or region.kind == "until":
+            return self.parseWhileOrUntil(region)
+        elif region.kind == "fallback":
+            self.JMPFallback(region)
+        elif region.kind == "whenCond":
+            self.reportBackWhenCond(jmpCode)
+        elif region.kind == "ifElse":
+            return self.parseIfElse(region)
+        elif region.kind == "if" or region.kind == "unless":
+            return self.parseIfOrUnless(region)
+        elif region.kind == "and":
+            return self.parseAndOrOr(region, AndEx)
+        elif region.kind == "or":
+            return self.parseAndOrOr(region, OrEx)
+        elif region.kind == "case":
+            return self.parseCase(region)
+        else:
+            raise Exception(f"Unknown region {region.kind}")
+        return None
+
+    @countStructure
+    def parseAndOrOr(self, region: Region, expClass: Type[AndEx|OrEx]) -> Task:
+        jmpCode = cast(MrbCodeAsBx, self.opcodes[region.pos])
         left = self.registers[jmpCode.A].valueOrSymbol
-        rightStart = self.opcodes.pos + 1
-        rightEnd =  self.opcodes.pos + jmpCode.sBx
+        rightStart, rightEnd = region.sections[0]
         innerContext = self.context.pushAndNew(ParsingState.IF, True)
-        body = self.parseSection(rightStart, rightEnd, innerContext, False).getExpressions()
-        if len(body) > 1 and expClass == AndEx:
-            # is actually and If block
-            self.pushIf(left, BlockEx(0, body))
-            self.opcodes.seek(rightEnd - 1)
-            return
-        if len(body) != 1:
-            raise Exception("Invalid OR/AND body length")
+        body = (yield self.parseSection(rightStart, rightEnd, innerContext, False)).getExpressions()
+        self.opcodes.seek(region.resume)
 
         reg = jmpCode.A
-        right = body[0]
+        right = body[0] if len(body) == 1 else SequenceEx(reg, body)
         exp = expClass(reg, left, right)
 
         self.registers[exp.register].load(exp)
@@ -499,76 +713,56 @@ class OpCodeReader:
         else:
             self.codeGen.pushExp(exp)
 
-        self.opcodes.seek(rightEnd - 1)
+    @countStructure
+    def parseIfOrUnless(self, region: Region) -> Task:
+        """`if`/`unless` without else, as a statement"""
+        jmpCode = cast(MrbCodeAsBx, self.opcodes[region.pos])
+        condition = self.registers[jmpCode.A].valueOrSymbol
+        bodyStart, bodyEnd = region.sections[0]
+        innerContext = self.context.pushAndNew(ParsingState.IF, True)
+        body = BlockEx(0, (yield self.parseSection(bodyStart, bodyEnd, innerContext, False)).getExpressions())
 
-    def parseJMPIF(self):
-        jmpCode = cast(MrbCodeAsBx, self.opcodes.cur())
-        orEnd = self.opcodes.pos + jmpCode.sBx
-        caseEndCode = self.opcodes[orEnd - 1] if orEnd < len(self.opcodes) else None
-        if self.context.isWhenCond() and self.isOpcodeWhenConditionLite(jmpCode, self.context.data["condRegister"]):
-            self.reportBackWhenCond(jmpCode)
-        elif caseEndCode and caseEndCode.opcode == AllOpCodes.OP_JMP and caseEndCode.sBx > 0 and jmpCode.sBx > 0:
-            self.parseCase(jmpCode)
-        else:
-            self.parseAndOrOr(jmpCode, OrEx)
-
-    def parseJMPNOT(self):
-        jmpCode = cast(MrbCodeAsBx, self.opcodes.cur())
-        andEnd = self.opcodes.pos + jmpCode.sBx
-        ifEndCode = self.opcodes[andEnd - 1]
-        if ifEndCode.opcode == AllOpCodes.OP_JMP and ifEndCode.sBx > 0 and ((andEnd + ifEndCode.sBx - 1) <= len(self.opcodes)):
-            self.parseIfElse(jmpCode, andEnd + ifEndCode.sBx - 1)
+        if region.kind == "if":
+            self.pushIf(condition, body)
         else:
-            self.parseAndOrOr(jmpCode, AndEx)
+            self.pushIf(condition, BlockEx(0, []), body)
+        self.opcodes.seek(region.resume)
 
-    def parseIfElse(self, jmpCode: MrbCodeAsBx, elseEnd: int):
-        ifStart = self.opcodes.pos + 1
-        ifEnd = self.opcodes.pos + jmpCode.sBx - 1
-        elseStart = self.opcodes.pos + jmpCode.sBx
+    @countStructure
+    def parseIfElse(self, region: Region) -> Task:
+        jmpCode = cast(MrbCodeAsBx, self.opcodes[region.pos])
+        (ifStart, ifEnd), (elseStart, elseEnd) = region.sections
 
         condition = self.registers[jmpCode.A].valueOrSymbol
         innerContext = self.context.pushAndNew(ParsingState.IF, True)
-        ifBody = self.parseSection(ifStart, ifEnd, innerContext).getExpressions()
-        elseBody = self.parseSection(elseStart, elseEnd, innerContext).getExpressions()
+        ifBody = (yield self.parseSection(ifStart, ifEnd, innerContext)).getExpressions()
+        elseBody = (yield self.parseSection(elseStart, elseEnd, innerContext)).getExpressions()
 
         self.pushIf(condition, BlockEx(0, ifBody), BlockEx(0, elseBody))
-        self.opcodes.seek(elseEnd - 1)
+        self.opcodes.seek(region.resume)
 
     def pushIf(self, condition: Expression, ifBlock: BlockEx, elseBlock: BlockEx|None = None):
         exp = IfEx(0, condition, ifBlock, elseBlock)
         self.codeGen.pushExp(exp)
 
-    def parseWhileOrUntil(self):
-        jmpToCondCode = cast(MrbCodeAsBx, self.opcodes.cur())
-        condStart = self.opcodes.pos + jmpToCondCode.sBx
-        condEnd = condStart + 1
-        condEndJmp = cast(MrbCodeAsBx, self.opcodes[condEnd])
-        while not (condEndJmp.opcode in { AllOpCodes.OP_JMPIF, AllOpCodes.OP_JMPNOT } and condEndJmp.sBx < 0):
-            condEnd += 1
-            if condEnd >= len(self.opcodes):
-                self.JMPFallback(jmpToCondCode)
-                return
-            condEndJmp = self.opcodes[condEnd]
-        loopType = "while" if condEndJmp.opcode == AllOpCodes.OP_JMPIF else "until"
-
-        conditionBody = self.parseSection(condStart, condEnd).getExpressions()
-        if len(conditionBody) != 1:
-            raise Exception("Invalid while condition body length")
-        condition = conditionBody[0]
-
-        bodyStart = self.opcodes.pos + 1
-        bodyEnd = condStart
+    @countStructure
+    def parseWhileOrUntil(self, region: Region) -> Task:
+        (condStart, condEnd), (bodyStart, bodyEnd) = region.sections
+        conditionBody = (yield self.parseSection(condStart, condEnd)).getExpressions()
+        condition = conditionBody[0] if len(conditionBody) == 1 else SequenceEx(0, conditionBody)
+
         innerContext = self.context.pushAndNew(ParsingState.WHILE_LOOP, True)
-        body = self.parseSection(bodyStart, bodyEnd, innerContext).getExpressions()
-        exp = WhileOrUntilEx(0, loopType, condition, BlockEx(0, body))
+        body = (yield self.parseSection(bodyStart, bodyEnd, innerContext)).getExpressions()
+        exp = WhileOrUntilEx(0, region.kind, condition, BlockEx(0, body))
 
         self.codeGen.pushExp(exp)
-        self.opcodes.seek(condEnd)
+        self.opcodes.seek(region.resume)
 
     def reportBackWhenCond(self, jmpCode: MrbCodeAsBx):
         self.context.callback(self.registers[jmpCode.A].valueOrSymbol)
 
-    def parseCaseWhenCond(self, start: int, end: int, condRegister: int, caseEnd: int) -> List[Expression]:
+    def parseCaseWhenCond(self, start: int, end: int, condRegister: int, caseEnd: int) -> Task:
+        """Task that returns the conditions of a when"""
         if start >= end or start + 1 == end and self.opcodes[start].opcode == AllOpCodes.OP_JMP:
             return []
         conditions: List[Expression] = []
@@ -576,69 +770,23 @@ class OpCodeReader:
         subContext.data["condRegister"] = condRegister
         subContext.data["caseEnd"] = caseEnd
         subContext.callback = lambda exp: conditions.append(exp)
-        self.parseSection(start, end, subContext)
+        yield self.parseSection(start, end, subContext)
         return conditions
 
-    def parseCase(self, jmpCode: MrbCodeAsBx):
+    @countStructure
+    def parseCase(self, region: Region) -> Task:
         whenBlocks: List[CaseWhenEx] = []
         elseBlock: BlockEx|None = None
-        condRegister = jmpCode.A
-
-        condStart = self.opcodes.pos
-        condEnd = self.opcodes.pos + jmpCode.sBx
-        curWhenConditions: List[Expression] = []
-
-        condEndJmpPos = condEnd - 1
-        elseJMP = self.opcodes[condEndJmpPos]
-        caseEndJmpPos = condEndJmpPos + elseJMP.sBx - 1
-        caseEndJMP = self.opcodes[caseEndJmpPos]
-        caseEnd = caseEndJmpPos + caseEndJMP.sBx
-
-        while condStart + 1 < caseEnd:
-            # blockType = "COND"
-            # elseData: List[Expression]|None = None
-            # def blockCallback(blType: str, blData: List[Expression]):
-            #     nonlocal blockType, elseData
-            #     blockType = blType
-            #     if blType == "COND":
-            #         curWhenConditions.append(blData)
-            #     else:
-            #         elseData = blData
-            # subContext = self.context.pushAndNew(ParsingState.WHEN_COND_OR_ELSE)
-            # subContext.callback = blockCallback
-            # self.parseSection(condStart, condEnd, subContext)
-            # if blockType == "ELSE":
-            #     elseBlock = BlockEx(0, elseData)
-            #     break
-            # elif blockType == "COND" and len(curWhenConditions) == 0:
-            #     break
-            foundConditions = 0
-            isLastWhenBlock: bool|None = None
-            pos = condStart
-            while pos < caseEnd and self.opcodes[pos].opcode != AllOpCodes.OP_JMP:
-                isWhenCondition, _isLastWhenBlock = self.isOpcodeWhenConditionFull(self.opcodes[pos], pos, condRegister, caseEnd)
-                if isWhenCondition:
-                    foundConditions += 1
-                    isLastWhenBlock = _isLastWhenBlock
-                pos += 1
-            if foundConditions == 0:
-                elseBody = self.parseSection(condStart, caseEnd - 1).getExpressions()
-                elseBlock = BlockEx(0, elseBody)
-                break
-
-            condEnd = pos
-            curWhenConditions.extend(self.parseCaseWhenCond(condStart, condEnd, condRegister, caseEnd - condStart))
-
-            elseJMP = self.opcodes[condEnd]
-            whenBodyStart = condEnd + 1
-            whenBodyEnd = condEnd + elseJMP.sBx - 1
-            whenBody = self.parseSection(whenBodyStart, whenBodyEnd).getExpressions()
-            whenBlocks.append(CaseWhenEx(curWhenConditions, BlockEx(0, whenBody)))
-
-            curWhenConditions.clear()
-            condStart = whenBodyEnd + 1
-            if isLastWhenBlock:
-                break
+        condRegister = cast(MrbCodeAsBx, self.opcodes[region.pos]).A
+        caseEnd = region.resume + 1
+
+        for (condStart, condEnd), (whenBodyStart, whenBodyEnd) in region.whens:
+            conditions = yield self.parseCaseWhenCond(condStart, condEnd, condRegister, caseEnd - condStart)
+            whenBody = (yield self.parseSection(whenBodyStart, whenBodyEnd)).getExpressions()
+            whenBlocks.append(CaseWhenEx(conditions, BlockEx(0, whenBody)))
+        if region.elseSection is not None:
+            elseBody = (yield self.parseSection(*region.elseSection)).getExpressions()
+            elseBlock = BlockEx(0, elseBody)
 
         # check if all when conditions are like EXP(variable) === EXP(same)
         caseVar: Expression|None = None
@@ -666,64 +814,25 @@ class OpCodeReader:
 
         exp = CaseEx(0, caseVar, whenBlocks, elseBlock)    # TODO case as assignment
         self.codeGen.pushExp(exp)
-        self.opcodes.seek(caseEnd - 1)
-
-    def JMPFallback(self, jmpCode: MrbCodeAsBx):
-        if jmpCode.sBx >= 0:
-            print(f"Warning: JMP outside of known control flow: {jmpCode}")
-            self.codeGen.pushExp(LineCommentEx(0, jmpCode))
-            for mrbCode in self.opcodes[self.opcodes.pos : self.opcodes.pos + jmpCode.sBx]:
-                self.codeGen.pushExp(LineCommentEx(0, mrbCode))
-            self.opcodes.seek(self.opcodes.pos + jmpCode.sBx)
-        else:
-            raise Exception("Negative unhandled JMP")
-
-    def isOpcodeWhenConditionFull(self, jmpIf: MrbCodeAsBx, curPos: int, condRegister: int, caseEnd: int) -> Tuple[bool, bool]:
-        """returns: isWhenCondition, isLastWhenBlock"""
-        # last, jmp to condEnd - 1
-        # non-last when, else jmp to condEnd
-        # valid condition if:
-        # --> opcodes[pos] == JMPIF
-        # --> JMPIF.sBx > 0
-        # --> JMPIF.A == condRegister
-        # --> JMPIF.target - 1 == JMP (elseJMP)
-        # --> elseJMP.sBx > 0 && elseJMP.target < caseEnd
-        # --> elseJMP.target - 1 == JMP (whenEndJMP)
-        # --> whenEndJMP.target == caseEnd || whenEndJMP.target == caseEnd - 1
-        nope = False, False
-        if jmpIf.opcode != AllOpCodes.OP_JMPIF:
-            return nope
-        if jmpIf.sBx < 0:
-            return nope
-        if jmpIf.A != condRegister:
-            return nope
-        elseJmpPos = curPos + jmpIf.sBx - 1
-        if elseJmpPos > caseEnd:
-            return nope
-        elseJmp = cast(MrbCodeAsBx, self.opcodes[elseJmpPos])
-        if elseJmp.opcode != AllOpCodes.OP_JMP:
-            return nope
-        whenEndJmpPos = elseJmpPos + elseJmp.sBx - 1
-        if elseJmp.sBx < 0 or whenEndJmpPos > caseEnd:
-            return nope
-        whenEndJmp = cast(MrbCodeAsBx, self.opcodes[whenEndJmpPos])
-        if whenEndJmp.opcode != AllOpCodes.OP_JMP or whenEndJmp.sBx < 0:
-            return nope
-        whenEndJmpTarget = whenEndJmpPos + whenEndJmp.sBx
-        if whenEndJmpTarget == caseEnd:
-            return True, False
-        if whenEndJmpTarget == caseEnd - 1:
-            return True, True
-        return nope
-
-    def isOpcodeWhenConditionLite(self, jmpIf: MrbCodeAsBx, condRegister: int) -> bool:
-        """returns: isWhenCondition, isLastWhenBlock"""
-        # --> whenEndJMP.target == caseEnd || whenEndJMP.target == caseEnd - 1
-        if jmpIf.opcode != AllOpCodes.OP_JMPIF:
-            return False
-        if jmpIf.sBx < 0:
-            return False
-        if jmpIf.A != condRegister:
-            return False
-        return True
-
+        self.opcodes.seek(region.resume)
+
+    def JMPFallback(self, region: Region):
+        jmpCode = cast(MrbCodeAsBx, self.opcodes[region.pos])
+        self.reportUnhandledJmp(jmpCode, "warning", "jmpFallback", f"Warning: JMP outside of known control flow: {jmpCode}")
+        self.codeGen.pushExp(LineCommentEx(0, jmpCode))
+        for mrbCode in self.opcodes[region.pos : region.resume]:
+            self.codeGen.pushExp(LineCommentEx(0, mrbCode))
+        self.opcodes.seek(region.resume)
+
+    def childIrepPath(self, index: int) -> str:
+        return f"/{index}" if self.irepPath == "/" else f"{self.irepPath}/{index}"
+
+    def pc(self) -> int:
+        """pc of the current instruction in its irep"""
+        return self.pcOffset + self.opcodes.offset + self.opcodes.pos
+
+    def reportUnhandledJmp(self, jmpCode: MrbCode, severity: str, kind: str, message: str):
+        report(severity, kind, message, self.irepPath, self.pc(), OPCODE_NAMES[jmpCode.opcode])
+        listener = unhandledJmpListener.get()
+        if listener is not None:
+            listener(jmpCode, message)
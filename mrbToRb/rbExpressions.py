@@ -1,7 +1,8 @@
 from __future__ import annotations
 
-from typing import Any, List, Dict, Set
+from typing import Any, List, Dict, FrozenSet, Tuple
 import re
+import threading
 
 from utils import prefixLines
 
@@ -54,6 +55,13 @@ OperatorPriority: Dict[str, int] = {
 	"**=": 15,
 }
 
+# float literals as mrbc stores them in the pool, for example 2.5000000000000000e+00
+FLOAT_POOL_PATTERN = re.compile(r"\d+\.\d+e[+-]\d+")
+
+
+# str() nesting of the current thread, past MAX_RECURSIVE_DEPTH sub expressions are rendered by renderIteratively()
+_renderState = threading.local()
+MAX_RECURSIVE_DEPTH = 100
 
 class Expression:
 	"""If true, this expression might be optimized away from the output code."""
@@ -62,6 +70,7 @@ class Expression:
 	requiresParentheses: bool
 	register: int
 	associatedSymbol: Expression|None
+	rendered: str|None		# only set during render()
 
 	def __init__(self, register: int):
 		self.hasUsages = False
@@ -69,9 +78,19 @@ class Expression:
 		self.requiresParentheses = True
 		self.register = register
 		self.associatedSymbol = None
+		self.rendered = None
 
 	def __str__(self):
-		return self._toStr()
+		if self.rendered is not None:
+			return self.rendered
+		depth = getattr(_renderState, "depth", 0)
+		if depth >= MAX_RECURSIVE_DEPTH:
+			return renderIteratively(self)
+		_renderState.depth = depth + 1
+		try:
+			return self._toStr()
+		finally:
+			_renderState.depth = depth
 
 	def _toStr(self):
 		raise NotImplementedError()
@@ -100,7 +119,7 @@ class LiteralEx(AnyValueExpression):
 
 	def _toStr(self):
 		strVal = str(self.value)
-		if re.match(r"\d+\.\d+e[+-]\d+", strVal):
+		if "e" in strVal and FLOAT_POOL_PATTERN.match(strVal):
 			return str(float(strVal))
 		else:
 			return strVal
@@ -198,7 +217,20 @@ class BlockEx(Expression):
 		else:
 			return "\n".join(map(str, self.expressions))
 
-AllOperatorsTwoExp: Set[str] = {
+class SequenceEx(Expression):
+	"""Statements used as one value, the value of the last one: `(a; b)`"""
+	expressions: List[Expression]
+
+	def __init__(self, register: int, expressions: List[Expression]):
+		super().__init__(register)
+		self.expressions = expressions
+		for expression in expressions:
+			expression.hasUsages = True
+
+	def _toStr(self):
+		return f"({'; '.join(map(str, self.expressions))})"
+
+AllOperatorsTwoExp: FrozenSet[str] = frozenset({
 	"*", "/", "%", "+", "-", "**",
 	"<<", ">>",
 	"&", "|", "^",
@@ -207,10 +239,12 @@ AllOperatorsTwoExp: Set[str] = {
 	"..", "...",
 	"?", ":",
 	"=", "+=", "-=", "*=", "/=", "%=", "&=", "|=", "^=", "<<=", ">>=", "&&=", "||=", "**=",
-}
-AllUnaryOperators: Set[str] = {
+})
+AllUnaryOperators: FrozenSet[str] = frozenset({
 	"+@", "-@", "~", "!",
-}
+})
+# number of arguments of a method call that is written as an operator, built once instead of two lookups per call
+OperatorCallArgs: Dict[str, int] = { **{ op: 1 for op in AllOperatorsTwoExp }, **{ op: 0 for op in AllUnaryOperators } }
 
 class MethodCallEx(Expression):
 	srcObj: Expression|None
@@ -225,8 +259,9 @@ class MethodCallEx(Expression):
 		self.srcObj = srcObj
 		self.symbol = symbol
 		self.args = args
-		self.isOperatorCall = str(symbol) in AllOperatorsTwoExp and len(args) == 1 or str(symbol) in AllUnaryOperators and len(args) == 0
-		self.operatorPriority = OperatorPriority.get(str(symbol), 99)
+		symbolName = str(symbol)
+		self.isOperatorCall = OperatorCallArgs.get(symbolName) == len(args)
+		self.operatorPriority = OperatorPriority.get(symbolName, 99)
 		if srcObj is not None:
 			srcObj.hasUsages = True
 		symbol.hasUsages = True
@@ -299,9 +334,9 @@ class ArrayEx(Expression):
 			elementsTotalLen = sum(map(len, elements)) + 2 * (len(elements) - 1)
 			if elementsTotalLen > 80:
 				joiner = ",\n\t"
-				return f"[\n\t{joiner.join(map(str, self.elements))}\n]"
+				return f"[\n\t{joiner.join(elements)}\n]"
 			else:
-				return f"[ {', '.join(map(str, self.elements))} ]"
+				return f"[ {', '.join(elements)} ]"
 
 class ArrayConcatEx(TwoExpEx):
 	def _toStr(self):
@@ -365,14 +400,14 @@ class StringConcatEx(TwoExpEx):
 
 	def flattenConcat(self) -> List[Expression]:
 		flat: List[Expression] = []
-		if isinstance(self.left, StringConcatEx):
-			flat.extend(self.left.flattenConcat())
-		else:
-			flat.append(self.left)
-		if isinstance(self.right, StringConcatEx):
-			flat.extend(self.right.flattenConcat())
-		else:
-			flat.append(self.right)
+		stack: List[Expression] = [self.right, self.left]
+		while stack:
+			exp = stack.pop()
+			if isinstance(exp, StringConcatEx):
+				stack.append(exp.right)
+				stack.append(exp.left)
+			else:
+				flat.append(exp)
 		return flat
 
 class HashEx(Expression):
@@ -394,7 +429,8 @@ class HashEx(Expression):
 		else:
 			lines = []
 			for key, value in self.hash.items():
-				if re.match(r"^\d", str(key)):
+				key = str(key)
+				if key[:1].isdecimal():
 					key = f"\"{key}\""
 				lines.append(f"\t{key} => {value},")
 			newLine = "\n"
@@ -690,3 +726,76 @@ class RaiseEx(StatementEx):
 
 	def _toStr(self):
 		return f"raise {self.exception}"
+
+
+# attributes of every Expression that never hold a sub expression to render
+_NON_CHILD_ATTRIBUTES = frozenset({ "hasUsages", "canBeOptimizedAway", "requiresParentheses", "register", "associatedSymbol", "rendered" })
+
+def subExpressions(exp: Expression) -> List[Expression]:
+	"""Expressions that exp can render, directly or in lists and dicts"""
+	children: List[Expression] = []
+	for name, value in vars(exp).items():
+		if name in _NON_CHILD_ATTRIBUTES or value is None:
+			continue
+		if isinstance(value, Expression):
+			children.append(value)
+		elif isinstance(value, (list, tuple)):
+			children.extend(item for item in value if isinstance(item, Expression))
+		elif isinstance(value, dict):
+			for key, item in value.items():
+				if isinstance(key, Expression):
+					children.append(key)
+				if isinstance(item, Expression):
+					children.append(item)
+	return children
+
+def render(root: Expression) -> str:
+	"""
+	str(root). Nesting doesn't hit the recursion limit: str() renders the first MAX_RECURSIVE_DEPTH levels recursively
+	and hands every deeper sub expression to renderIteratively(), so each expression is rendered once.
+	"""
+	return str(root)
+
+def renderIteratively(root: Expression) -> str:
+	"""
+	All sub expressions are rendered bottom up first, a parent then only joins the strings of its children.
+	The string of a child is dropped once all of its parents are rendered. Leaves (expressions without sub
+	expressions) are rendered by their parents directly, they can't recurse.
+	"""
+	children: Dict[int, List[Expression]] = {}
+	parentCounts: Dict[int, int] = {}
+	order: List[Expression] = []
+	stack: List[Tuple[Expression, bool]] = [(root, False)]
+	while stack:
+		exp, childrenDone = stack.pop()
+		if childrenDone:
+			order.append(exp)
+			continue
+		if id(exp) in children:
+			continue
+		expChildren = subExpressions(exp)
+		children[id(exp)] = expChildren
+		if not expChildren and exp is not root:
+			continue
+		stack.append((exp, True))
+		for child in expChildren:
+			parentCounts[id(child)] = parentCounts.get(id(child), 0) + 1
+			if id(child) not in children:
+				stack.append((child, False))
+
+	# the children are rendered, the str() calls of a parent don't nest
+	depth = getattr(_renderState, "depth", 0)
+	_renderState.depth = 0
+	try:
+		for exp in order:
+			exp.rendered = exp._toStr()
+			for child in children[id(exp)]:
+				childId = id(child)
+				parentCounts[childId] -= 1
+				if parentCounts[childId] == 0:
+					child.rendered = None
+		return str(root)
+	finally:
+		_renderState.depth = depth
+		for exp in order:
+			exp.rendered = None
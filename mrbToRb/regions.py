@@ -0,0 +1,236 @@
+"""
+Structuring pass for the jumps of a section.
+
+Before an OpCodeReader builds any expression, the jumps it will reach are classified into regions (if/else, and/or,
+if/unless without else, while/until, case/when, next/break) with all their section bounds. The reader then builds every region exactly once
+from these bounds, without looking at the jump shapes again.
+
+All positions are relative to the section (the OpCodeFeed), the same way OpCodeReader sees them.
+"""
+from __future__ import annotations
+import bisect
+from typing import Dict, List, Tuple, cast
+
+from budget import checkBudget
+from mrbToRb.opCodeFeed import OpCodeFeed
+from opcodes import JUMP_OPCODES, AllOpCodes, MrbCode, MrbCodeAsBx
+
+# the jumps that regions are built from. OP_ONERR (the jump to a rescue handler) doesn't open a region, rescue isn't decompiled
+BRANCH_OPCODES = JUMP_OPCODES - { AllOpCodes.OP_ONERR }
+# instructions that write their result to register A
+VALUE_OPCODES = frozenset({
+    AllOpCodes.OP_LOADL, AllOpCodes.OP_LOADI, AllOpCodes.OP_LOADSYM, AllOpCodes.OP_LOADNIL, AllOpCodes.OP_LOADSELF,
+    AllOpCodes.OP_LOADT, AllOpCodes.OP_LOADF, AllOpCodes.OP_GETGLOBAL, AllOpCodes.OP_GETSPECIAL, AllOpCodes.OP_GETIV,
+    AllOpCodes.OP_GETCV, AllOpCodes.OP_GETCONST, AllOpCodes.OP_GETMCNST, AllOpCodes.OP_GETUPVAR, AllOpCodes.OP_SEND,
+    AllOpCodes.OP_SENDB, AllOpCodes.OP_FSEND, AllOpCodes.OP_CALL, AllOpCodes.OP_SUPER, AllOpCodes.OP_ARGARY,
+    AllOpCodes.OP_BLKPUSH, AllOpCodes.OP_ADD, AllOpCodes.OP_ADDI, AllOpCodes.OP_SUB, AllOpCodes.OP_SUBI, AllOpCodes.OP_MUL,
+    AllOpCodes.OP_DIV, AllOpCodes.OP_EQ, AllOpCodes.OP_LT, AllOpCodes.OP_LE, AllOpCodes.OP_GT, AllOpCodes.OP_GE,
+    AllOpCodes.OP_ARRAY, AllOpCodes.OP_ARYCAT, AllOpCodes.OP_ARYPUSH, AllOpCodes.OP_AREF, AllOpCodes.OP_APOST,
+    AllOpCodes.OP_STRING, AllOpCodes.OP_STRCAT, AllOpCodes.OP_HASH, AllOpCodes.OP_LAMBDA, AllOpCodes.OP_RANGE,
+    AllOpCodes.OP_OCLASS, AllOpCodes.OP_CLASS, AllOpCodes.OP_MODULE, AllOpCodes.OP_EXEC, AllOpCodes.OP_SCLASS,
+    AllOpCodes.OP_TCLASS, AllOpCodes.OP_RESCUE,
+})
+# instructions that assign register A to a variable, the value stays in A
+ASSIGNMENT_OPCODES = frozenset({
+    AllOpCodes.OP_SETGLOBAL, AllOpCodes.OP_SETSPECIAL, AllOpCodes.OP_SETIV, AllOpCodes.OP_SETCV, AllOpCodes.OP_SETCONST,
+    AllOpCodes.OP_SETMCNST, AllOpCodes.OP_SETUPVAR,
+})
+
+# (start, end) of a section, end is exclusive
+Section = Tuple[int, int]
+
+class Region:
+    kind: str                   # next, break, skip, unexpected, while, until, fallback, ifElse, if, unless, and, or, case, whenCond
+    pos: int                    # position of the jump
+    resume: int                 # position of the last instruction of the region, parsing continues after it
+    sections: List[Section]     # ifElse: if, else;  if/unless: body;  and/or: right side;  while/until: condition, body
+    whens: List[Tuple[Section, Section]]    # case: (conditions, body) of every when
+    elseSection: Section|None   # case: else body
+    jumped: List[MrbCode]       # unexpected: the instructions that are jumped over
+
+    def __init__(self, kind: str, pos: int, resume: int, sections: List[Section]|None = None) -> None:
+        self.kind = kind
+        self.pos = pos
+        self.resume = resume
+        self.sections = sections or []
+        self.whens = []
+        self.elseSection = None
+        self.jumped = []
+
+def classifyJump(opcodes: OpCodeFeed, pos: int, whenCondRegister: int|None, isWhileLoop: bool) -> Region:
+    """
+    Region of the jump at pos. whenCondRegister is the case register inside of when conditions, isWhileLoop
+    if the section is (inside of) a while loop body.
+    """
+    code = cast(MrbCodeAsBx, opcodes[pos])
+    if code.opcode == AllOpCodes.OP_JMP:
+        if code.sBx < 0:
+            return Region("next", pos, pos)
+        if pos + code.sBx >= len(opcodes):
+            return classifyExit(opcodes, pos, code, isWhileLoop)
+        return classifyLoop(opcodes, pos, code)
+    if code.opcode == AllOpCodes.OP_JMPIF:
+        if whenCondRegister is not None and isWhenConditionLite(code, whenCondRegister):
+            return Region("whenCond", pos, pos)
+        orEnd = pos + code.sBx
+        caseEndCode = opcodes[orEnd - 1] if orEnd < len(opcodes) else None
+        if caseEndCode and caseEndCode.opcode == AllOpCodes.OP_JMP and caseEndCode.sBx > 0 and code.sBx > 0:
+            return classifyCase(opcodes, pos, code)
+        # a right side that doesn't leave its value in the register is a statement: `unless left`
+        kind = "or" if leavesValueIn(opcodes[orEnd - 1], code.A) else "unless"
+        return Region(kind, pos, orEnd - 1, [(pos + 1, orEnd)])
+    if code.opcode == AllOpCodes.OP_JMPNOT:
+        andEnd = pos + code.sBx
+        ifEndCode = opcodes[andEnd - 1]
+        if ifEndCode.opcode == AllOpCodes.OP_JMP and ifEndCode.sBx > 0 and ((andEnd + ifEndCode.sBx - 1) <= len(opcodes)):
+            elseEnd = andEnd + ifEndCode.sBx - 1
+            return Region("ifElse", pos, elseEnd - 1, [(pos + 1, andEnd - 1), (andEnd, elseEnd)])
+        kind = "and" if leavesValueIn(ifEndCode, code.A) else "if"
+        return Region(kind, pos, andEnd - 1, [(pos + 1, andEnd)])
+    raise Exception(f"Not a jump: {code}")
+
+def leavesValueIn(code: MrbCode, register: int) -> bool:
+    """True if the value of the instruction ends up in register: it's written there, or assigned from there"""
+    if code.opcode == AllOpCodes.OP_MOVE:
+        return code.A == register or code.B == register
+    if code.opcode in VALUE_OPCODES or code.opcode in ASSIGNMENT_OPCODES:
+        return code.A == register
+    return False
+
+def classifyExit(opcodes: OpCodeFeed, pos: int, jmpCode: MrbCodeAsBx, isWhileLoop: bool) -> Region:
+    """JMP past the end of the section"""
+    if isWhileLoop:
+        return Region("break", pos, pos)
+    jumpedOpcodes = opcodes.getJumpedOpcodes(pos, jmpCode.sBx)
+    # a few unreachable instructions before the end, for example the nil of an if without else
+    if len(jumpedOpcodes) == 0 or len(jumpedOpcodes) <= 2 and all(not code.stats.isReachable for code in jumpedOpcodes):
+        return Region("skip", pos, pos + jmpCode.sBx)
+    region = Region("unexpected", pos, pos)
+    region.jumped = jumpedOpcodes
+    return region
+
+def classifyLoop(opcodes: OpCodeFeed, pos: int, jmpToCondCode: MrbCodeAsBx) -> Region:
+    """JMP to the condition at the end of the loop, which jumps back to the start of the body"""
+    condStart = pos + jmpToCondCode.sBx
+    condEnd = condStart + 1
+    condEndJmp = cast(MrbCodeAsBx, opcodes[condEnd])
+    while not (condEndJmp.opcode in { AllOpCodes.OP_JMPIF, AllOpCodes.OP_JMPNOT } and condEndJmp.sBx < 0):
+        # the scans of nested loops overlap, a deep nesting of loops scans the same instructions many times
+        checkBudget()
+        condEnd += 1
+        if condEnd >= len(opcodes):
+            return Region("fallback", pos, pos + jmpToCondCode.sBx)
+        condEndJmp = opcodes[condEnd]
+    if not leavesValueIn(opcodes[condEnd - 1], condEndJmp.A):
+        return Region("fallback", pos, pos + jmpToCondCode.sBx)
+    loopType = "while" if condEndJmp.opcode == AllOpCodes.OP_JMPIF else "until"
+    return Region(loopType, pos, condEnd, [(condStart, condEnd), (pos + 1, condStart)])
+
+def classifyCase(opcodes: OpCodeFeed, pos: int, jmpCode: MrbCodeAsBx) -> Region:
+    condRegister = jmpCode.A
+    condStart = pos
+    condEnd = pos + jmpCode.sBx
+
+    condEndJmpPos = condEnd - 1
+    elseJMP = opcodes[condEndJmpPos]
+    caseEndJmpPos = condEndJmpPos + elseJMP.sBx - 1
+    caseEndJMP = opcodes[caseEndJmpPos]
+    caseEnd = caseEndJmpPos + caseEndJMP.sBx
+    region = Region("case", pos, caseEnd - 1)
+
+    while condStart + 1 < caseEnd:
+        checkBudget()
+        foundConditions = 0
+        isLastWhenBlock: bool|None = None
+        condPos = condStart
+        while condPos < caseEnd and opcodes[condPos].opcode != AllOpCodes.OP_JMP:
+            isWhenCondition, _isLastWhenBlock = isWhenConditionFull(opcodes, opcodes[condPos], condPos, condRegister, caseEnd)
+            if isWhenCondition:
+                foundConditions += 1
+                isLastWhenBlock = _isLastWhenBlock
+            condPos += 1
+        if foundConditions == 0:
+            region.elseSection = (condStart, caseEnd - 1)
+            break
+
+        condEnd = condPos
+        elseJMP = opcodes[condEnd]
+        whenBodyStart = condEnd + 1
+        whenBodyEnd = condEnd + elseJMP.sBx - 1
+        region.whens.append(((condStart, condEnd), (whenBodyStart, whenBodyEnd)))
+
+        condStart = whenBodyEnd + 1
+        if isLastWhenBlock:
+            break
+    return region
+
+def isWhenConditionFull(opcodes: OpCodeFeed, jmpIf: MrbCodeAsBx, curPos: int, condRegister: int, caseEnd: int) -> Tuple[bool, bool]:
+    """returns: isWhenCondition, isLastWhenBlock"""
+    # last, jmp to condEnd - 1
+    # non-last when, else jmp to condEnd
+    # valid condition if:
+    # --> opcodes[pos] == JMPIF
+    # --> JMPIF.sBx > 0
+    # --> JMPIF.A == condRegister
+    # --> JMPIF.target - 1 == JMP (elseJMP)
+    # --> elseJMP.sBx > 0 && elseJMP.target < caseEnd
+    # --> elseJMP.target - 1 == JMP (whenEndJMP)
+    # --> whenEndJMP.target == caseEnd || whenEndJMP.target == caseEnd - 1
+    nope = False, False
+    if jmpIf.opcode != AllOpCodes.OP_JMPIF:
+        return nope
+    if jmpIf.sBx < 0:
+        return nope
+    if jmpIf.A != condRegister:
+        return nope
+    elseJmpPos = curPos + jmpIf.sBx - 1
+    if elseJmpPos > caseEnd:
+        return nope
+    elseJmp = cast(MrbCodeAsBx, opcodes[elseJmpPos])
+    if elseJmp.opcode != AllOpCodes.OP_JMP:
+        return nope
+    whenEndJmpPos = elseJmpPos + elseJmp.sBx - 1
+    if elseJmp.sBx < 0 or whenEndJmpPos > caseEnd:
+        return nope
+    whenEndJmp = cast(MrbCodeAsBx, opcodes[whenEndJmpPos])
+    if whenEndJmp.opcode != AllOpCodes.OP_JMP or whenEndJmp.sBx < 0:
+        return nope
+    whenEndJmpTarget = whenEndJmpPos + whenEndJmp.sBx
+    if whenEndJmpTarget == caseEnd:
+        return True, False
+    if whenEndJmpTarget == caseEnd - 1:
+        return True, True
+    return nope
+
+def isWhenConditionLite(jmpIf: MrbCodeAsBx, condRegister: int) -> bool:
+    if jmpIf.opcode != AllOpCodes.OP_JMPIF:
+        return False
+    if jmpIf.sBx < 0:
+        return False
+    if jmpIf.A != condRegister:
+        return False
+    return True
+
+def findJumpPositions(opcodes: OpCodeFeed) -> List[int]:
+    """Positions of all branches (BRANCH_OPCODES) of the whole irep (opcodes.fullOpcodes)"""
+    return [i for i, code in enumerate(opcodes.fullOpcodes) if code.opcode in BRANCH_OPCODES]
+
+def findRegions(opcodes: OpCodeFeed, whenCondRegister: int|None, isWhileLoop: bool, jumpPositions: List[int]) -> Dict[int, Region]:
+    """
+    Regions of all jumps that the reader of this section will reach, by position. Follows the same path as
+    OpCodeReader.parseOps(): nested sections are skipped, they get their own regions when their reader is created.
+    jumpPositions are those of findJumpPositions(), only the jumps of this section are looked at.
+    """
+    regions: Dict[int, Region] = {}
+    end = opcodes.offset + len(opcodes)
+    i = bisect.bisect_left(jumpPositions, opcodes.offset)
+    while i < len(jumpPositions) and jumpPositions[i] < end:
+        checkBudget()
+        jumpPos = jumpPositions[i] - opcodes.offset
+        region = classifyJump(opcodes, jumpPos, whenCondRegister, isWhileLoop)
+        regions[jumpPos] = region
+        if region.resume < jumpPos:
+            # invalid backwards region, the reader fails there
+            break
+        i = bisect.bisect_left(jumpPositions, opcodes.offset + region.resume + 1, i + 1)
+    return regions
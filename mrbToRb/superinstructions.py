@@ -0,0 +1,57 @@
+"""
+Optional pre-pass that fuses common instruction sequences into a single step of OpCodeReader.
+
+Most of a script are plain method calls: a receiver load (LOADSELF, GETCONST or a MOVE of a local variable), the
+argument loads (literals, variables, constants) and the SEND. OpCodeReader.step() handles them one instruction at a
+time, with a register load and a CodeGen entry for every receiver and argument that the SEND then marks as used again.
+A fused call is built by OpCodeReader.parseFusedCall() in one step instead. The output is the same either way, the pass can be switched off with `superinstructionsEnabled`.
+
+All positions are relative to the section (the OpCodeFeed), the same way OpCodeReader sees them.
+"""
+from __future__ import annotations
+from contextvars import ContextVar
+from typing import Dict, Iterable, Set
+
+from mrbToRb.literalTables import LITERAL_OPCODES
+from mrbToRb.opCodeFeed import OpCodeFeed
+from opcodes import JUMP_OPCODES, AllOpCodes
+
+# set to False to let OpCodeReader step through every instruction
+superinstructionsEnabled: ContextVar[bool] = ContextVar("superinstructionsEnabled", default=True)
+
+RECEIVER_OPCODES = frozenset({ AllOpCodes.OP_LOADSELF, AllOpCodes.OP_GETCONST, AllOpCodes.OP_MOVE })
+SYMBOL_LOAD_OPCODES = frozenset({ AllOpCodes.OP_GETGLOBAL, AllOpCodes.OP_GETIV, AllOpCodes.OP_GETCV, AllOpCodes.OP_GETCONST })
+# MOVEs only from local variables
+ARGUMENT_OPCODES = LITERAL_OPCODES | SYMBOL_LOAD_OPCODES | { AllOpCodes.OP_MOVE }
+# C of a SEND with a splat argument
+SEND_ARGS_ARRAY = 0x7f
+
+def findFusedCalls(opcodes: OpCodeFeed, localRegisters: Iterable[int]) -> Dict[int, int]:
+    """
+    Position of the SEND of every fusable call, by the position of its receiver load. The receiver and all arguments
+    have to be loaded into consecutive registers, none of them a local variable, and no jump may land inside the call.
+    """
+    codes = opcodes.opcodes
+    lvarRegisters: Set[int] = set(localRegisters)
+    jumpTargets = { i + code.sBx for i, code in enumerate(codes) if code.opcode in JUMP_OPCODES }
+    calls: Dict[int, int] = {}
+    for start in [i for i, code in enumerate(codes) if code.opcode in RECEIVER_OPCODES]:
+        receiver = codes[start].A
+        if receiver in lvarRegisters or codes[start].opcode == AllOpCodes.OP_MOVE and codes[start].B not in lvarRegisters:
+            continue
+        register = receiver + 1
+        pos = start + 1
+        while pos < len(codes) and pos not in jumpTargets:
+            code = codes[pos]
+            if code.opcode not in ARGUMENT_OPCODES or code.A != register or register in lvarRegisters:
+                break
+            if code.opcode == AllOpCodes.OP_MOVE and code.B not in lvarRegisters:
+                break
+            register += 1
+            pos += 1
+        else:
+            continue
+        send = codes[pos]
+        if send.opcode == AllOpCodes.OP_SEND and send.A == receiver and send.C == register - receiver - 1 and send.C != SEND_ARGS_ARRAY:
+            calls[start] = pos
+    return calls
@@ -0,0 +1,142 @@
+from __future__ import annotations
+import struct
+from typing import Dict, List
+
+from mrbParser import RiteFile, RiteIrepSection, RiteLvarRecord
+
+# mrbc counts the alignment padding before the iseq as 4 bytes in recordSize, whatever the actual padding is
+RECORD_SIZE_PADDING = 4
+# crc of the header covers everything after the crc field
+CRC_OFFSET = 10
+
+def _crcTable() -> List[int]:
+	# mruby's calc_crc_16_ccitt shifts every byte through a 24 bit register, one table entry per high byte
+	table = []
+	for high in range(0x100):
+		register = high << 16
+		for i in range(8):
+			register <<= 1
+			if register & 0x1000000:
+				register ^= 0x11021 << 8
+		table.append(register & 0xffffff)
+	return table
+
+CRC_TABLE = _crcTable()
+
+def calcCrc(data: bytes|bytearray|memoryview) -> int:
+	crc = 0
+	for byte in data:
+		crc = ((((crc & 0xff) << 16) | (byte << 8)) ^ CRC_TABLE[crc >> 8]) >> 8
+	return crc
+
+def _writeIrep(irep: RiteIrepSection, out: bytearray) -> None:
+	"""One irep record without its children. Updates all counts and the recordSize of `irep`."""
+	if any(child is None for child in irep.childIreps):
+		raise Exception("Can't serialize a partially read irep tree")
+	start = len(out)
+	irep.iLen = len(irep.mrbCodes)
+	irep.numChildIreps = len(irep.childIreps)
+	out += struct.pack(">IHHHI", 0, irep.numLocalVariables, irep.numRegisterVariables, irep.numChildIreps, irep.iLen)
+	# iseq is aligned to 4 bytes, relative to the start of the file
+	padding = (4 - (len(out) & 3)) & 3
+	out += bytes(padding)
+	out += struct.pack(f">{irep.iLen}I", *[code.fullOpcode for code in irep.mrbCodes])
+
+	irep.poolLen = len(irep.pools)
+	out += struct.pack(">I", irep.poolLen)
+	for pool, poolType in zip(irep.pools, irep.poolTypes):
+		out += struct.pack(">BH", poolType, len(pool))
+		out += pool
+
+	irep.symbolsLen = len(irep.symbols)
+	out += struct.pack(">I", irep.symbolsLen)
+	nullSymbols = set(irep.nullSymbols)
+	for i, symbol in enumerate(irep.symbols):
+		if i in nullSymbols:
+			out += struct.pack(">H", 0xffff)
+			continue
+		encoded = symbol.encode("utf-8")
+		out += struct.pack(">H", len(encoded))
+		out += encoded
+		out += b"\x00"
+
+	irep.recordSize = len(out) - start - padding + RECORD_SIZE_PADDING
+	struct.pack_into(">I", out, start, irep.recordSize)
+
+def _lvarSymbols(riteFile: RiteFile, lvarRoot: RiteLvarRecord) -> List[str]:
+	"""The original lvar symbol table, plus all names that aren't in it yet (in irep order)"""
+	symbols = list(riteFile.lvarBlock.symbols)
+	known = set(symbols)
+	stack = [lvarRoot]
+	while stack:
+		record = stack.pop()
+		for lvar in record.lvarRecords:
+			if lvar.symbol is not None and lvar.symbol not in known:
+				known.add(lvar.symbol)
+				symbols.append(lvar.symbol)
+		stack.extend(reversed(record.childLvars))
+	return symbols
+
+def _writeLvars(riteFile: RiteFile, out: bytearray) -> None:
+	start = len(out)
+	out += b"LVAR" + bytes(4)
+	lvarRoot = riteFile.lvarBlock.section
+	symbols = _lvarSymbols(riteFile, lvarRoot)
+	riteFile.lvarBlock.symbols = symbols
+	symbolIndexes: Dict[str, int] = {}
+	out += struct.pack(">I", len(symbols))
+	for i, symbol in enumerate(symbols):
+		symbolIndexes.setdefault(symbol, i)
+		encoded = symbol.encode("utf-8")
+		out += struct.pack(">H", len(encoded))
+		out += encoded
+	# the records are stored in the same order as the ireps
+	stack = [(riteFile.irepBlock.section, lvarRoot)]
+	while stack:
+		irep, record = stack.pop()
+		if len(record.lvarRecords) != irep.numLocalVariables - 1:
+			raise Exception(f"{len(record.lvarRecords)} local variables for numLocalVariables = {irep.numLocalVariables}")
+		for lvar in record.lvarRecords:
+			symbolIndex = symbolIndexes[lvar.symbol] if lvar.symbol is not None else 0xffff
+			out += struct.pack(">HH", symbolIndex, lvar.symbolRegister)
+		if len(record.childLvars) != len(irep.childIreps):
+			raise Exception("Local variables don't match the irep tree")
+		for i in reversed(range(len(irep.childIreps))):
+			stack.append((irep.childIreps[i], record.childLvars[i]))
+	riteFile.lvarBlock.header.sectionSize = len(out) - start
+	struct.pack_into(">I", out, start + 4, riteFile.lvarBlock.header.sectionSize)
+
+def serializeRiteFile(riteFile: RiteFile) -> bytes:
+	"""
+	Writes a (possibly modified) RiteFile back to a Rite 0003 binary. All lengths, recordSize, the section sizes,
+	binarySize and the crc are recalculated (and updated in riteFile).
+	"""
+	header = riteFile.header
+	out = bytearray()
+	out += (header.binaryIdentifier + header.binaryFormatMajorVersion + header.binaryFormatMinorVersion).encode("ascii")
+	out += bytes(6)		# crc, binarySize
+	out += (header.compilerName + header.compilerVersion).encode("ascii")
+
+	irepHeader = riteFile.irepBlock.header
+	irepStart = len(out)
+	out += irepHeader.sectionIdentifier.encode("ascii") + bytes(4) + irepHeader.version.encode("ascii")
+	stack = [riteFile.irepBlock.section]
+	while stack:
+		irep = stack.pop()
+		_writeIrep(irep, out)
+		stack.extend(reversed(irep.childIreps))
+	irepHeader.sectionSize = len(out) - irepStart
+	struct.pack_into(">I", out, irepStart + 4, irepHeader.sectionSize)
+
+	if riteFile.lvarBlock.header is not None:
+		_writeLvars(riteFile, out)
+
+	footer = riteFile.footer
+	out += footer.binaryEOFIdentifier.encode("ascii").ljust(4, b"\x00")
+	out += struct.pack(">I", footer.binaryEOFSize)
+
+	header.binarySize = len(out)
+	struct.pack_into(">I", out, CRC_OFFSET, header.binarySize)
+	header.crc = calcCrc(memoryview(out)[CRC_OFFSET:])
+	struct.pack_into(">H", out, 8, header.crc)
+	return bytes(out)
@@ -1,10 +1,8 @@
 from __future__ import annotations
-import ctypes
 from typing import List
 
 def getMrbCode(mrbCode) -> MrbCode:
-	opcode = mrbCode & 0x7f
-	return opcodes[opcode][1](mrbCode)
+	return OPCODE_CLASSES[mrbCode & 0x7f](mrbCode)
 
 class MrbCode:
 	opcode: int
@@ -63,7 +61,7 @@ class MrbCodeAsBx(MrbCode):
 	def __init__(self, mrbCode: int) -> None:
 		super().__init__(mrbCode)
 		self.A = (mrbCode >> 23) & 0x1ff
-		self.sBx = ctypes.c_int32(((mrbCode >> 7) & 0xffff) - (0xffff >> 1)).value
+		self.sBx = ((mrbCode >> 7) & 0xffff) - (0xffff >> 1)
 
 	def __str__(self) -> str:
 		return f"{opcodes[self.opcode][0]}:  A: 0x{self.A:x} sBx: 0x{self.sBx:x}"
@@ -143,120 +141,128 @@ class MrbCodeStats:
 		self.isReachable = False
 
 def markDeadCode(codes: List[MrbCode], start: int) -> None:
-	i = start
-	while i >= 0 and i < len(codes):
-		code = codes[i]
-		if code.stats.isReachable:
-			break
-		code.stats.isReachable = True
-		if code.opcode == AllOpCodes.OP_JMP:
-			i += code.sBx
-		elif code.opcode == AllOpCodes.OP_JMPIF or code.opcode == AllOpCodes.OP_JMPNOT:
-			markDeadCode(codes, i + 1)
-			i += code.sBx
-		elif code.opcode == AllOpCodes.OP_RETURN:
-			break
-		elif code.opcode == AllOpCodes.OP_STOP:
-			break
-		else:
-			i += 1
-
-
-opcodes = [
-	["OP_NOP", MrbCode],
-	["OP_MOVE", MrbCodeABC],
-	["OP_LOADL", MrbCodeABx],
-	["OP_LOADI", MrbCodeAsBx],
-	["OP_LOADSYM", MrbCodeABx],
-	["OP_LOADNIL", MrbCodeABC],
-	["OP_LOADSELF", MrbCodeABC],
-	["OP_LOADT", MrbCodeABC],
-	["OP_LOADF", MrbCodeABC],
-
-	["OP_GETGLOBAL", MrbCodeABx],
-	["OP_SETGLOBAL", MrbCodeABx],
-	["OP_GETSPECIAL", MrbCodeABx],
-	["OP_SETSPECIAL", MrbCodeABx],
-	["OP_GETIV", MrbCodeABx],
-	["OP_SETIV", MrbCodeABx],
-	["OP_GETCV", MrbCodeABx],
-	["OP_SETCV", MrbCodeABx],
-	["OP_GETCONST", MrbCodeABx],
-	["OP_SETCONST", MrbCodeABx],
-	["OP_GETMCNST", MrbCodeABx],
-	["OP_SETMCNST", MrbCodeABx],
-	["OP_GETUPVAR", MrbCodeABC],
-	["OP_SETUPVAR", MrbCodeABC],
-
-	["OP_JMP", MrbCodeAsBx],
-	["OP_JMPIF", MrbCodeAsBx],
-	["OP_JMPNOT", MrbCodeAsBx],
-	["OP_ONERR", MrbCodeAsBx],
-	["OP_RESCUE", MrbCodeABC],
-	["OP_POPERR", MrbCodeABC],
-	["OP_RAISE", MrbCodeABC],
-	["OP_EPUSH", MrbCodeABx],
-	["OP_EPOP", MrbCodeABC],
-
-	["OP_SEND", MrbCodeABC],
-	["OP_SENDB", MrbCodeABC],
-	["OP_FSEND", MrbCodeABC],
-	["OP_CALL", MrbCodeABC],
-	["OP_SUPER", MrbCodeABC],
-	["OP_ARGARY", MrbCodeABx],
-	["OP_ENTER", MrbCodeAspec],
-	["OP_KARG", MrbCodeABC],
-	["OP_KDICT", MrbCodeABC],
-
-	["OP_RETURN", MrbCodeABC],
-	["OP_TAILCALL", MrbCodeABC],
-	["OP_BLKPUSH", MrbCodeBlkPush],
-
-	["OP_ADD", MrbCodeABC],
-	["OP_ADDI", MrbCodeABC],
-	["OP_SUB", MrbCodeABC],
-	["OP_SUBI", MrbCodeABC],
-	["OP_MUL", MrbCodeABC],
-	["OP_DIV", MrbCodeABC],
-	["OP_EQ", MrbCodeABC],
-	["OP_LT", MrbCodeABC],
-	["OP_LE", MrbCodeABC],
-	["OP_GT", MrbCodeABC],
-	["OP_GE", MrbCodeABC],
-
-	["OP_ARRAY", MrbCodeABC],
-	["OP_ARYCAT", MrbCodeABC],
-	["OP_ARYPUSH", MrbCodeABC],
-	["OP_AREF", MrbCodeABC],
-	["OP_ASET", MrbCodeABC],
-	["OP_APOST", MrbCodeABC],
-
-	["OP_STRING", MrbCodeABx],
-	["OP_STRCAT", MrbCodeABC],
-
-	["OP_HASH", MrbCodeABC],
-	["OP_LAMBDA", MrbCodeABzCz],
-	["OP_RANGE", MrbCodeABC],
-
-	["OP_OCLASS", MrbCodeABC],
-	["OP_CLASS", MrbCodeABC],
-	["OP_MODULE", MrbCodeABC],
-	["OP_EXEC", MrbCodeABx],
-	["OP_METHOD", MrbCodeABC],
-	["OP_SCLASS", MrbCodeABC],
-	["OP_TCLASS", MrbCodeABC],
-
-	["OP_DEBUG", MrbCodeABC],
-	["OP_STOP", MrbCodeABC],
-	["OP_ERR", MrbCodeABx],
+	# the fall through paths of conditional jumps are followed later, instead of recursing into them. Every instruction
+	# is marked once and a path stops at the first marked one, so this is linear in len(codes) and needs no budget checks
+	starts = [start]
+	while starts:
+		i = starts.pop()
+		while i >= 0 and i < len(codes):
+			code = codes[i]
+			if code.stats.isReachable:
+				break
+			code.stats.isReachable = True
+			if code.opcode == AllOpCodes.OP_JMP:
+				i += code.sBx
+			elif code.opcode == AllOpCodes.OP_JMPIF or code.opcode == AllOpCodes.OP_JMPNOT:
+				starts.append(i + 1)
+				i += code.sBx
+			elif code.opcode == AllOpCodes.OP_RETURN:
+				break
+			elif code.opcode == AllOpCodes.OP_STOP:
+				break
+			else:
+				i += 1
+
+
+# name and MrbCode class of every opcode. Read only, it is shared by all threads that decompile
+opcodes = (
+	("OP_NOP", MrbCode),
+	("OP_MOVE", MrbCodeABC),
+	("OP_LOADL", MrbCodeABx),
+	("OP_LOADI", MrbCodeAsBx),
+	("OP_LOADSYM", MrbCodeABx),
+	("OP_LOADNIL", MrbCodeABC),
+	("OP_LOADSELF", MrbCodeABC),
+	("OP_LOADT", MrbCodeABC),
+	("OP_LOADF", MrbCodeABC),
+
+	("OP_GETGLOBAL", MrbCodeABx),
+	("OP_SETGLOBAL", MrbCodeABx),
+	("OP_GETSPECIAL", MrbCodeABx),
+	("OP_SETSPECIAL", MrbCodeABx),
+	("OP_GETIV", MrbCodeABx),
+	("OP_SETIV", MrbCodeABx),
+	("OP_GETCV", MrbCodeABx),
+	("OP_SETCV", MrbCodeABx),
+	("OP_GETCONST", MrbCodeABx),
+	("OP_SETCONST", MrbCodeABx),
+	("OP_GETMCNST", MrbCodeABx),
+	("OP_SETMCNST", MrbCodeABx),
+	("OP_GETUPVAR", MrbCodeABC),
+	("OP_SETUPVAR", MrbCodeABC),
+
+	("OP_JMP", MrbCodeAsBx),
+	("OP_JMPIF", MrbCodeAsBx),
+	("OP_JMPNOT", MrbCodeAsBx),
+	("OP_ONERR", MrbCodeAsBx),
+	("OP_RESCUE", MrbCodeABC),
+	("OP_POPERR", MrbCodeABC),
+	("OP_RAISE", MrbCodeABC),
+	("OP_EPUSH", MrbCodeABx),
+	("OP_EPOP", MrbCodeABC),
+
+	("OP_SEND", MrbCodeABC),
+	("OP_SENDB", MrbCodeABC),
+	("OP_FSEND", MrbCodeABC),
+	("OP_CALL", MrbCodeABC),
+	("OP_SUPER", MrbCodeABC),
+	("OP_ARGARY", MrbCodeABx),
+	("OP_ENTER", MrbCodeAspec),
+	("OP_KARG", MrbCodeABC),
+	("OP_KDICT", MrbCodeABC),
+
+	("OP_RETURN", MrbCodeABC),
+	("OP_TAILCALL", MrbCodeABC),
+	("OP_BLKPUSH", MrbCodeBlkPush),
+
+	("OP_ADD", MrbCodeABC),
+	("OP_ADDI", MrbCodeABC),
+	("OP_SUB", MrbCodeABC),
+	("OP_SUBI", MrbCodeABC),
+	("OP_MUL", MrbCodeABC),
+	("OP_DIV", MrbCodeABC),
+	("OP_EQ", MrbCodeABC),
+	("OP_LT", MrbCodeABC),
+	("OP_LE", MrbCodeABC),
+	("OP_GT", MrbCodeABC),
+	("OP_GE", MrbCodeABC),
+
+	("OP_ARRAY", MrbCodeABC),
+	("OP_ARYCAT", MrbCodeABC),
+	("OP_ARYPUSH", MrbCodeABC),
+	("OP_AREF", MrbCodeABC),
+	("OP_ASET", MrbCodeABC),
+	("OP_APOST", MrbCodeABC),
+
+	("OP_STRING", MrbCodeABx),
+	("OP_STRCAT", MrbCodeABC),
+
+	("OP_HASH", MrbCodeABC),
+	("OP_LAMBDA", MrbCodeABzCz),
+	("OP_RANGE", MrbCodeABC),
+
+	("OP_OCLASS", MrbCodeABC),
+	("OP_CLASS", MrbCodeABC),
+	("OP_MODULE", MrbCodeABC),
+	("OP_EXEC", MrbCodeABx),
+	("OP_METHOD", MrbCodeABC),
+	("OP_SCLASS", MrbCodeABC),
+	("OP_TCLASS", MrbCodeABC),
+
+	("OP_DEBUG", MrbCodeABC),
+	("OP_STOP", MrbCodeABC),
+	("OP_ERR", MrbCodeABx),
 	
-	["OP_RSVD1", MrbCode],
-	["OP_RSVD2", MrbCode],
-	["OP_RSVD3", MrbCode],
-	["OP_RSVD4", MrbCode],
-	["OP_RSVD5", MrbCode],
-	["OP_UNKNOWN", MrbCode],
-]
+	("OP_RSVD1", MrbCode),
+	("OP_RSVD2", MrbCode),
+	("OP_RSVD3", MrbCode),
+	("OP_RSVD4", MrbCode),
+	("OP_RSVD5", MrbCode),
+	("OP_UNKNOWN", MrbCode),
+)
+# the columns of the table above, getMrbCode() runs for every instruction
+OPCODE_NAMES = tuple(name for name, _ in opcodes)
+OPCODE_CLASSES = tuple(cls for _, cls in opcodes)
 
 class AllOpCodes:
 	OP_NOP = 0
@@ -341,3 +347,82 @@ class AllOpCodes:
 	OP_RSVD4 = 79
 	OP_RSVD5 = 80
 	OP_UNKNOWN = 81
+
+# operand that holds a symbol table index, for every opcode that references a symbol
+SYMBOL_OPERANDS = {
+	AllOpCodes.OP_LOADSYM: "Bx",
+	AllOpCodes.OP_GETGLOBAL: "Bx",
+	AllOpCodes.OP_SETGLOBAL: "Bx",
+	AllOpCodes.OP_GETIV: "Bx",
+	AllOpCodes.OP_SETIV: "Bx",
+	AllOpCodes.OP_GETCV: "Bx",
+	AllOpCodes.OP_SETCV: "Bx",
+	AllOpCodes.OP_GETCONST: "Bx",
+	AllOpCodes.OP_SETCONST: "Bx",
+	AllOpCodes.OP_GETMCNST: "Bx",
+	AllOpCodes.OP_SETMCNST: "Bx",
+	AllOpCodes.OP_SEND: "B",
+	AllOpCodes.OP_SENDB: "B",
+	AllOpCodes.OP_TAILCALL: "B",
+	AllOpCodes.OP_ADD: "B",
+	AllOpCodes.OP_ADDI: "B",
+	AllOpCodes.OP_SUB: "B",
+	AllOpCodes.OP_SUBI: "B",
+	AllOpCodes.OP_MUL: "B",
+	AllOpCodes.OP_DIV: "B",
+	AllOpCodes.OP_EQ: "B",
+	AllOpCodes.OP_LT: "B",
+	AllOpCodes.OP_LE: "B",
+	AllOpCodes.OP_GT: "B",
+	AllOpCodes.OP_GE: "B",
+	AllOpCodes.OP_CLASS: "B",
+	AllOpCodes.OP_MODULE: "B",
+	AllOpCodes.OP_METHOD: "B",
+}
+# operand that holds a pool index
+POOL_OPERANDS = {
+	AllOpCodes.OP_LOADL: "Bx",
+	AllOpCodes.OP_STRING: "Bx",
+	AllOpCodes.OP_ERR: "Bx",
+}
+
+# operand that holds a child irep index
+CHILD_IREP_OPERANDS = {
+	AllOpCodes.OP_EPUSH: "Bx",
+	AllOpCodes.OP_LAMBDA: "Bz",
+	AllOpCodes.OP_EXEC: "Bx",
+}
+JUMP_OPCODES = frozenset({ AllOpCodes.OP_JMP, AllOpCodes.OP_JMPIF, AllOpCodes.OP_JMPNOT, AllOpCodes.OP_ONERR })
+
+def rawOperand(mrbCode: int, operand: str) -> int:
+	"""B, Bx or Bz field of a raw 32 bit instruction, without creating a MrbCode"""
+	if operand == "B":
+		return (mrbCode >> 14) & 0x1ff
+	if operand == "Bz":
+		return (mrbCode >> 9) & 0x3fff
+	return (mrbCode >> 7) & 0xffff
+
+def rawJumpTarget(mrbCode: int, pc: int) -> int:
+	"""pc + sBx of a raw jump instruction"""
+	return pc + ((mrbCode >> 7) & 0xffff) - (0xffff >> 1)
+
+def rawReachable(iseq) -> bytearray:
+	"""Same as markDeadCode(codes, 0), but on raw instructions. Returns 1 for every reachable pc."""
+	reachable = bytearray(len(iseq))
+	pending = [0]
+	while pending:
+		i = pending.pop()
+		while 0 <= i < len(iseq) and not reachable[i]:
+			reachable[i] = 1
+			code = iseq[i]
+			opcode = code & 0x7f
+			if opcode == AllOpCodes.OP_JMP:
+				i = rawJumpTarget(code, i)
+			elif opcode == AllOpCodes.OP_JMPIF or opcode == AllOpCodes.OP_JMPNOT:
+				pending.append(i + 1)
+				i = rawJumpTarget(code, i)
+			elif opcode == AllOpCodes.OP_RETURN or opcode == AllOpCodes.OP_STOP:
+				break
+			else:
+				i += 1
+	return reachable
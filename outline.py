@@ -0,0 +1,107 @@
+"""
+Outline of mrb files: classes, modules, singleton classes and methods with their parameters.
+
+Only the raw irep tree and the local variable names are read (see structureScanner.py), no expressions are built
+and nothing is rendered. Whole folders are processed in a process pool.
+
+python outline.py <file or folder> ... [--json outline.json] [--blocks] [--workers 8]
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+from corpusAnalyzer import CHUNK_SIZE, chunks, findFiles
+from mrbParser import readRawIreps
+from structureScanner import FileStructure
+
+def outlineBytes(data: bytes, includeBlocks: bool = False) -> List[Dict]:
+    """Nested definitions of a mrb binary, every entry is a Definition.toJson() with its nested definitions in "children\""""
+    structure = FileStructure(readRawIreps(data, readLvars=True), False)
+    entries: List[Dict|None] = []
+    outline = []
+    for definition in structure.definitions:
+        if definition.kind == "block" and not includeBlocks:
+            entries.append(None)
+            continue
+        entry = definition.toJson()
+        entry["children"] = []
+        entries.append(entry)
+        # definitions only ever come after their parent
+        parent = entries[definition.parent] if definition.parent != -1 else None
+        (parent["children"] if parent is not None else outline).append(entry)
+    return outline
+
+ARG_PREFIXES = { "rest": "*", "block": "&" }
+
+def outlineToText(outline: List[Dict], indent: int = 0) -> List[str]:
+    lines = []
+    for entry in outline:
+        kind = entry["kind"]
+        if kind == "method" or kind == "block":
+            args = ", ".join(f"{ARG_PREFIXES.get(arg['kind'], '')}{arg['name'] or '_'}{' = ?' if arg['kind'] == 'opt' else ''}" for arg in entry.get("args", []))
+            name = entry["name"] if entry["qualifiedName"].endswith(f"#{entry['name']}") or kind == "block" else entry["qualifiedName"]
+            line = f"{'def' if kind == 'method' else 'block'} {name}({args})"
+        elif kind == "sclass":
+            line = f"class << {entry['name']}"
+        else:
+            line = f"{kind} {entry['name'] if indent > 0 else entry['qualifiedName']}"
+            if "superclass" in entry:
+                line += f" < {entry['superclass']}"
+        lines.append("  " * indent + line)
+        lines.extend(outlineToText(entry["children"], indent + 1))
+    return lines
+
+# (file, outline, error)
+FileOutline = Tuple[str, List[Dict]|None, str|None]
+
+def outlineChunk(files: List[str], includeBlocks: bool) -> List[FileOutline]:
+    results = []
+    for file in files:
+        try:
+            with open(file, "rb") as f:
+                results.append((file, outlineBytes(f.read(), includeBlocks), None))
+        except Exception as e:
+            results.append((file, None, f"{type(e).__name__}: {e}"))
+    return results
+
+def outlineFiles(files: List[str], workers: int = 0, includeBlocks: bool = False) -> List[FileOutline]:
+    if workers > 0 and len(files) > CHUNK_SIZE:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return [result for results in executor.map(outlineChunk, chunks(files, CHUNK_SIZE), [includeBlocks] * len(files)) for result in results]
+    return outlineChunk(files, includeBlocks)
+
+def main():
+    parser = argparse.ArgumentParser(description="List classes, modules and methods of mrb files")
+    parser.add_argument("paths", nargs="+", help="mrb files or folders")
+    parser.add_argument("--ext", default="_scp.bin,.mrb", help="comma separated file endings, for folders")
+    parser.add_argument("--json", help="write the outlines to this file instead of printing them")
+    parser.add_argument("--blocks", action="store_true", help="also list blocks and lambdas")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    t1 = time.time()
+    files = []
+    for path in args.paths:
+        files.extend(findFiles(path, args.ext.split(",")) if os.path.isdir(path) else [path])
+    results = outlineFiles(files, args.workers if args.workers > 1 else 0, args.blocks)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({ file: outline if error is None else { "error": error } for file, outline, error in results }, f, indent=2)
+    for file, outline, error in results:
+        if error is not None:
+            print(f"Error in {file}: {error}")
+        elif not args.json:
+            print(file)
+            print("\n".join("  " + line for line in outlineToText(outline)))
+    print(f"Outlined {len(files)} files in {time.time() - t1:.2f}s")
+
+if __name__ == "__main__":
+    main()
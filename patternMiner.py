@@ -0,0 +1,259 @@
+"""
+Opcode n-gram and jump shape mining, to find out which bytecode patterns the control flow heuristics should handle next.
+
+N-grams are found with a rolling hash over the opcode column of an instruction dump (see iseqExport.py). Since opcodes
+are 7 bit and the hash base is 0x80, hashes are collision free for up to 9 opcodes. Windows that cross irep boundaries
+are dropped.
+A jump shape is (jump opcode, direction, opcode before the target, its direction if it's a jump, opcode at the target).
+
+With --fallbacks every file is also decompiled and all JMPs that end up in "Unexpected JMP" or JMPFallback are recorded.
+N-grams and shapes are then also ranked by how many of them end in such a JMP.
+
+python patternMiner.py (<searchDir> | --dump <dumpDir>) [--fallbacks] [--minN 2] [--maxN 6] [--top 20] [--json patterns.json]
+"""
+from __future__ import annotations
+import argparse
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+from corpusAnalyzer import chunks, findFiles, opcodeName, HISTOGRAM_SIZE
+from iseqExport import InstructionDump, requireNumpy
+from mrbParser import RiteFile, RiteIrepSection
+from mrbToRb.mrbToRb import mrbToRb
+from mrbToRb.opcodeReader import unhandledJmpListener
+from opcodes import AllOpCodes
+
+HASH_BASE = HISTOGRAM_SIZE
+JUMP_OPCODES = [AllOpCodes.OP_JMP, AllOpCodes.OP_JMPIF, AllOpCodes.OP_JMPNOT, AllOpCodes.OP_ONERR]
+# opcode slot of a jump shape, for targets outside of the irep
+NO_OPCODE = HISTOGRAM_SIZE
+
+# (irep path, pc, message)
+Fallback = Tuple[str, int, str]
+
+def irepPcs(root: RiteIrepSection) -> Dict[int, Tuple[str, int]]:
+    """id(MrbCode) -> (irep path, pc). Has to be built before decompiling, since the decompiler slices some iseqs."""
+    pcs = {}
+    stack = [("/", root)]
+    while stack:
+        path, irep = stack.pop()
+        for pc, code in enumerate(irep.mrbCodes):
+            pcs[id(code)] = (path, pc)
+        for i, child in enumerate(irep.childIreps):
+            stack.append((f"{path}{i}" if path == "/" else f"{path}/{i}", child))
+    return pcs
+
+def findFallbacks(file: str) -> Tuple[List[Fallback], str|None]:
+    """Decompiles a file and returns all JMPs that couldn't be mapped to ruby code"""
+    fallbacks: List[Fallback] = []
+    try:
+        with open(file, "rb") as f:
+            riteFile = RiteFile(io.BytesIO(f.read()))
+        pcs = irepPcs(riteFile.irepBlock.section)
+        def onUnhandledJmp(jmpCode, message: str):
+            if id(jmpCode) in pcs:
+                path, pc = pcs[id(jmpCode)]
+                fallbacks.append((path, pc, message))
+        token = unhandledJmpListener.set(onUnhandledJmp)
+        try:
+            mrbToRb(riteFile).toStr()
+        finally:
+            unhandledJmpListener.reset(token)
+    except Exception as e:
+        return fallbacks, f"{type(e).__name__}: {e}"
+    return fallbacks, None
+
+def findFallbacksChunk(files: List[str]) -> List[Tuple[List[Fallback], str|None]]:
+    return [findFallbacks(file) for file in files]
+
+def fallbackMask(dump: InstructionDump, workers: int = 0) -> Tuple:
+    """Boolean mask over all instructions of the dump, True for every unhandled JMP. Also returns the decompile errors."""
+    files = [dump.filePath(i) for i in range(len(dump.files))]
+    if workers > 0:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = [result for chunk in executor.map(findFallbacksChunk, chunks(files, 16)) for result in chunk]
+    else:
+        results = findFallbacksChunk(files)
+    irepIds = { (int(fileId), dump.irepPaths[irepId]): irepId for irepId, fileId in enumerate(dump.irepFile) }
+    np = requireNumpy()
+    mask = np.zeros(len(dump), dtype=bool)
+    errors = []
+    for fileId, (fallbacks, error) in enumerate(results):
+        if error is not None:
+            errors.append({ "file": dump.files[fileId], "error": error })
+        for path, pc, _ in fallbacks:
+            mask[int(dump.irepStart[irepIds[(fileId, path)]]) + pc] = True
+    return mask, errors
+
+def ngramName(ngramHash: int, n: int) -> str:
+    names = []
+    for _ in range(n):
+        names.append(opcodeName(ngramHash % HASH_BASE))
+        ngramHash //= HASH_BASE
+    return " ".join(reversed(names))
+
+def countUnique(keys, positions, fileIds, fileCount: int, weights=None) -> Dict:
+    """Counts, file coverage, first instruction and weight sums (optional) of every distinct key"""
+    np = requireNumpy()
+    unique, first, inverse, counts = np.unique(keys, return_index=True, return_inverse=True, return_counts=True)
+    perFile = np.unique(inverse.astype(np.int64) * fileCount + fileIds)
+    result = {
+        "keys": unique,
+        "first": positions[first],
+        "counts": counts,
+        "files": np.bincount(perFile // fileCount, minlength=len(unique)),
+    }
+    if weights is not None:
+        result["fallbacks"] = np.bincount(inverse, weights=weights, minlength=len(unique)).astype(np.int64)
+        # first instruction of every key that actually ends in a fallback
+        weighted = np.flatnonzero(weights)
+        weightedKeys, weightedFirst = np.unique(inverse[weighted], return_index=True)
+        result["firstFallback"] = np.full(len(unique), -1, dtype=np.int64)
+        result["firstFallback"][weightedKeys] = positions[weighted[weightedFirst]]
+    return result
+
+def mineNgrams(dump: InstructionDump, minN: int, maxN: int, fallbacks=None) -> Dict[int, Dict]:
+    """n -> countUnique() result of all n-grams. Windows ending in a fallback are weighted with 1."""
+    np = requireNumpy()
+    opcodes = np.asarray(dump.opcode).astype(np.uint64)
+    irepId = np.asarray(dump.irepId)
+    fileId = np.asarray(dump.fileId).astype(np.int64)
+    results = {}
+    hashes = opcodes.copy()
+    for n in range(1, maxN + 1):
+        if n > 1:
+            # extend every window by the next opcode
+            hashes = hashes[:-1] * np.uint64(HASH_BASE) + opcodes[n - 1:]
+        if n < minN:
+            continue
+        valid = np.flatnonzero(irepId[:len(hashes)] == irepId[n - 1:])
+        if len(valid) == 0:
+            break
+        weights = fallbacks[valid + n - 1] if fallbacks is not None else None
+        results[n] = countUnique(hashes[valid], valid, fileId[valid], len(dump.files), weights)
+    return results
+
+def jumpShapes(dump: InstructionDump, fallbacks=None) -> Dict:
+    """countUnique() result of all jump shapes, the keys are (jumpOp, forward, targetPrevOp, targetPrevForward, targetOp) packed into an int"""
+    np = requireNumpy()
+    opcode = np.asarray(dump.opcode).astype(np.int64)
+    sBx = np.asarray(dump.sBx).astype(np.int64)
+    irepId = np.asarray(dump.irepId)
+    jumps = np.flatnonzero(np.isin(opcode, JUMP_OPCODES))
+    targets = jumps + sBx[jumps]
+    irepStart = np.asarray(dump.irepStart)[irepId[jumps]]
+    irepEnd = irepStart + np.asarray(dump.irepLen)[irepId[jumps]]
+    inIrep = (targets >= irepStart) & (targets < irepEnd)
+    prevInIrep = (targets - 1 >= irepStart) & (targets - 1 < irepEnd)
+    safeTargets = np.clip(targets, 0, len(opcode) - 1)
+    safePrev = np.clip(targets - 1, 0, len(opcode) - 1)
+    targetOp = np.where(inIrep, opcode[safeTargets], NO_OPCODE)
+    prevOp = np.where(prevInIrep, opcode[safePrev], NO_OPCODE)
+    prevIsJump = prevInIrep & np.isin(prevOp, JUMP_OPCODES)
+    prevForward = np.where(prevIsJump, (sBx[safePrev] > 0).astype(np.int64), 2)
+    forward = (sBx[jumps] > 0).astype(np.int64)
+    keys = (((opcode[jumps] * 2 + forward) * (NO_OPCODE + 1) + prevOp) * 3 + prevForward) * (NO_OPCODE + 1) + targetOp
+    weights = fallbacks[jumps] if fallbacks is not None else None
+    return countUnique(keys, jumps, np.asarray(dump.fileId)[jumps].astype(np.int64), len(dump.files), weights)
+
+def shapeName(key: int) -> str:
+    key, targetOp = divmod(key, NO_OPCODE + 1)
+    key, prevForward = divmod(key, 3)
+    key, prevOp = divmod(key, NO_OPCODE + 1)
+    jumpOp, forward = divmod(key, 2)
+    def opName(op: int) -> str:
+        return opcodeName(op) if op != NO_OPCODE else "<outside>"
+    prevDirection = ["-", "+", ""][prevForward]
+    return f"{opcodeName(jumpOp)} {'+' if forward else '-'} -> [{opName(prevOp)}{prevDirection}] {opName(targetOp)}"
+
+def topRows(result: Dict, nameOf, dump: InstructionDump, top: int, byFallbacks: bool = False) -> List[Dict]:
+    np = requireNumpy()
+    ranking = result["fallbacks"] if byFallbacks else result["counts"]
+    order = np.argsort(-ranking, kind="stable")[:top]
+    rows = []
+    for i in order:
+        if ranking[i] == 0:
+            break
+        row = {
+            "pattern": nameOf(int(result["keys"][i])),
+            "count": int(result["counts"][i]),
+            "files": int(result["files"][i]),
+            "example": dump.location(int(result["firstFallback" if byFallbacks else "first"][i])),
+        }
+        if "fallbacks" in result:
+            row["fallbacks"] = int(result["fallbacks"][i])
+        rows.append(row)
+    return rows
+
+def printTable(title: str, rows: List[Dict]):
+    print(f"\n{title}")
+    hasFallbacks = any("fallbacks" in row for row in rows)
+    print(f"{'count':>9}{'files':>7}{'fallb.' if hasFallbacks else '':>8}  pattern")
+    for row in rows:
+        fallbacks = row["fallbacks"] if hasFallbacks else ""
+        print(f"{row['count']:>9}{row['files']:>7}{fallbacks:>8}  {row['pattern']}    ({row['example']})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Find frequent opcode n-grams and jump shapes in a corpus")
+    parser.add_argument("searchDir", nargs="?")
+    parser.add_argument("--dump", help="use an instruction dump of iseqExport.py instead of reading searchDir")
+    parser.add_argument("--ext", default="_scp.bin,.mrb", help="comma separated file endings")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--minN", type=int, default=2)
+    parser.add_argument("--maxN", type=int, default=6)
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--fallbacks", action="store_true", help="decompile all files and rank patterns by unhandled JMPs")
+    parser.add_argument("--json", help="also write all tables as JSON")
+    args = parser.parse_args()
+    if (args.searchDir is None) == (args.dump is None):
+        parser.error("either searchDir or --dump is required")
+    if not 1 <= args.minN <= args.maxN <= 9:
+        parser.error("n has to be between 1 and 9")
+    requireNumpy()
+    workers = args.workers if args.workers > 1 else 0
+
+    t1 = time.time()
+    if args.dump:
+        dump = InstructionDump.load(args.dump)
+    else:
+        dump = InstructionDump.build(findFiles(args.searchDir, args.ext.split(",")), workers, args.searchDir)
+    print(f"{len(dump)} instructions in {len(dump.files)} files ({time.time() - t1:.2f}s)")
+
+    fallbacks = None
+    errors = []
+    if args.fallbacks:
+        t1 = time.time()
+        fallbacks, errors = fallbackMask(dump, workers)
+        print(f"{int(fallbacks.sum())} unhandled JMPs ({time.time() - t1:.2f}s)")
+        for error in errors:
+            print(f"Error in {error['file']}: {error['error']}")
+
+    t1 = time.time()
+    ngrams = mineNgrams(dump, args.minN, args.maxN, fallbacks)
+    shapes = jumpShapes(dump, fallbacks)
+    print(f"Mined patterns in {time.time() - t1:.2f}s")
+
+    tables = {}
+    for n, result in ngrams.items():
+        tables[f"{n}-grams"] = topRows(result, lambda key: ngramName(key, n), dump, args.top)
+        if fallbacks is not None:
+            tables[f"{n}-grams ending in unhandled JMPs"] = topRows(result, lambda key: ngramName(key, n), dump, args.top, True)
+    tables["jump shapes"] = topRows(shapes, shapeName, dump, args.top)
+    if fallbacks is not None:
+        tables["unhandled jump shapes"] = topRows(shapes, shapeName, dump, args.top, True)
+    for title, rows in tables.items():
+        printTable(title, rows)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({ "files": len(dump.files), "instructions": len(dump), "errors": errors, "tables": tables }, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Stages of a pipelined batch run (see decompileAll(pipelined=True)): a reader stage that prefetches file bytes on a thread
+pool, the decompile stage (decompileMany(), in-process or in a pool) and a writer thread. The stages are connected by
+bounded queues, a stage that runs ahead blocks until the next one catches up. PipelineStats shows which stage is the
+bottleneck.
+"""
+from __future__ import annotations
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Tuple
+
+from utils import ENCODING
+
+class StageStats:
+    """Busy time (in seconds, summed over all workers of the stage) and number of items of one stage"""
+    name: str
+    workers: int
+    busy: float
+    items: int
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.busy = 0.0
+        self.items = 0
+
+    def utilization(self, wallTime: float) -> float:
+        return self.busy / (wallTime * self.workers) if wallTime > 0 else 0.0
+
+class PipelineStats:
+    stages: Dict[str, StageStats]
+    wallTime: float
+    readWait: float  # the decompile stage waited this long for file bytes
+    writeWait: float  # results waited this long for space in the write queue
+    _lock: threading.Lock
+    _start: float
+
+    def __init__(self, readers: int, workers: int):
+        self.stages = {
+            "read": StageStats("read", readers),
+            "decompile": StageStats("decompile", max(workers, 1)),
+            "write": StageStats("write", 1),
+        }
+        self.wallTime = 0.0
+        self.readWait = 0.0
+        self.writeWait = 0.0
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    def addBusy(self, stage: str, seconds: float) -> None:
+        """Thread safe, the reader threads report here"""
+        with self._lock:
+            stats = self.stages[stage]
+            stats.busy += seconds
+            stats.items += 1
+
+    def finish(self) -> None:
+        self.wallTime = time.perf_counter() - self._start
+
+    def bottleneck(self) -> str:
+        return max(self.stages.values(), key=lambda stage: stage.utilization(self.wallTime)).name
+
+    def toJson(self) -> Dict[str, Any]:
+        return {
+            "wallTime": self.wallTime,
+            "readWait": self.readWait,
+            "writeWait": self.writeWait,
+            "bottleneck": self.bottleneck(),
+            "stages": {
+                name: { "workers": stage.workers, "items": stage.items, "busy": stage.busy, "utilization": stage.utilization(self.wallTime) }
+                for name, stage in self.stages.items()
+            },
+        }
+
+    def toText(self) -> str:
+        lines = [f"{'stage':<12}{'workers':>8}{'items':>8}{'busy s':>10}{'utilization':>13}"]
+        for name, stage in self.stages.items():
+            lines.append(f"{name:<12}{stage.workers:>8}{stage.items:>8}{stage.busy:>10.2f}{stage.utilization(self.wallTime)*100:>12.1f}%")
+        lines.append(f"waited {self.readWait:.2f}s for reads, {self.writeWait:.2f}s for the write queue, "
+                     f"{self.wallTime:.2f}s total, bottleneck: {self.bottleneck()}")
+        return "\n".join(lines)
+
+def _waitForRead(future, stats: PipelineStats) -> Tuple[str, bytes|OSError]:
+    t1 = time.perf_counter()
+    result = future.result()
+    stats.readWait += time.perf_counter() - t1
+    return result
+
+def prefetchFiles(paths: Iterable[str], readers: int, prefetch: int, stats: PipelineStats,
+                  onError: Callable[[str, OSError], None], readTimes: List[Tuple[str, float]]) -> Iterator[Tuple[str, bytes]]:
+    """
+    Yields (path, bytes) in input order, read on `readers` threads at most `prefetch` files ahead of the consumer.
+    Files that can't be read are passed to onError (on the consuming thread) and skipped. The time of every read is
+    added to readTimes.
+    """
+    from concurrent.futures import Future, ThreadPoolExecutor
+
+    def read(path: str) -> Tuple[str, bytes|OSError]:
+        t1 = time.perf_counter()
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError as e:
+            return path, e
+        seconds = time.perf_counter() - t1
+        stats.addBusy("read", seconds)
+        readTimes.append((path, seconds))
+        return path, data
+
+    def readResults() -> Iterator[Tuple[str, bytes|OSError]]:
+        pending: Deque[Future] = deque()
+        executor = ThreadPoolExecutor(max_workers=readers)
+        try:
+            for path in paths:
+                pending.append(executor.submit(read, path))
+                if len(pending) >= prefetch:
+                    yield _waitForRead(pending.popleft(), stats)
+            while pending:
+                yield _waitForRead(pending.popleft(), stats)
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    for path, data in readResults():
+        if isinstance(data, OSError):
+            onError(path, data)
+            continue
+        yield path, data
+
+class AsyncWriter:
+    """
+    Encodes and writes results on a background thread. put() blocks while `maxQueued` results are waiting.
+    Results that can't be written are listed in `errors`, the others are still written.
+    """
+    stats: PipelineStats
+    writeTimes: List[Tuple[str, float]]  # (name, seconds), for Profiler.addStage() once the writer is closed
+    errors: List[Tuple[str, Exception]]  # (name, error), complete once the writer is closed
+    _queue: queue.Queue
+    _thread: threading.Thread
+
+    def __init__(self, stats: PipelineStats, maxQueued: int):
+        self.stats = stats
+        self.writeTimes = []
+        self.errors = []
+        self._queue = queue.Queue(maxsize=maxQueued)
+        self._thread = threading.Thread(target=self._run, name="AsyncWriter", daemon=True)
+        self._thread.start()
+
+    def put(self, name: str, outPath: str, text: str) -> None:
+        t1 = time.perf_counter()
+        self._queue.put((name, outPath, text))
+        self.stats.writeWait += time.perf_counter() - t1
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            name, outPath, text = item
+            t1 = time.perf_counter()
+            try:
+                with open(outPath, "wb") as f:
+                    f.write(text.encode(ENCODING, "ignore"))
+            except Exception as e:
+                self.errors.append((name, e))
+                continue
+            seconds = time.perf_counter() - t1
+            self.stats.addBusy("write", seconds)
+            self.writeTimes.append((name, seconds))
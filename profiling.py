@@ -0,0 +1,388 @@
+from __future__ import annotations
+import functools
+import heapq
+import marshal
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Tuple
+
+from opcodes import opcodes
+
+# cProfile, tracemalloc and json are only imported when they are needed, most runs don't profile at all
+
+# inspect.CO_GENERATOR, without importing inspect
+CO_GENERATOR = 0x20
+
+# Stages in the order they happen for a single file
+STAGES = ["read", "header", "iseqDecode", "markDeadCode", "irepTables", "lvars", "parseOps", "render", "write"]
+
+class OpStats:
+	"""
+	Counts and times of each opcode handler in OpCodeReader.step() and of the structural parsers (parseCase, parseIfElse, ...).
+	Inclusive times contain nested sections, self times don't.
+	"""
+	opCounts: List[int]
+	opTimes: List[float]
+	opSelfTimes: List[float]
+	structureCounts: Dict[str, int]
+	structureTimes: Dict[str, float]
+	sectionParses: Dict[str, int]
+	sectionOpcodes: Dict[str, int]
+	_childTimes: List[float]
+	_structureStack: List[str]
+
+	def __init__(self) -> None:
+		self.opCounts = [0] * len(opcodes)
+		self.opTimes = [0.0] * len(opcodes)
+		self.opSelfTimes = [0.0] * len(opcodes)
+		self.structureCounts = {}
+		self.structureTimes = {}
+		self.sectionParses = {}
+		self.sectionOpcodes = {}
+		self._childTimes = []
+		self._structureStack = []
+
+	def enterOp(self) -> None:
+		self._childTimes.append(0.0)
+
+	def exitOp(self, opcode: int, seconds: float) -> None:
+		childTime = self._childTimes.pop()
+		self.opCounts[opcode] += 1
+		self.opTimes[opcode] += seconds
+		self.opSelfTimes[opcode] += seconds - childTime
+		if self._childTimes:
+			self._childTimes[-1] += seconds
+
+	def enterStructure(self, name: str) -> None:
+		self._structureStack.append(name)
+
+	def exitStructure(self, name: str, seconds: float) -> None:
+		self._structureStack.pop()
+		self.structureCounts[name] = self.structureCounts.get(name, 0) + 1
+		self.structureTimes[name] = self.structureTimes.get(name, 0) + seconds
+
+	def sectionParsed(self, opcodeCount: int) -> None:
+		"""A nested section with `opcodeCount` opcodes is parsed by a new OpCodeReader"""
+		owner = self._structureStack[-1] if self._structureStack else "other"
+		self.sectionParses[owner] = self.sectionParses.get(owner, 0) + 1
+		self.sectionOpcodes[owner] = self.sectionOpcodes.get(owner, 0) + opcodeCount
+
+	def merge(self, other: OpStats) -> None:
+		for i in range(len(self.opCounts)):
+			self.opCounts[i] += other.opCounts[i]
+			self.opTimes[i] += other.opTimes[i]
+			self.opSelfTimes[i] += other.opSelfTimes[i]
+		for src, dst in [
+			(other.structureCounts, self.structureCounts),
+			(other.structureTimes, self.structureTimes),
+			(other.sectionParses, self.sectionParses),
+			(other.sectionOpcodes, self.sectionOpcodes),
+		]:
+			for key, value in src.items():
+				dst[key] = dst.get(key, 0) + value
+
+	def toJson(self) -> Dict[str, Any]:
+		ops = {}
+		for i, count in enumerate(self.opCounts):
+			if count == 0:
+				continue
+			ops[opcodes[i][0]] = {
+				"count": count,
+				"time": self.opTimes[i],
+				"selfTime": self.opSelfTimes[i],
+			}
+		structures = {}
+		for name in sorted(self.structureCounts.keys() | self.sectionParses.keys()):
+			structures[name] = {
+				"count": self.structureCounts.get(name, 0),
+				"time": self.structureTimes.get(name, 0),
+				"sectionParses": self.sectionParses.get(name, 0),
+				"sectionOpcodes": self.sectionOpcodes.get(name, 0),
+			}
+		return { "opcodes": ops, "structures": structures }
+
+	def toTable(self) -> str:
+		lines = [f"{'opcode':<14}{'count':>10}{'time (ms)':>12}{'self (ms)':>12}"]
+		order = sorted(range(len(self.opCounts)), key=lambda i: self.opSelfTimes[i], reverse=True)
+		for i in order:
+			if self.opCounts[i] == 0:
+				continue
+			lines.append(f"{opcodes[i][0]:<14}{self.opCounts[i]:>10}{self.opTimes[i]*1000:>12.2f}{self.opSelfTimes[i]*1000:>12.2f}")
+		lines.append("")
+		lines.append(f"{'parser':<20}{'count':>8}{'time (ms)':>12}{'sections':>10}{'section ops':>13}")
+		structures = self.toJson()["structures"]
+		for name, stats in sorted(structures.items(), key=lambda item: item[1]["time"], reverse=True):
+			lines.append(f"{name:<20}{stats['count']:>8}{stats['time']*1000:>12.2f}{stats['sectionParses']:>10}{stats['sectionOpcodes']:>13}")
+		return "\n".join(lines)
+
+class FileProfile:
+	"""Timings (in seconds) and allocations (in bytes) of all stages of a single file"""
+	name: str
+	totalTime: float
+	stageTimes: Dict[str, float]
+	stageAllocations: Dict[str, int]
+	cProfileStats: Dict|None
+	opStats: OpStats|None
+
+	def __init__(self, name: str) -> None:
+		self.name = name
+		self.totalTime = 0
+		self.stageTimes = {}
+		self.stageAllocations = {}
+		self.cProfileStats = None
+		self.opStats = None
+
+	def toJson(self) -> Dict[str, Any]:
+		result: Dict[str, Any] = {
+			"name": self.name,
+			"totalTime": self.totalTime,
+			"stages": self.stageTimes,
+		}
+		if self.stageAllocations:
+			result["allocations"] = self.stageAllocations
+		return result
+
+class ProfileHook:
+	"""Override any of these to get notified about profiling events"""
+
+	def onStage(self, fileName: str, stage: str, seconds: float, allocatedBytes: int|None) -> None:
+		pass
+
+	def onFile(self, profile: FileProfile) -> None:
+		pass
+
+class ProfileOptions:
+	"""Picklable part of a Profiler, used to profile files in worker processes"""
+	traceAllocations: bool
+	cProfileTopN: int
+	countOps: bool
+
+	def __init__(self, traceAllocations: bool = False, cProfileTopN: int = 0, countOps: bool = False) -> None:
+		self.traceAllocations = traceAllocations
+		self.cProfileTopN = cProfileTopN
+		self.countOps = countOps
+
+class _FileRecorder:
+	profile: FileProfile
+	options: ProfileOptions
+	hooks: List[ProfileHook]
+
+	def __init__(self, profile: FileProfile, options: ProfileOptions, hooks: List[ProfileHook]) -> None:
+		self.profile = profile
+		self.options = options
+		self.hooks = hooks
+
+	@contextmanager
+	def stage(self, stage: str) -> Iterator[None]:
+		traceAllocations = self.options.traceAllocations
+		if traceAllocations:
+			import tracemalloc
+			tracemalloc.reset_peak()
+			memStart = tracemalloc.get_traced_memory()[0]
+		t1 = time.perf_counter()
+		try:
+			yield
+		finally:
+			tD = time.perf_counter() - t1
+			stageTimes = self.profile.stageTimes
+			stageTimes[stage] = stageTimes.get(stage, 0) + tD
+			allocated: int|None = None
+			if traceAllocations:
+				allocated = tracemalloc.get_traced_memory()[1] - memStart
+				stageAllocations = self.profile.stageAllocations
+				stageAllocations[stage] = max(stageAllocations.get(stage, 0), allocated)
+			for hook in self.hooks:
+				hook.onStage(self.profile.name, stage, tD, allocated)
+
+class _NoStage:
+	def __enter__(self) -> None:
+		pass
+
+	def __exit__(self, *args) -> None:
+		pass
+
+_noStage = _NoStage()
+_activeRecorder: ContextVar[_FileRecorder|None] = ContextVar("activeRecorder", default=None)
+_activeOpStats: ContextVar[OpStats|None] = ContextVar("activeOpStats", default=None)
+
+def profileStage(name: str):
+	"""Context manager that adds the time spent inside it to the current file profile. Does nothing if profiling is disabled."""
+	recorder = _activeRecorder.get()
+	if recorder is None:
+		return _noStage
+	return recorder.stage(name)
+
+def activeOpStats() -> OpStats|None:
+	return _activeOpStats.get()
+
+def countStructure(func):
+	"""Decorator for OpCodeReader methods that parse a control flow structure, plain methods or tasks (generators)"""
+	name = func.__name__
+
+	def countedTask(opStats: OpStats, *args, **kwargs):
+		opStats.enterStructure(name)
+		t1 = time.perf_counter()
+		try:
+			return (yield from func(*args, **kwargs))
+		finally:
+			opStats.exitStructure(name, time.perf_counter() - t1)
+
+	isTask = bool(func.__code__.co_flags & CO_GENERATOR)
+	@functools.wraps(func)
+	def wrapper(*args, **kwargs):
+		opStats = _activeOpStats.get()
+		if opStats is None:
+			return func(*args, **kwargs)
+		if isTask:
+			return countedTask(opStats, *args, **kwargs)
+		opStats.enterStructure(name)
+		t1 = time.perf_counter()
+		try:
+			return func(*args, **kwargs)
+		finally:
+			opStats.exitStructure(name, time.perf_counter() - t1)
+	return wrapper
+
+@contextmanager
+def recordFile(name: str, options: ProfileOptions, hooks: List[ProfileHook]|None = None) -> Iterator[FileProfile]:
+	"""Profiles everything inside this block as the file `name`"""
+	profile = FileProfile(name)
+	recorder = _FileRecorder(profile, options, hooks or [])
+	startedTracemalloc = False
+	if options.traceAllocations:
+		import tracemalloc
+		startedTracemalloc = not tracemalloc.is_tracing()
+		if startedTracemalloc:
+			tracemalloc.start()
+	cProfiler = None
+	if options.cProfileTopN > 0:
+		import cProfile
+		cProfiler = cProfile.Profile()
+	if options.countOps:
+		profile.opStats = OpStats()
+	token = _activeRecorder.set(recorder)
+	opStatsToken = _activeOpStats.set(profile.opStats)
+	t1 = time.perf_counter()
+	if cProfiler is not None:
+		cProfiler.enable()
+	try:
+		yield profile
+	finally:
+		if cProfiler is not None:
+			cProfiler.disable()
+		profile.totalTime = time.perf_counter() - t1
+		_activeRecorder.reset(token)
+		_activeOpStats.reset(opStatsToken)
+		if startedTracemalloc:
+			tracemalloc.stop()
+		if cProfiler is not None:
+			cProfiler.create_stats()
+			profile.cProfileStats = cProfiler.stats # type: ignore
+
+class Profiler:
+	"""
+	Collects per file and per stage timings for a run. Use `profileFile()` around the work for one file,
+	or `addProfile()` for profiles that were recorded in another process.
+	"""
+	options: ProfileOptions
+	hooks: List[ProfileHook]
+	files: List[FileProfile]
+	opStats: OpStats|None
+	_filesByName: Dict[str, FileProfile]
+	_slowest: List[Tuple[float, int, FileProfile]]
+
+	def __init__(self, hooks: List[ProfileHook]|None = None, traceAllocations: bool = False, cProfileTopN: int = 0, countOps: bool = False) -> None:
+		self.options = ProfileOptions(traceAllocations, cProfileTopN, countOps)
+		self.hooks = hooks or []
+		self.files = []
+		self.opStats = OpStats() if countOps else None
+		self._filesByName = {}
+		self._slowest = []
+
+	@contextmanager
+	def profileFile(self, name: str) -> Iterator[FileProfile]:
+		with recordFile(name, self.options, self.hooks) as profile:
+			yield profile
+		self._finishFile(profile)
+
+	def addProfile(self, profile: FileProfile) -> None:
+		for hook in self.hooks:
+			for stageName, seconds in profile.stageTimes.items():
+				hook.onStage(profile.name, stageName, seconds, profile.stageAllocations.get(stageName))
+		self._finishFile(profile)
+
+	def addStage(self, fileName: str, stage: str, seconds: float) -> None:
+		"""Adds a stage that happened outside of the files profiling block (like writing the result in the main process)"""
+		profile = self._filesByName.get(fileName)
+		if profile is None:
+			return
+		profile.stageTimes[stage] = profile.stageTimes.get(stage, 0) + seconds
+		profile.totalTime += seconds
+		for hook in self.hooks:
+			hook.onStage(fileName, stage, seconds, None)
+
+	def _finishFile(self, profile: FileProfile) -> None:
+		for hook in self.hooks:
+			hook.onFile(profile)
+		if profile.opStats is not None and self.opStats is not None:
+			self.opStats.merge(profile.opStats)
+			# only the aggregate is kept
+			profile.opStats = None
+		if profile.cProfileStats is not None:
+			# only keep the cProfile stats of the slowest N files around
+			entry = (profile.totalTime, len(self.files), profile)
+			if len(self._slowest) < self.options.cProfileTopN:
+				heapq.heappush(self._slowest, entry)
+			else:
+				_, _, dropped = heapq.heappushpop(self._slowest, entry)
+				dropped.cProfileStats = None
+		self.files.append(profile)
+		self._filesByName[profile.name] = profile
+
+	def summary(self) -> Dict[str, Any]:
+		totalTime = sum(f.totalTime for f in self.files)
+		stageTotals: Dict[str, float] = {}
+		allocationPeaks: Dict[str, int] = {}
+		for file in self.files:
+			for stageName, seconds in file.stageTimes.items():
+				stageTotals[stageName] = stageTotals.get(stageName, 0) + seconds
+			for stageName, allocated in file.stageAllocations.items():
+				allocationPeaks[stageName] = max(allocationPeaks.get(stageName, 0), allocated)
+		stages = {}
+		for stageName in sorted(stageTotals.keys(), key=lambda s: STAGES.index(s) if s in STAGES else len(STAGES)):
+			stages[stageName] = {
+				"time": stageTotals[stageName],
+				"share": stageTotals[stageName] / totalTime if totalTime > 0 else 0,
+			}
+			if stageName in allocationPeaks:
+				stages[stageName]["peakAllocation"] = allocationPeaks[stageName]
+		slowest = sorted(self.files, key=lambda f: f.totalTime, reverse=True)[:10]
+		result = {
+			"fileCount": len(self.files),
+			"totalTime": totalTime,
+			"stages": stages,
+			"slowestFiles": [f.toJson() for f in slowest],
+			"files": [f.toJson() for f in self.files],
+		}
+		if self.opStats is not None:
+			result["opStats"] = self.opStats.toJson()
+		return result
+
+	def writeJson(self, path: str) -> None:
+		import json
+		with open(path, "w", encoding="utf-8") as f:
+			json.dump(self.summary(), f, indent=2)
+
+	def dumpSlowestStats(self, outDir: str) -> List[str]:
+		"""Writes the cProfile stats of the slowest files as .pstats files (loadable with pstats.Stats)"""
+		os.makedirs(outDir, exist_ok=True)
+		written = []
+		for rank, (_, _, profile) in enumerate(sorted(self._slowest, reverse=True)):
+			fileName = f"{rank:02}_{os.path.basename(profile.name)}.pstats"
+			outPath = os.path.join(outDir, fileName)
+			with open(outPath, "wb") as f:
+				marshal.dump(profile.cProfileStats, f)
+			written.append(outPath)
+		return written
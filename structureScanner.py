@@ -0,0 +1,379 @@
+"""
+Class, module and method structure of a mrb file, read straight from the raw irep tree (see mrbParser.readRawIreps).
+
+Each irep is scanned once while a few register values are tracked (constants, nil, self, classes, lambdas).
+That's enough to follow the sequences mrbc generates for definitions:
+
+    class A::B < C:     GETCONST R(a) A;  GETCONST R(a+1) C;  CLASS R(a) :B;  EXEC R(a) I(n)
+    module M:           LOADNIL R(a);  MODULE R(a) :M;  EXEC R(a) I(n)
+    class << x:         SCLASS R(a) R(x);  EXEC R(a) I(n)
+    def m / def self.m: TCLASS R(a) (or SCLASS R(a) R(self));  LAMBDA R(a+1) I(n);  METHOD R(a) :m
+    blocks:             LAMBDA R(b) I(n);  SENDB R(a) :m argc   (with b = a + argc + 1)
+
+Every irep gets a scope (class name and innermost definition), so symbol references (calls, constants, variables)
+can be attributed to the method or class they are in.
+"""
+from __future__ import annotations
+from typing import Dict, List, Set, Tuple
+
+from mrbParser import RawIrep, iterRawIreps
+from opcodes import AllOpCodes, MrbCodeAspec, SYMBOL_OPERANDS, rawOperand
+
+# reference kind of all symbol operands that aren't definitions
+REFERENCE_KINDS = {
+    AllOpCodes.OP_SEND: "call",
+    AllOpCodes.OP_SENDB: "call",
+    AllOpCodes.OP_TAILCALL: "call",
+    AllOpCodes.OP_GETCONST: "constGet",
+    AllOpCodes.OP_SETCONST: "constSet",
+    AllOpCodes.OP_GETMCNST: "constGet",
+    AllOpCodes.OP_SETMCNST: "constSet",
+    AllOpCodes.OP_GETGLOBAL: "globalGet",
+    AllOpCodes.OP_SETGLOBAL: "globalSet",
+    AllOpCodes.OP_GETIV: "ivarGet",
+    AllOpCodes.OP_SETIV: "ivarSet",
+    AllOpCodes.OP_GETCV: "cvarGet",
+    AllOpCodes.OP_SETCV: "cvarSet",
+}
+TOP_LEVEL_CLASS = "Object"
+TOP_LEVEL_OWNER = "main"
+UNKNOWN = "?"
+# argc of SEND/SENDB when the arguments are in an array
+CALL_MAXARGS = 127
+
+class Definition:
+    kind: str               # class, module, sclass, method or block
+    name: str
+    qualifiedName: str      # MyMod::Class1, Class1#method, Class1.singletonMethod, #<Class:Class1>
+    parent: int             # index of the enclosing definition, -1 at the top level
+    irepPath: str           # irep of the defining instruction
+    pc: int
+    bodyPath: str|None      # irep of the class/method body
+    superclass: str|None
+    enter: int|None         # raw OP_ENTER instruction of methods and blocks
+    lvarNames: List[str|None]   # local variables of the body, only with readRawIreps(readLvars=True)
+
+    def __init__(self, kind: str, name: str, qualifiedName: str, parent: int, irepPath: str, pc: int) -> None:
+        self.kind = kind
+        self.name = name
+        self.qualifiedName = qualifiedName
+        self.parent = parent
+        self.irepPath = irepPath
+        self.pc = pc
+        self.bodyPath = None
+        self.superclass = None
+        self.enter = None
+        self.lvarNames = []
+
+    def argSpec(self) -> Dict[str, int]|None:
+        if self.enter is None:
+            return None
+        aspec = MrbCodeAspec(self.enter)
+        return {
+            "req": aspec.req,
+            "opt": aspec.opt,
+            "rest": aspec.rest,
+            "post": aspec.post,
+            "key": aspec.key,
+            "kdict": aspec.kdict,
+            "block": aspec.block,
+        }
+
+    def arguments(self) -> List[Tuple[str, str|None]]|None:
+        """(kind, name) of all parameters in declaration order. kind is req, opt, rest, post or block."""
+        spec = self.argSpec()
+        if spec is None:
+            return None
+        kinds = ["req"] * spec["req"] + ["opt"] * spec["opt"] + ["rest"] * spec["rest"] + ["post"] * spec["post"] + ["block"] * spec["block"]
+        names = self.lvarNames[:len(kinds)]
+        names += [None] * (len(kinds) - len(names))
+        return list(zip(kinds, names))
+
+    def signature(self) -> str:
+        """name(a, b = ?, *c, &d)"""
+        arguments = self.arguments()
+        if arguments is None:
+            return self.name
+        prefixes = { "req": "", "opt": "", "rest": "*", "post": "", "block": "&" }
+        parts = [f"{prefixes[kind]}{name or '_'}{' = ?' if kind == 'opt' else ''}" for kind, name in arguments]
+        return f"{self.name}({', '.join(parts)})"
+
+    def toJson(self) -> Dict:
+        json = {
+            "kind": self.kind,
+            "name": self.name,
+            "qualifiedName": self.qualifiedName,
+            "irep": self.irepPath,
+            "pc": self.pc,
+        }
+        if self.bodyPath is not None:
+            json["body"] = self.bodyPath
+        if self.superclass is not None:
+            json["superclass"] = self.superclass
+        if self.enter is not None:
+            json["argSpec"] = self.argSpec()
+            json["args"] = [{ "kind": kind, "name": name } for kind, name in self.arguments()]
+        return json
+
+class Reference:
+    kind: str
+    name: str
+    owner: str              # qualified name of the innermost class or method, "main" at the top level
+    irepPath: str
+    pc: int
+
+    def __init__(self, kind: str, name: str, owner: str, irepPath: str, pc: int) -> None:
+        self.kind = kind
+        self.name = name
+        self.owner = owner
+        self.irepPath = irepPath
+        self.pc = pc
+
+class Scope:
+    className: str          # class that `def` adds methods to
+    isSingleton: bool       # inside of `class << x`
+    definition: int         # innermost definition, -1 at the top level
+    owner: str
+
+    def __init__(self, className: str, isSingleton: bool, definition: int, owner: str) -> None:
+        self.className = className
+        self.isSingleton = isSingleton
+        self.definition = definition
+        self.owner = owner
+
+    def qualify(self, name: str) -> str:
+        return name if self.className == TOP_LEVEL_CLASS else f"{self.className}::{name}"
+
+    def selfName(self) -> str:
+        if self.definition == -1:
+            return TOP_LEVEL_OWNER
+        return self.className if self.owner == self.className else "self"
+
+class FileStructure:
+    definitions: List[Definition]
+    references: List[Reference]
+    scopes: Dict[str, Scope]
+    ireps: Dict[str, RawIrep]
+
+    def __init__(self, root: RawIrep, withReferences: bool = True, onlySymbol: str|None = None) -> None:
+        """With onlySymbol, only ireps that have it in their symbol table (and their parents) are scanned"""
+        self.definitions = []
+        self.references = []
+        self.scopes = {}
+        self.ireps = { irep.path: irep for irep in iterRawIreps(root) }
+        scanned = None
+        if onlySymbol is not None:
+            scanned = set()
+            for path, irep in self.ireps.items():
+                if onlySymbol in irep.symbols:
+                    scanned.add("/")
+                    parts = path.split("/")[1:] if path != "/" else []
+                    for i in range(len(parts)):
+                        scanned.add("/" + "/".join(parts[:i + 1]))
+        stack = [(root, Scope(TOP_LEVEL_CLASS, False, -1, TOP_LEVEL_OWNER))]
+        while stack:
+            irep, scope = stack.pop()
+            if scanned is not None and irep.path not in scanned:
+                continue
+            self.scopes[irep.path] = scope
+            childScopes = self._scanIrep(irep, scope, withReferences)
+            for i in reversed(range(len(irep.children))):
+                stack.append((irep.children[i], childScopes.get(i, scope)))
+
+    def find(self, qualifiedName: str) -> List[Definition]:
+        return [definition for definition in self.definitions if definition.qualifiedName == qualifiedName]
+
+    def _define(self, kind: str, name: str, qualifiedName: str, scope: Scope, irep: RawIrep, pc: int) -> int:
+        self.definitions.append(Definition(kind, name, qualifiedName, scope.definition, irep.path, pc))
+        return len(self.definitions) - 1
+
+    def _defineBody(self, definitionI: int, irep: RawIrep, childI: int) -> None:
+        if childI >= len(irep.children):
+            return
+        child = irep.children[childI]
+        definition = self.definitions[definitionI]
+        definition.bodyPath = child.path
+        definition.lvarNames = [name for name, _ in child.lvars]
+        if definition.kind in ["method", "block"] and len(child.iseq) > 0 and child.iseq[0] & 0x7f == AllOpCodes.OP_ENTER:
+            definition.enter = child.iseq[0]
+
+    def _scanIrep(self, irep: RawIrep, scope: Scope, withReferences: bool) -> Dict[int, Scope]:
+        """Finds all definitions and references of one irep. Returns the scopes of its children."""
+        symbols = irep.symbols
+        def symbol(i: int) -> str:
+            return symbols[i] if i < len(symbols) else UNKNOWN
+        # register -> (kind, value)
+        registers: Dict[int, Tuple] = {}
+        childScopes: Dict[int, Scope] = {}
+        # child index -> pc of the OP_LAMBDA
+        lambdas: Dict[int, int] = {}
+
+        for pc, code in enumerate(irep.iseq):
+            opcode = code & 0x7f
+            a = (code >> 23) & 0x1ff
+            if withReferences and opcode in REFERENCE_KINDS:
+                self.references.append(Reference(REFERENCE_KINDS[opcode], symbol(rawOperand(code, SYMBOL_OPERANDS[opcode])), scope.owner, irep.path, pc))
+
+            if opcode == AllOpCodes.OP_MOVE:
+                registers[a] = registers.get((code >> 14) & 0x1ff)
+            elif opcode == AllOpCodes.OP_LOADNIL:
+                registers[a] = ("nil", None)
+            elif opcode == AllOpCodes.OP_LOADSELF:
+                registers[a] = ("self", None)
+            elif opcode == AllOpCodes.OP_GETCONST:
+                registers[a] = ("const", symbol(rawOperand(code, "Bx")))
+            elif opcode == AllOpCodes.OP_GETMCNST:
+                base = registers.get(a)
+                name = symbol(rawOperand(code, "Bx"))
+                registers[a] = ("const", f"{base[1]}::{name}" if base and base[0] == "const" else name)
+            elif opcode == AllOpCodes.OP_OCLASS:
+                registers[a] = ("const", TOP_LEVEL_CLASS)
+            elif opcode == AllOpCodes.OP_TCLASS:
+                registers[a] = ("tclass", None)
+            elif opcode == AllOpCodes.OP_CLASS or opcode == AllOpCodes.OP_MODULE:
+                name = symbol(rawOperand(code, "B"))
+                outer = registers.get(a)
+                qualifiedName = f"{outer[1]}::{name}" if outer and outer[0] == "const" else scope.qualify(name)
+                kind = "class" if opcode == AllOpCodes.OP_CLASS else "module"
+                definitionI = self._define(kind, name, qualifiedName, scope, irep, pc)
+                if opcode == AllOpCodes.OP_CLASS:
+                    superclass = registers.get(a + 1)
+                    if superclass and superclass[0] == "const":
+                        self.definitions[definitionI].superclass = superclass[1]
+                registers[a] = ("class", definitionI)
+            elif opcode == AllOpCodes.OP_SCLASS:
+                target = registers.get((code >> 14) & 0x1ff)
+                if target is None:
+                    targetName = UNKNOWN
+                elif target[0] == "self":
+                    targetName = scope.selfName()
+                elif target[0] == "const":
+                    targetName = target[1]
+                elif target[0] == "class":
+                    targetName = self.definitions[target[1]].qualifiedName
+                else:
+                    targetName = UNKNOWN
+                registers[a] = ("sclass", targetName)
+            elif opcode == AllOpCodes.OP_EXEC:
+                target = registers.get(a)
+                childI = rawOperand(code, "Bx")
+                if target and target[0] == "class":
+                    definition = self.definitions[target[1]]
+                    self._defineBody(target[1], irep, childI)
+                    childScopes[childI] = Scope(definition.qualifiedName, False, target[1], definition.qualifiedName)
+                elif target and target[0] == "sclass":
+                    definitionI = self._define("sclass", target[1], f"#<Class:{target[1]}>", scope, irep, pc)
+                    self._defineBody(definitionI, irep, childI)
+                    childScopes[childI] = Scope(target[1], True, definitionI, f"#<Class:{target[1]}>")
+                registers.pop(a, None)
+            elif opcode == AllOpCodes.OP_LAMBDA:
+                childI = (code >> 9) & 0x3fff
+                lambdas[childI] = pc
+                registers[a] = ("lambda", childI)
+            elif opcode == AllOpCodes.OP_METHOD:
+                target = registers.get(a)
+                body = registers.get(a + 1)
+                if target is None:
+                    className, isSingleton = UNKNOWN, False
+                elif target[0] == "tclass":
+                    className, isSingleton = scope.className, scope.isSingleton
+                elif target[0] == "sclass":
+                    className, isSingleton = target[1], True
+                elif target[0] == "class":
+                    className, isSingleton = self.definitions[target[1]].qualifiedName, False
+                else:
+                    className, isSingleton = UNKNOWN, False
+                name = symbol(rawOperand(code, "B"))
+                qualifiedName = f"{className}{'.' if isSingleton else '#'}{name}"
+                definitionI = self._define("method", name, qualifiedName, scope, irep, pc)
+                if body and body[0] == "lambda":
+                    lambdas.pop(body[1], None)
+                    self._defineBody(definitionI, irep, body[1])
+                    childScopes[body[1]] = Scope(className, isSingleton, definitionI, qualifiedName)
+            elif opcode == AllOpCodes.OP_SENDB:
+                argc = (code >> 7) & 0x7f
+                block = registers.get(a + (argc if argc != CALL_MAXARGS else 1) + 1)
+                if block and block[0] == "lambda" and block[1] in lambdas:
+                    self._defineBlock(symbol(rawOperand(code, "B")), scope, irep, lambdas.pop(block[1]), block[1], childScopes)
+                registers.pop(a, None)
+            else:
+                registers.pop(a, None)
+
+        # lambdas that aren't method bodies or blocks of a SENDB (`-> {}`, `proc {}`)
+        for childI, pc in lambdas.items():
+            self._defineBlock("lambda", scope, irep, pc, childI, childScopes)
+        return childScopes
+
+    def _defineBlock(self, name: str, scope: Scope, irep: RawIrep, pc: int, childI: int, childScopes: Dict[int, Scope]) -> None:
+        definitionI = self._define("block", name, scope.owner, scope, irep, pc)
+        self._defineBody(definitionI, irep, childI)
+        # blocks belong to the method they are in
+        childScopes[childI] = Scope(scope.className, scope.isSingleton, scope.definition, scope.owner)
+
+def definitionSymbol(qualifiedName: str) -> str|None:
+    """Symbol that has to be in the symbol table of the irep that defines qualifiedName"""
+    if qualifiedName.startswith("#<"):
+        return None
+    for separator in ["#", ".", "::"]:
+        if separator in qualifiedName:
+            qualifiedName = qualifiedName.rsplit(separator, 1)[1]
+    return qualifiedName
+
+def _setupRegisters(code: int) -> Tuple[int, List[int]]|None:
+    """(written register, read registers) of instructions that set up a definition, None for everything else"""
+    opcode = code & 0x7f
+    a = (code >> 23) & 0x1ff
+    b = (code >> 14) & 0x1ff
+    if opcode in [AllOpCodes.OP_LOADNIL, AllOpCodes.OP_LOADSELF, AllOpCodes.OP_LOADT, AllOpCodes.OP_LOADF, AllOpCodes.OP_LOADSYM,
+                  AllOpCodes.OP_GETCONST, AllOpCodes.OP_OCLASS, AllOpCodes.OP_TCLASS, AllOpCodes.OP_LAMBDA]:
+        return a, []
+    if opcode == AllOpCodes.OP_MOVE or opcode == AllOpCodes.OP_SCLASS:
+        return a, [b]
+    if opcode == AllOpCodes.OP_GETMCNST or opcode == AllOpCodes.OP_MODULE:
+        return a, [a]
+    if opcode == AllOpCodes.OP_CLASS:
+        return a, [a, a + 1]
+    return None
+
+def definitionEnd(irep: RawIrep, definition: Definition) -> int:
+    """pc of the last instruction of a definition (OP_METHOD or the OP_EXEC of the class body)"""
+    if definition.kind != "class" and definition.kind != "module":
+        return definition.pc
+    a = (irep.iseq[definition.pc] >> 23) & 0x1ff
+    for pc in range(definition.pc + 1, len(irep.iseq)):
+        code = irep.iseq[pc]
+        if code & 0x7f == AllOpCodes.OP_EXEC and (code >> 23) & 0x1ff == a:
+            return pc
+    raise Exception(f"No OP_EXEC for {definition.qualifiedName}")
+
+def definitionSlice(irep: RawIrep, endPc: int, localRegisters: Set[int]) -> List[int]:
+    """
+    pcs of all instructions that the definition ending at endPc depends on (in order, including endPc), found by
+    following the registers it reads backwards. Registers of local variables don't have to be set up.
+    """
+    code = irep.iseq[endPc]
+    a = (code >> 23) & 0x1ff
+    needed = { a, a + 1 } if code & 0x7f == AllOpCodes.OP_METHOD else { a }
+    needed -= localRegisters
+    pcs = [endPc]
+    for pc in range(endPc - 1, -1, -1):
+        if not needed:
+            break
+        code = irep.iseq[pc]
+        if code & 0x7f == AllOpCodes.OP_MOVE and (code >> 23) & 0x1ff in localRegisters and (code >> 14) & 0x1ff in needed:
+            # `x = <value>` with <value> still in use, the value can be referred to by the variable name
+            needed.discard((code >> 14) & 0x1ff)
+            pcs.append(pc)
+            continue
+        setup = _setupRegisters(code)
+        if setup is None:
+            # registers written by anything else can't be reproduced, stop following them
+            needed.discard((code >> 23) & 0x1ff)
+            continue
+        written, read = setup
+        if written not in needed:
+            continue
+        needed.discard(written)
+        needed.update(r for r in read if r not in localRegisters)
+        pcs.append(pc)
+    return pcs[::-1]
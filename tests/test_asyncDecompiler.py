@@ -0,0 +1,79 @@
+"""
+The asyncio entry points (asyncDecompiler.py) give the same output as the synchronous ones, and decompileManyAsync()
+only keeps `concurrency` files in flight.
+"""
+from __future__ import annotations
+import asyncio
+import glob
+import os
+import sys
+from typing import AsyncIterator, Dict, List, Tuple
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(ROOT)
+
+from asyncDecompiler import compileSourceAsync, decompileBytesAsync, decompileManyAsync
+from compiler import compileSource, getMrbcPath
+from decompiler import DecompileResult, decompileBytes
+from diagnostics import DiagnosticsCollector
+
+needsMrbc = pytest.mark.skipif(not os.path.exists(getMrbcPath()), reason="mrbc isn't available")
+
+def readExamples() -> Dict[str, bytes]:
+    examples = {}
+    for file in sorted(glob.glob(os.path.join(ROOT, "examples", "*.mrb"))):
+        with open(file, "rb") as f:
+            examples[os.path.basename(file)] = f.read()
+    return examples
+
+async def collect(items, concurrency: int = 4, diagnostics: DiagnosticsCollector|None = None) -> Dict[str, DecompileResult]:
+    return { name: result async for name, result in decompileManyAsync(items, concurrency, diagnostics=diagnostics) }
+
+def test_decompileBytes():
+    examples = readExamples()
+    data = examples["classes.mrb"]
+    assert asyncio.run(decompileBytesAsync(data)) == decompileBytes(data)
+
+@pytest.mark.parametrize("asyncItems", [False, True])
+def test_decompileMany(asyncItems: bool):
+    examples = readExamples()
+
+    async def generate() -> AsyncIterator[Tuple[str, bytes]]:
+        for item in examples.items():
+            yield item
+
+    diagnostics = DiagnosticsCollector(echo=False)
+    results = asyncio.run(collect(generate() if asyncItems else examples.items(), diagnostics=diagnostics))
+    assert results == { name: decompileBytes(data) for name, data in examples.items() }
+    assert len(diagnostics.files) == len(examples)
+
+def test_inputConsumedLazily():
+    examples = list(readExamples().items())
+    taken: List[str] = []
+    inFlight: List[int] = []
+
+    def generate():
+        for name, data in examples:
+            taken.append(name)
+            yield name, data
+
+    async def run():
+        done = 0
+        async for _ in decompileManyAsync(generate(), concurrency=2):
+            done += 1
+            inFlight.append(len(taken) - done)
+
+    asyncio.run(run())
+    assert len(taken) == len(examples)
+    assert max(inFlight) <= 2
+
+def test_failedFile():
+    results = asyncio.run(collect([("broken.mrb", b"RITE0200 not an mrb file")]))
+    assert isinstance(results["broken.mrb"], Exception)
+
+@needsMrbc
+def test_compileSource():
+    source = "puts [1, 2].map { |x| x * 2 }"
+    assert asyncio.run(compileSourceAsync(source)) == compileSource(source)
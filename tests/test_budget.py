@@ -0,0 +1,48 @@
+"""
+The time budget only counts the decompiler, not setting up the budget, and it also applies to single files.
+"""
+from __future__ import annotations
+import importlib.util
+import os
+import shutil
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(ROOT)
+
+import budget
+from budget import Budget
+from decompiler import decompileWithBudget
+
+def test_clockStartsAfterSetup(monkeypatch):
+    currentMemory = budget.currentMemory
+    calls = []
+
+    def slowFirstRead() -> int|None:
+        if not calls:
+            time.sleep(0.2)
+        calls.append(1)
+        return currentMemory()
+
+    monkeypatch.setattr(budget, "currentMemory", slowFirstRead)
+    with open(os.path.join(ROOT, "examples", "if.mrb"), "rb") as f:
+        data = f.read()
+    code = decompileWithBudget(data, Budget(0.1, 1 << 40))
+    assert calls
+    assert not code.startswith("# Time budget")
+
+def test_singleFile(tmp_path):
+    # __init__.py is the command line entry point, not an importable package
+    spec = importlib.util.spec_from_file_location("mrbCli", os.path.join(ROOT, "__init__.py"))
+    cli = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(cli)
+    file = str(tmp_path / "if.mrb")
+    shutil.copy(os.path.join(ROOT, "examples", "if.mrb"), file)
+
+    cli.decompileFile(file, budget=Budget(1e-9, None))
+    with open(f"{file}.rb", encoding="utf-8") as f:
+        assert f.read().startswith("# Time budget")
+    cli.decompileFile(file, budget=Budget(100, None))
+    with open(f"{file}.rb", encoding="utf-8") as f:
+        assert not f.read().startswith("# Time budget")
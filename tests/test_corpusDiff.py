@@ -0,0 +1,82 @@
+"""
+diffBytes() reports changed, moved and added definitions between two compiled versions of a script.
+"""
+from __future__ import annotations
+import os
+import sys
+from typing import Dict, Tuple
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(ROOT)
+
+from compiler import compileSource, getMrbcPath
+from corpusDiff import diffBytes
+
+pytestmark = pytest.mark.skipif(not os.path.exists(getMrbcPath()), reason="mrbc isn't available")
+
+OLD = """
+class A
+  def foo
+    puts 1
+  end
+  def bar
+    2
+  end
+end
+"""
+
+def diffSources(old: str, new: str) -> Dict[Tuple[str, str], Tuple[str|None, str|None, str|None]]:
+    """(status, qualified name) -> (old name, old irep, new irep) of every change"""
+    changes = diffBytes(compileSource(old), compileSource(new))
+    return { (change.status, change.qualifiedName): (change.oldName, change.oldPath, change.newPath) for change in changes }
+
+def test_unchanged():
+    assert diffSources(OLD, OLD) == {}
+
+def test_changed():
+    new = OLD.replace("puts 1", "puts 3")
+    assert diffSources(OLD, new) == { ("changed", "A#foo"): (None, "/0/0", "/0/0") }
+
+def test_moved():
+    # foo keeps its body but is defined after bar now
+    new = """
+class A
+  def bar
+    2
+  end
+  def foo
+    puts 1
+  end
+end
+"""
+    changes = diffSources(OLD, new)
+    assert changes[("moved", "A#foo")] == (None, "/0/0", "/0/1")
+    assert changes[("moved", "A#bar")] == (None, "/0/1", "/0/0")
+    assert not any(status == "changed" and name.startswith("A#") for status, name in changes)
+
+def test_movedToOtherClass():
+    new = """
+class A
+  def bar
+    2
+  end
+end
+class B
+  def foo
+    puts 1
+  end
+end
+"""
+    changes = diffSources(OLD, new)
+    assert changes[("moved", "B#foo")] == ("A#foo", "/0/0", "/1/0")
+    assert ("removed", "A#foo") not in changes
+    assert ("added", "B") in changes
+
+def test_added():
+    new = OLD.replace("  def bar", "  def baz\n    puts 5\n  end\n  def bar")
+    changes = diffSources(OLD, new)
+    assert ("added", "A#baz") in changes
+    assert ("changed", "A#foo") not in changes
+    assert not any(status == "removed" for status, _ in changes)
@@ -0,0 +1,39 @@
+"""
+decompileDefinition() finds methods, singleton methods, classes and nested modules by their qualified name and
+decompiles them the same way as the whole file does.
+"""
+from __future__ import annotations
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(ROOT)
+
+from decompiler import decompileBytes, decompileDefinition
+
+def readExample(name: str) -> bytes:
+    with open(os.path.join(ROOT, "examples", name), "rb") as f:
+        return f.read()
+
+def dedent(text: str) -> str:
+    return "\n".join(line.strip() for line in text.splitlines())
+
+@pytest.mark.parametrize("file, qualifiedName, firstLine", [
+    ("classes.mrb", "Class3#test", "def test()"),
+    ("classes.mrb", "Class5.single", "def self.single()"),
+    ("classes.mrb", "Class2", "class Class2"),
+    ("classes.mrb", "MyMod::NestedMod::Class1", "class Class1"),
+    ("methods.mrb", "Object#aPlusB", "def aPlusB(a, b)"),
+])
+def test_lookup(file: str, qualifiedName: str, firstLine: str):
+    data = readExample(file)
+    definition = decompileDefinition(data, qualifiedName)
+    assert definition.splitlines()[0] == firstLine
+    # the same lines as in the whole file, only the indentation differs
+    assert dedent(definition).strip() in dedent(decompileBytes(data))
+
+def test_missing():
+    with pytest.raises(Exception, match="Class3#nope is not defined"):
+        decompileDefinition(readExample("classes.mrb"), "Class3#nope")
@@ -0,0 +1,36 @@
+"""
+decompileMany() with a pool only reads as many files ahead as it has in flight.
+"""
+from __future__ import annotations
+import os
+import sys
+from typing import Iterator, List, Tuple
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(ROOT)
+
+from decompiler import decompileBytes, decompileMany
+
+def readItems(data: bytes, count: int, read: List[str]) -> Iterator[Tuple[str, bytes]]:
+    for i in range(count):
+        name = f"file{i}"
+        read.append(name)
+        yield name, data
+
+@pytest.mark.parametrize("threads", [True, False], ids=["threads", "processes"])
+def test_consumesInputLazily(threads: bool):
+    with open(os.path.join(ROOT, "examples", "if.mrb"), "rb") as f:
+        data = f.read()
+    read: List[str] = []
+    workers = 2
+    results = decompileMany(readItems(data, 50, read), workers, threads=threads)
+    try:
+        name, result = next(results)
+        assert name == "file0"
+        assert result == decompileBytes(data)
+        # 2 * workers files are in flight at once
+        assert len(read) <= 2 * workers
+    finally:
+        results.close()
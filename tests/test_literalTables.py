@@ -0,0 +1,61 @@
+"""
+Literal tables (see mrbToRb/literalTables.py) have to decompile to the same output as stepping through every element,
+on the examples, the benchmark workloads and nested array and hash literals.
+"""
+from __future__ import annotations
+import glob
+import os
+import sys
+from typing import Tuple
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "benchmarks"))
+
+from compiler import compileSource, getMrbcPath
+from decompiler import decompileBytes
+from mrbToRb.literalTables import literalTablesEnabled
+from workloads import WORKLOADS
+
+needsMrbc = pytest.mark.skipif(not os.path.exists(getMrbcPath()), reason="mrbc isn't available")
+
+NESTED = {
+    "arrays": "A = [1, [2, [3, [4, :five]]], \"six\", nil, true, false, 7.5]\nputs A",
+    "hashes": "H = { a: 1, \"b\" => [1, 2], c: { d: 3.5, e: { f: nil } } }\nputs H",
+    "empty": "x = [[], {}, [[]], { a: [] }]\nputs x",
+    "arguments": "puts([1, [2, 3]], { k: [4, 5] })\nfoo [], {}",
+    # the splat call reads the registers that the table before it loaded its elements into
+    "splat": "puts [1, 2, [3, 4], { a: 5 }]\nz = [1]\nfoo(*z)\nfoo(1, *z)",
+    "locals": "y = 1\nz = [y, [2, 3], { y => [4] }]\nputs z",
+}
+
+def decompileBoth(data: bytes) -> Tuple[str, str]:
+    """(stepwise, with literal tables) outputs"""
+    outputs = []
+    for enabled in [False, True]:
+        token = literalTablesEnabled.set(enabled)
+        try:
+            outputs.append(decompileBytes(data))
+        finally:
+            literalTablesEnabled.reset(token)
+    return outputs[0], outputs[1]
+
+@pytest.mark.parametrize("file", sorted(glob.glob(os.path.join(ROOT, "examples", "*.mrb"))), ids=os.path.basename)
+def test_examples(file: str):
+    with open(file, "rb") as f:
+        stepwise, tables = decompileBoth(f.read())
+    assert tables == stepwise
+
+@needsMrbc
+@pytest.mark.parametrize("name", WORKLOADS.keys())
+def test_workloads(name: str):
+    stepwise, tables = decompileBoth(compileSource(WORKLOADS[name](20)))
+    assert tables == stepwise
+
+@needsMrbc
+@pytest.mark.parametrize("name", NESTED.keys())
+def test_nested(name: str):
+    stepwise, tables = decompileBoth(compileSource(NESTED[name]))
+    assert tables == stepwise
@@ -0,0 +1,40 @@
+"""
+serializeRiteFile() writes an unmodified RiteFile back byte for byte, and patched files parse and decompile with the edits.
+"""
+from __future__ import annotations
+import glob
+import io
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(ROOT)
+
+from decompiler import decompileBytes
+from mrbParser import RiteFile
+from mrbPatch import findIrep, patchBytes, replacePool, replaceSymbol
+from mrbWriter import CRC_OFFSET, calcCrc, serializeRiteFile
+
+def readExample(name: str) -> bytes:
+    with open(os.path.join(ROOT, "examples", name), "rb") as f:
+        return f.read()
+
+@pytest.mark.parametrize("file", sorted(glob.glob(os.path.join(ROOT, "examples", "*.mrb"))), ids=os.path.basename)
+def test_roundTrip(file: str):
+    with open(file, "rb") as f:
+        data = f.read()
+    assert serializeRiteFile(RiteFile(io.BytesIO(data))) == data
+
+def test_patch():
+    def edits(riteFile: RiteFile):
+        irep = findIrep(riteFile, "/1/0")
+        replacePool(irep, 0, "Hello, patched world")
+        replaceSymbol(irep, 0, "print")
+
+    data = patchBytes(readExample("classes.mrb"), edits)
+    # binarySize and the crc are recalculated for the longer literal
+    assert int.from_bytes(data[8:10], "big") == calcCrc(data[CRC_OFFSET:])
+    assert int.from_bytes(data[10:14], "big") == len(data)
+    assert 'self.print("Hello, patched world")' in decompileBytes(data)
@@ -0,0 +1,115 @@
+"""
+Classification of jump regions (mrbToRb/regions.py) on small hand written ireps, and the decompiled output of the same
+shapes compiled with mrbc. The value form (and/or, while) depends on the last instruction of the right side or condition
+leaving its value in the jump's register, a changed VALUE_OPCODES or ASSIGNMENT_OPCODES shows up here.
+"""
+from __future__ import annotations
+import io
+import os
+import sys
+from typing import Dict, List, Tuple
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(ROOT)
+
+from compiler import compileSource, getMrbcPath
+from mrbParser import RiteFile
+from mrbToRb.mrbToRb import mrbToRb
+from mrbToRb.opCodeFeed import OpCodeFeed
+from mrbToRb.regions import classifyJump, findJumpPositions, findRegions
+from opcodes import AllOpCodes, MrbCode, getMrbCode, markDeadCode
+
+needsMrbc = pytest.mark.skipif(not os.path.exists(getMrbcPath()), reason="mrbc isn't available")
+
+def op(opcode: int, A: int = 0, B: int = 0, C: int = 0, sBx: int|None = None) -> MrbCode:
+    if sBx is not None:
+        return getMrbCode((A << 23) | ((sBx + 0x7fff) << 7) | opcode)
+    return getMrbCode((A << 23) | (B << 14) | (C << 7) | opcode)
+
+def feed(codes: List[MrbCode]) -> OpCodeFeed:
+    markDeadCode(codes, 0)
+    return OpCodeFeed(codes)
+
+def regions(codes: List[MrbCode], isWhileLoop: bool = False) -> Dict[int, Tuple[str, int, List[Tuple[int, int]]]]:
+    """position -> (kind, resume, sections)"""
+    opcodes = feed(codes)
+    found = findRegions(opcodes, None, isWhileLoop, findJumpPositions(opcodes))
+    return { pos: (region.kind, region.resume, region.sections) for pos, region in found.items() }
+
+GETIV, LOADI, MOVE, SETIV, JMP, JMPIF, JMPNOT, STOP = (AllOpCodes.OP_GETIV, AllOpCodes.OP_LOADI, AllOpCodes.OP_MOVE,
+    AllOpCodes.OP_SETIV, AllOpCodes.OP_JMP, AllOpCodes.OP_JMPIF, AllOpCodes.OP_JMPNOT, AllOpCodes.OP_STOP)
+
+def test_and():
+    # r1 = @a && @b
+    codes = [op(GETIV, 1), op(JMPNOT, 1, sBx=2), op(GETIV, 1), op(MOVE, 2, 1), op(STOP)]
+    assert regions(codes) == { 1: ("and", 2, [(2, 3)]) }
+
+def test_if():
+    # the right side leaves its value in r2, not in the register that was tested
+    codes = [op(GETIV, 1), op(JMPNOT, 1, sBx=2), op(GETIV, 2), op(STOP)]
+    assert regions(codes) == { 1: ("if", 2, [(2, 3)]) }
+
+def test_andAssignsTestedRegister():
+    # `@x = v` keeps the value in the register of v
+    codes = [op(GETIV, 1), op(JMPNOT, 1, sBx=2), op(SETIV, 1), op(STOP)]
+    assert regions(codes)[1][0] == "and"
+
+def test_orAndUnless():
+    assert regions([op(GETIV, 1), op(JMPIF, 1, sBx=2), op(GETIV, 1), op(STOP)]) == { 1: ("or", 2, [(2, 3)]) }
+    assert regions([op(GETIV, 1), op(JMPIF, 1, sBx=2), op(LOADI, 2), op(STOP)]) == { 1: ("unless", 2, [(2, 3)]) }
+
+def test_andOr():
+    # r1 = @a && @b || @c
+    codes = [op(GETIV, 1), op(JMPNOT, 1, sBx=2), op(GETIV, 1), op(JMPIF, 1, sBx=2), op(GETIV, 1), op(MOVE, 2, 1), op(STOP)]
+    assert regions(codes) == { 1: ("and", 2, [(2, 3)]), 3: ("or", 4, [(4, 5)]) }
+
+def test_orWithSeveralStatements():
+    # r1 = @a || (@b; @c), the right side moves its last value into r1
+    codes = [op(GETIV, 1), op(JMPIF, 1, sBx=4), op(GETIV, 2), op(GETIV, 2), op(MOVE, 1, 2), op(STOP)]
+    assert regions(codes) == { 1: ("or", 4, [(2, 5)]) }
+
+def test_ifElse():
+    codes = [op(GETIV, 1), op(JMPNOT, 1, sBx=3), op(LOADI, 2), op(JMP, sBx=2), op(LOADI, 2), op(STOP)]
+    assert regions(codes) == { 1: ("ifElse", 4, [(2, 3), (4, 5)]) }
+
+@pytest.mark.parametrize("jump, kind", [(JMPIF, "while"), (JMPNOT, "until")])
+def test_whileUntil(jump: int, kind: str):
+    # body: @x = 1, condition: @a
+    codes = [op(JMP, sBx=3), op(LOADI, 2), op(SETIV, 2), op(GETIV, 1), op(jump, 1, sBx=-3), op(STOP)]
+    assert regions(codes) == { 0: (kind, 4, [(3, 4), (1, 3)]) }
+
+def test_loopConditionWithoutValue():
+    # the last condition instruction doesn't write the tested register
+    codes = [op(JMP, sBx=3), op(LOADI, 2), op(SETIV, 2), op(GETIV, 2), op(JMPIF, 1, sBx=-3), op(STOP)]
+    assert regions(codes)[0][0] == "fallback"
+
+def test_breakNextAndSkip():
+    # a section of a loop body: a jump past its end is a break, a jump backwards a next
+    body = feed([op(GETIV, 1), op(JMP, sBx=3), op(LOADI, 2), op(JMP, sBx=-3)])
+    assert classifyJump(body, 1, None, True).kind == "break"
+    assert classifyJump(body, 3, None, True).kind == "next"
+    # outside of a loop, a jump over unreachable instructions to the end is skipped
+    assert classifyJump(body, 1, None, False).kind == "skip"
+
+COMPILED = {
+    "x = foo && bar\nputs x": "x = foo() && bar()\nputs(x)",
+    "x = foo || bar\nputs x": "x = foo() || bar()\nputs(x)",
+    "x = foo && bar || baz\nputs x": "x = foo() && bar() || baz()\nputs(x)",
+    "x = foo || (bar; baz)\nputs x": "x = foo() || (bar(); baz())\nputs(x)",
+    "x = foo && (bar; baz)\nputs x": "x = foo() && (bar(); baz())\nputs(x)",
+    "if foo\n  puts 1\nelse\n  puts 2\nend": "if foo()\n\tputs(1)\nelse\n\tputs(2)\nend",
+    "unless foo\n  puts 1\nend\nputs 3": "unless foo()\n\tputs(1)\nend\nputs(3)",
+    "foo && @x = 1\nputs 2": "if foo()\n\t@x = 1\nend\nputs(2)",
+    "i = 0\nwhile i < 10\n  i += 1\nend": "i = 0\nwhile i < 10\n\ti = i + 1\nend\nnil",
+    "i = 0\nuntil i > 10\n  i += 1\nend": "i = 0\nuntil i > 10\n\ti = i + 1\nend\nnil",
+    "i = 0\nwhile true\n  break if i > 3\n  i += 1\nend": "i = 0\nwhile true\n\tif i > 3\n\t\tbreak\n\tend\n\ti = i + 1\nend\nnil",
+}
+
+@needsMrbc
+@pytest.mark.parametrize("source, expected", COMPILED.items(), ids=range(len(COMPILED)))
+def test_compiled(source: str, expected: str):
+    data = compileSource(source)
+    output = mrbToRb(RiteFile(io.BytesIO(data))).toStr()
+    assert output.replace("# STOP", "").strip() == expected
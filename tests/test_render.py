@@ -0,0 +1,107 @@
+"""
+Rendering of expressions nested deeper than MAX_RECURSIVE_DEPTH (see render() in mrbToRb/rbExpressions.py) gives the
+same text as plain recursion, and the strings it keeps while rendering don't outlive the render.
+"""
+from __future__ import annotations
+import os
+import sys
+import threading
+from typing import Callable, List
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "benchmarks"))
+
+import mrbToRb.rbExpressions as rbExpressions
+from compiler import compileSource, getMrbcPath
+from decompiler import decompileToCodeGen
+from mrbToRb.rbExpressions import ArrayEx, Expression, LiteralEx, render, subExpressions
+from workloads import NESTING_WORKLOADS
+
+needsMrbc = pytest.mark.skipif(not os.path.exists(getMrbcPath()), reason="mrbc isn't available")
+
+DEPTH = 3 * rbExpressions.MAX_RECURSIVE_DEPTH
+
+def renderRecursively(render: Callable[[], str]) -> str:
+    """render() with every level rendered by str() recursion, on a thread with a stack that is large enough"""
+    result: List[str] = []
+    errors: List[BaseException] = []
+
+    def run():
+        recursionLimit = sys.getrecursionlimit()
+        sys.setrecursionlimit(100000)
+        try:
+            result.append(render())
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            sys.setrecursionlimit(recursionLimit)
+
+    stackSize = threading.stack_size(512 * 1024 * 1024)
+    try:
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+    finally:
+        threading.stack_size(stackSize)
+    if errors:
+        raise errors[0]
+    return result[0]
+
+def nestedArrays(depth: int) -> ArrayEx:
+    exp: Expression = LiteralEx(0, 1)
+    for _ in range(depth):
+        exp = ArrayEx(0, [exp])
+    return exp
+
+def allExpressions(root: Expression) -> List[Expression]:
+    found = []
+    stack = [root]
+    while stack:
+        exp = stack.pop()
+        found.append(exp)
+        stack.extend(subExpressions(exp))
+    return found
+
+@needsMrbc
+@pytest.mark.parametrize("name", NESTING_WORKLOADS.keys())
+def test_sameAsRecursion(name: str, monkeypatch):
+    codeGen = decompileToCodeGen(compileSource(NESTING_WORKLOADS[name](DEPTH)))
+    iterations = []
+    renderIteratively = rbExpressions.renderIteratively
+    def countedRenderIteratively(root: Expression) -> str:
+        iterations.append(root)
+        return renderIteratively(root)
+    monkeypatch.setattr(rbExpressions, "renderIteratively", countedRenderIteratively)
+    text = codeGen.toStr()
+    # the levels past MAX_RECURSIVE_DEPTH went to renderIteratively()
+    assert len(iterations) > 0
+
+    monkeypatch.setattr(rbExpressions, "MAX_RECURSIVE_DEPTH", 10 * DEPTH)
+    assert renderRecursively(codeGen.toStr) == text
+
+def test_nestedArrays():
+    assert render(nestedArrays(DEPTH)) == "[ " * DEPTH + "1" + " ]" * DEPTH
+
+def test_noStaleTextAfterMutation(monkeypatch):
+    root = nestedArrays(DEPTH)
+    render(root)
+    assert all(exp.rendered is None for exp in allExpressions(root))
+
+    # the innermost literal, below the levels that str() renders recursively, and an array in the middle
+    inner = root
+    for _ in range(DEPTH):
+        inner = inner.elements[0]
+    inner.value = 2
+    middle = root
+    for _ in range(DEPTH // 2):
+        middle = middle.elements[0]
+    middle.elements.append(LiteralEx(0, 3))
+
+    text = render(root)
+    assert "1" not in text
+    assert text.count("2") == 1 and text.count("3") == 1
+    monkeypatch.setattr(rbExpressions, "MAX_RECURSIVE_DEPTH", 10 * DEPTH)
+    assert renderRecursively(lambda: str(root)) == text
@@ -0,0 +1,58 @@
+"""
+Fused calls (see mrbToRb/superinstructions.py) have to decompile to the same output as stepping through every
+instruction, on the examples, the benchmark workloads and calls whose argument registers are read again later.
+"""
+from __future__ import annotations
+import glob
+import os
+import sys
+from typing import Tuple
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "benchmarks"))
+
+from compiler import compileSource, getMrbcPath
+from decompiler import decompileBytes
+from mrbToRb.superinstructions import superinstructionsEnabled
+from workloads import WORKLOADS
+
+needsMrbc = pytest.mark.skipif(not os.path.exists(getMrbcPath()), reason="mrbc isn't available")
+
+def decompileBoth(data: bytes) -> Tuple[str, str]:
+    """(stepwise, fused) outputs"""
+    outputs = []
+    for enabled in [False, True]:
+        token = superinstructionsEnabled.set(enabled)
+        try:
+            outputs.append(decompileBytes(data))
+        finally:
+            superinstructionsEnabled.reset(token)
+    return outputs[0], outputs[1]
+
+@pytest.mark.parametrize("file", sorted(glob.glob(os.path.join(ROOT, "examples", "*.mrb"))), ids=os.path.basename)
+def test_examples(file: str):
+    with open(file, "rb") as f:
+        stepwise, fused = decompileBoth(f.read())
+    assert fused == stepwise
+
+@needsMrbc
+@pytest.mark.parametrize("name", WORKLOADS.keys())
+def test_workloads(name: str):
+    stepwise, fused = decompileBoth(compileSource(WORKLOADS[name](20)))
+    assert fused == stepwise
+
+@needsMrbc
+def test_splatAfterCall():
+    # the splat call reads the registers that the fused call before it loaded its arguments into
+    source = "\n".join([
+        "x = 5",
+        "foo(x, $glob, @iv, A, :s, \"str\", nil, true, false, 1.5, 100000)",
+        "z = [1, 2, 3]",
+        "foo(*z)",
+        "foo(1, *z)",
+    ])
+    stepwise, fused = decompileBoth(compileSource(source))
+    assert fused == stepwise
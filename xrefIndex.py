@@ -0,0 +1,286 @@
+"""
+Persistent cross-reference index of a corpus in a SQLite database.
+
+Stores all class, module, method and block definitions and all references (method calls, constant, global,
+instance and class variable gets and sets) of every file, together with the method or class they are in
+(see structureScanner.py). Re-indexing only parses files whose content hash changed.
+
+python xrefIndex.py index <searchDir> [--db xref.db]    # every command takes --db, before or after the command
+python xrefIndex.py defs <name>                 # who defines name (method name, Class#method, Module::Class, ...)
+python xrefIndex.py calls <name>                # who calls name
+python xrefIndex.py const <name> [--set|--get]  # who reads/writes constant name
+python xrefIndex.py refs <name> [--kind ivarSet]
+python xrefIndex.py from <owner>                # everything referenced inside of a method or class
+
+Names can contain * and ? wildcards.
+"""
+from __future__ import annotations
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Tuple
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+from corpusAnalyzer import CHUNK_SIZE, chunks, findFiles
+from mrbParser import readRawIreps
+from structureScanner import FileStructure, REFERENCE_KINDS
+
+DEFAULT_DB = "xref.db"
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    hash TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS definitions (
+    fileId INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    qualifiedName TEXT NOT NULL,
+    superclass TEXT,
+    irepPath TEXT NOT NULL,
+    pc INTEGER NOT NULL,
+    bodyPath TEXT
+);
+CREATE TABLE IF NOT EXISTS refs (
+    fileId INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    irepPath TEXT NOT NULL,
+    pc INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS definitionsName ON definitions (name);
+CREATE INDEX IF NOT EXISTS definitionsQualifiedName ON definitions (qualifiedName);
+CREATE INDEX IF NOT EXISTS definitionsFile ON definitions (fileId);
+CREATE INDEX IF NOT EXISTS refsName ON refs (name, kind);
+CREATE INDEX IF NOT EXISTS refsOwner ON refs (owner);
+CREATE INDEX IF NOT EXISTS refsFile ON refs (fileId);
+"""
+REFERENCE_KIND_NAMES = sorted(set(REFERENCE_KINDS.values()))
+
+# (kind, name, qualifiedName, superclass, irepPath, pc, bodyPath)
+DefinitionRow = Tuple[str, str, str, str|None, str, int, str|None]
+# (kind, name, owner, irepPath, pc)
+ReferenceRow = Tuple[str, str, str, str, int]
+# (relPath, hash, size, mtime, definitions, references, error), definitions and references are None for unchanged files
+IndexedFile = Tuple[str, str, int, float, List[DefinitionRow]|None, List[ReferenceRow]|None, str|None]
+
+def scanFile(data: bytes) -> Tuple[List[DefinitionRow], List[ReferenceRow]]:
+    structure = FileStructure(readRawIreps(data))
+    definitions = [(d.kind, d.name, d.qualifiedName, d.superclass, d.irepPath, d.pc, d.bodyPath) for d in structure.definitions]
+    references = [(r.kind, r.name, r.owner, r.irepPath, r.pc) for r in structure.references]
+    return definitions, references
+
+def indexFile(file: str, relPath: str, knownHash: str|None) -> IndexedFile:
+    stat = os.stat(file)
+    with open(file, "rb") as f:
+        data = f.read()
+    hash = hashlib.sha1(data).hexdigest()
+    if hash == knownHash:
+        return relPath, hash, stat.st_size, stat.st_mtime, None, None, None
+    try:
+        definitions, references = scanFile(data)
+        return relPath, hash, stat.st_size, stat.st_mtime, definitions, references, None
+    except Exception as e:
+        return relPath, hash, stat.st_size, stat.st_mtime, [], [], f"{type(e).__name__}: {e}"
+
+def indexChunk(jobs: List[Tuple[str, str, str|None]]) -> List[IndexedFile]:
+    return [indexFile(file, relPath, knownHash) for file, relPath, knownHash in jobs]
+
+def toGlob(pattern: str) -> Tuple[str, str]:
+    """SQL operator and value for a name that may contain wildcards"""
+    if "*" in pattern or "?" in pattern:
+        return "GLOB", pattern
+    return "=", pattern
+
+class IndexStats:
+    added: int
+    updated: int
+    unchanged: int
+    removed: int
+    errors: List[Tuple[str, str]]
+
+    def __init__(self) -> None:
+        self.added = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.removed = 0
+        self.errors = []
+
+    def __str__(self) -> str:
+        return f"{self.added} added, {self.updated} updated, {self.unchanged} unchanged, {self.removed} removed, {len(self.errors)} errors"
+
+class XrefIndex:
+    db: sqlite3.Connection
+
+    def __init__(self, dbPath: str) -> None:
+        self.db = sqlite3.connect(dbPath)
+        self.db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.db.close()
+
+    def getMeta(self, key: str) -> str|None:
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def update(self, searchDir: str, extensions: List[str], workers: int = 0) -> IndexStats:
+        """Indexes all new and changed files of searchDir and removes deleted files"""
+        root = os.path.abspath(searchDir)
+        indexedRoot = self.getMeta("root")
+        if indexedRoot is not None and indexedRoot != root:
+            raise Exception(f"Index was built for {indexedRoot}, not {root}")
+        stats = IndexStats()
+        known: Dict[str, Tuple[int, str, int, float]] = {
+            path: (fileId, hash, size, mtime)
+            for fileId, path, hash, size, mtime in self.db.execute("SELECT id, path, hash, size, mtime FROM files")
+        }
+
+        jobs = []
+        found = set()
+        for file in findFiles(searchDir, extensions):
+            relPath = os.path.relpath(file, searchDir).replace("\\", "/")
+            found.add(relPath)
+            entry = known.get(relPath)
+            if entry is not None:
+                stat = os.stat(file)
+                # same size and modification time -> skip without reading
+                if entry[2] == stat.st_size and entry[3] == stat.st_mtime:
+                    stats.unchanged += 1
+                    continue
+            jobs.append((file, relPath, entry[1] if entry else None))
+
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('root', ?)", (root,))
+            for relPath, (fileId, _, _, _) in known.items():
+                if relPath not in found:
+                    self._deleteFile(fileId)
+                    stats.removed += 1
+            for relPath, hash, size, mtime, definitions, references, error in self._indexJobs(jobs, workers):
+                entry = known.get(relPath)
+                if definitions is None:
+                    self.db.execute("UPDATE files SET size = ?, mtime = ? WHERE id = ?", (size, mtime, entry[0]))
+                    stats.unchanged += 1
+                    continue
+                if entry is not None:
+                    self._deleteFile(entry[0])
+                    stats.updated += 1
+                else:
+                    stats.added += 1
+                if error is not None:
+                    stats.errors.append((relPath, error))
+                fileId = self.db.execute("INSERT INTO files (path, hash, size, mtime, error) VALUES (?, ?, ?, ?, ?)",
+                                         (relPath, hash, size, mtime, error)).lastrowid
+                self.db.executemany("INSERT INTO definitions VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [(fileId, *row) for row in definitions])
+                self.db.executemany("INSERT INTO refs VALUES (?, ?, ?, ?, ?, ?)", [(fileId, *row) for row in references])
+        return stats
+
+    def _indexJobs(self, jobs: List[Tuple[str, str, str|None]], workers: int) -> Iterator[IndexedFile]:
+        if workers > 0 and len(jobs) > CHUNK_SIZE:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for results in executor.map(indexChunk, chunks(jobs, CHUNK_SIZE)):
+                    yield from results
+        else:
+            yield from indexChunk(jobs)
+
+    def _deleteFile(self, fileId: int) -> None:
+        self.db.execute("DELETE FROM definitions WHERE fileId = ?", (fileId,))
+        self.db.execute("DELETE FROM refs WHERE fileId = ?", (fileId,))
+        self.db.execute("DELETE FROM files WHERE id = ?", (fileId,))
+
+    def definitions(self, name: str, kinds: List[str]|None = None) -> List[Tuple]:
+        """(path, irepPath, pc, kind, qualifiedName, superclass) of all definitions with a matching name or qualified name"""
+        op, value = toGlob(name)
+        query = f"""SELECT files.path, d.irepPath, d.pc, d.kind, d.qualifiedName, d.superclass FROM definitions d
+            JOIN files ON files.id = d.fileId WHERE (d.name {op} ? OR d.qualifiedName {op} ?)"""
+        params = [value, value]
+        if kinds:
+            query += f" AND d.kind IN ({', '.join('?' * len(kinds))})"
+            params.extend(kinds)
+        return self.db.execute(query + " ORDER BY files.path, d.irepPath, d.pc", params).fetchall()
+
+    def references(self, name: str, kinds: List[str]|None = None) -> List[Tuple]:
+        """(path, irepPath, pc, kind, name, owner) of all references to a name"""
+        op, value = toGlob(name)
+        query = f"""SELECT files.path, r.irepPath, r.pc, r.kind, r.name, r.owner FROM refs r
+            JOIN files ON files.id = r.fileId WHERE r.name {op} ?"""
+        params = [value]
+        if kinds:
+            query += f" AND r.kind IN ({', '.join('?' * len(kinds))})"
+            params.extend(kinds)
+        return self.db.execute(query + " ORDER BY files.path, r.irepPath, r.pc", params).fetchall()
+
+    def referencesFrom(self, owner: str) -> List[Tuple]:
+        """(path, irepPath, pc, kind, name, owner) of all references inside of a method or class"""
+        op, value = toGlob(owner)
+        return self.db.execute(f"""SELECT files.path, r.irepPath, r.pc, r.kind, r.name, r.owner FROM refs r
+            JOIN files ON files.id = r.fileId WHERE r.owner {op} ? ORDER BY files.path, r.irepPath, r.pc""", (value,)).fetchall()
+
+def printRows(rows: List[Tuple], t1: float):
+    for path, irepPath, pc, kind, name, extra in rows:
+        print(f"{path}:{irepPath}:{pc}  {kind:<10} {name}{f'  ({extra})' if extra else ''}")
+    print(f"{len(rows)} results in {(time.perf_counter() - t1)*1000:.1f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Cross-reference index of classes, methods, call sites and variables")
+    parser.add_argument("--db", default=DEFAULT_DB)
+    # --db also works after the command, SUPPRESS keeps the subcommand from overwriting a --db before it with the default
+    dbParser = argparse.ArgumentParser(add_help=False)
+    dbParser.add_argument("--db", default=argparse.SUPPRESS, help=f"index database (default {DEFAULT_DB})")
+    commands = parser.add_subparsers(dest="command", required=True)
+    indexParser = commands.add_parser("index", help="create or update the index", parents=[dbParser])
+    indexParser.add_argument("searchDir")
+    indexParser.add_argument("--ext", default="_scp.bin,.mrb", help="comma separated file endings")
+    indexParser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    defsParser = commands.add_parser("defs", help="definitions of a class, module or method", parents=[dbParser])
+    defsParser.add_argument("name")
+    defsParser.add_argument("--kind", action="append", choices=["class", "module", "sclass", "method", "block"])
+    callsParser = commands.add_parser("calls", help="call sites of a method", parents=[dbParser])
+    callsParser.add_argument("name")
+    constParser = commands.add_parser("const", help="reads and writes of a constant", parents=[dbParser])
+    constParser.add_argument("name")
+    constGroup = constParser.add_mutually_exclusive_group()
+    constGroup.add_argument("--get", action="store_true")
+    constGroup.add_argument("--set", action="store_true")
+    refsParser = commands.add_parser("refs", help="all references to a name", parents=[dbParser])
+    refsParser.add_argument("name")
+    refsParser.add_argument("--kind", action="append", choices=REFERENCE_KIND_NAMES)
+    fromParser = commands.add_parser("from", help="everything referenced inside of a method or class", parents=[dbParser])
+    fromParser.add_argument("owner")
+    args = parser.parse_args()
+
+    index = XrefIndex(args.db)
+    try:
+        t1 = time.perf_counter()
+        if args.command == "index":
+            stats = index.update(args.searchDir, args.ext.split(","), args.workers if args.workers > 1 else 0)
+            for file, error in stats.errors:
+                print(f"Error in {file}: {error}")
+            print(f"{stats} in {time.perf_counter() - t1:.2f}s")
+        elif args.command == "defs":
+            rows = index.definitions(args.name, args.kind)
+            printRows([(path, irepPath, pc, kind, name, f"< {superclass}" if superclass else None) for path, irepPath, pc, kind, name, superclass in rows], t1)
+        elif args.command == "calls":
+            printRows(index.references(args.name, ["call"]), t1)
+        elif args.command == "const":
+            kinds = ["constGet"] if args.get else ["constSet"] if args.set else ["constGet", "constSet"]
+            printRows(index.references(args.name, kinds), t1)
+        elif args.command == "refs":
+            printRows(index.references(args.name, args.kind), t1)
+        elif args.command == "from":
+            printRows(index.referencesFrom(args.owner), t1)
+    finally:
+        index.close()
+
+if __name__ == "__main__":
+    main()